@@ -1,2 +1,3 @@
 from .utils import *
-from .data_classes import *
\ No newline at end of file
+from .data_classes import *
+from .instrumentacao import *
@@ -0,0 +1,331 @@
+import os
+import io
+import sys
+import json
+import time
+import platform
+import tempfile
+import contextlib
+import subprocess
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import psutil
+
+from .data_classes import MegaDesdobrador, DataFrameDiagnostics
+from .utils import carregar_arquivo, salvar_arquivo
+from .instrumentacao import INSTRUMENTACAO, _PicoMemoria
+
+# Casos medidos; as etapas de cada um vêm dos eventos da instrumentação padrão
+CASOS = ["desdobrar_classico", "desdobrar_complexo", "carregar_arquivo", "salvar_arquivo", "diagnosticar_merge"]
+UFS = ["AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA", "PB", "PE", "PI",
+       "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO"]
+ARQUIVO_HISTORICO = "benchmark_historico.json"
+
+
+def gerar_dados(
+    linhas: int = 100_000,
+    n_itens: int | None = None,
+    n_cidades: int = 50,
+    meses_historico: int = 6,
+    meses_demanda: int = 3,
+    taxa_sem_par: float = 0.02,
+    taxa_negativos: float = 0.01,
+    semente: int = 0
+) -> dict:
+    """
+
+    Gera tabelas sintéticas (sempre as mesmas para a mesma semente) no formato usado pelo
+    MegaDesdobrador: historico/destino com ``linhas`` linhas e demanda/origem/lote menores
+
+    :param linhas: Linhas do histórico e do destino (1e5 a 1e8); a demanda tem 1/10 disso
+    :type linhas: int
+    :param n_itens: Quantidade de Itens distintos (cardinalidade da chave). Se None usa linhas / 100
+    :type n_itens: int | None
+    :param n_cidades: Quantidade de Cidades distintas (detalhamento)
+    :type n_cidades: int
+    :param meses_historico: Meses distintos no histórico
+    :type meses_historico: int
+    :param meses_demanda: Meses distintos na demanda
+    :type meses_demanda: int
+    :param taxa_sem_par: Fração da demanda/origem com Item que não existe no histórico (e de Itens
+    sem lote)
+    :type taxa_sem_par: float
+    :param taxa_negativos: Fração de valores negativos no histórico/destino
+    :type taxa_negativos: float
+    :param semente: Semente do gerador
+    :type semente: int
+    :return: Dict com os DataFrames "demanda", "historico", "lote", "origem" e "destino"
+    :rtype: dict
+
+    """
+
+    rng = np.random.default_rng(semente)
+    linhas = int(linhas)
+    n_itens = int(n_itens or max(100, linhas // 100))
+    itens = np.array([f"SKU{i:07d}" for i in range(n_itens)], dtype=object)
+    cidades = np.array([f"CID{i:05d}" for i in range(n_cidades)], dtype=object)
+    ufs = np.array(UFS, dtype=object)
+    meses = pd.period_range("2025-01", periods=meses_historico + meses_demanda, freq="M").strftime("%Y-%m").to_numpy(dtype=object)
+
+    def valores(n, maximo):
+        v = rng.integers(0, maximo, n).astype(np.float64)
+        negativos = rng.random(n) < taxa_negativos
+        v[negativos] = -v[negativos]
+        return v
+
+    historico = pd.DataFrame({
+        "UF": ufs[rng.integers(0, len(ufs), linhas)],
+        "Item": itens[rng.integers(0, n_itens, linhas)],
+        "Cidade": cidades[rng.integers(0, n_cidades, linhas)],
+        "AnoMes": meses[rng.integers(0, meses_historico, linhas)],
+        "Qtd": valores(linhas, 300),
+    })
+
+    # Demanda: combinações únicas de UF x Item x AnoMes futuro, parte com Itens sem histórico
+    n_demanda = max(1_000, linhas // 10)
+    combinacoes = len(ufs) * n_itens * meses_demanda
+    codigo = rng.choice(combinacoes, size=min(n_demanda, combinacoes), replace=False)
+    uf, resto = np.divmod(codigo, n_itens * meses_demanda)
+    item, mes = np.divmod(resto, meses_demanda)
+    item_demanda = itens[item]
+    sem_par = rng.random(len(codigo)) < taxa_sem_par
+    item_demanda[sem_par] = np.char.add("SEMPAR", item[sem_par].astype(str)).astype(object)
+    demanda = pd.DataFrame({
+        "UF": ufs[uf], "Item": item_demanda, "AnoMes": meses[meses_historico + mes],
+        "Qtd": rng.integers(1, 500, len(codigo)).astype(np.float64),
+    })
+
+    com_lote = rng.random(n_itens) >= taxa_sem_par
+    lote = pd.DataFrame({"Item": itens[com_lote], "Lote_Multiplo": rng.integers(1, 40, int(com_lote.sum()))})
+
+    # Clássico: origem em UF x Item (um mês da demanda) aberta no destino por Cidade
+    origem = demanda[demanda["AnoMes"] == meses[meses_historico]][["UF", "Item", "Qtd"]].reset_index(drop=True)
+    destino = historico[["UF", "Item", "Cidade", "Qtd"]]
+    return {"demanda": demanda, "historico": historico[["UF", "Item", "Cidade", "Qtd"]], "lote": lote,
+            "origem": origem, "destino": destino}
+
+
+def executar_benchmark(
+    casos: list | None = None,
+    engines: tuple = ("pandas", "polars"),
+    escalas: tuple = (100_000,),
+    historico: str | None = ARQUIVO_HISTORICO,
+    repeticoes: int = 1,
+    tolerancia: float = 0.10,
+    isolar: bool = True,
+    **parametros_dados
+) -> pd.DataFrame:
+    """
+
+    Mede os casos em cada engine e escala, grava a execução no histórico json e marca as
+    regressões em relação à execução anterior
+
+    :param casos: Casos a medir (padrão todos): desdobrar_classico, desdobrar_complexo,
+    carregar_arquivo, salvar_arquivo e diagnosticar_merge
+    :type casos: list | None
+    :param engines: Engines a medir ("pandas", "polars")
+    :type engines: tuple
+    :param escalas: Linhas do histórico/destino em cada medição
+    :type escalas: tuple
+    :param historico: Arquivo json com as execuções anteriores (None não grava nem compara)
+    :type historico: str | None
+    :param repeticoes: Repetições de cada medição, fica a de menor tempo
+    :type repeticoes: int
+    :param tolerancia: Aumento relativo de tempo ou de memória considerado regressão
+    :type tolerancia: float
+    :param isolar: Se True cada medição roda num processo novo (pico de memória só do caso)
+    :type isolar: bool
+    :param parametros_dados: Parâmetros do gerar_dados (n_itens, taxa_sem_par, taxa_negativos...)
+    :return: DataFrame com uma linha por caso/engine/escala, tempos, memória e regressões
+    :rtype: pd.DataFrame
+
+    """
+
+    casos = list(casos or CASOS)
+    for caso in casos:
+        if caso not in CASOS:
+            raise ValueError(f"Caso '{caso}' não suportado.")
+    resultados = []
+    for linhas in escalas:
+        for caso in casos:
+            for engine in engines:
+                medidas = [_medir(caso, engine, int(linhas), parametros_dados, isolar) for _ in range(repeticoes)]
+                melhor = min(medidas, key=lambda m: m["tempo_s"])
+                melhor["pico_rss_mb"] = max(m["pico_rss_mb"] for m in medidas)
+                resultados.append(melhor)
+                print(f"{caso:20} {engine:7} {int(linhas):>12,} linhas: {melhor['tempo_s']:8.2f}s  "
+                      f"pico {melhor['pico_rss_mb']:9.1f} MB")
+
+    execucao = {
+        "data": datetime.now().isoformat(timespec="seconds"), "versao": _versao(),
+        "python": platform.python_version(), "maquina": platform.platform(), "cpus": os.cpu_count(),
+        "parametros_dados": parametros_dados, "resultados": resultados,
+    }
+    anteriores = carregar_historico(historico) if historico else []
+    if historico:
+        with open(historico, "w", encoding="utf-8") as f:
+            json.dump(anteriores + [execucao], f, ensure_ascii=False, indent=1)
+        print(f"Histórico salvo em {os.path.abspath(historico)}")
+
+    comparacao = comparar_execucoes(anteriores, execucao, tolerancia)
+    regressoes = comparacao[comparacao["regressao"]]
+    if not regressoes.empty:
+        print(f"⚠️ {len(regressoes)} regressão(ões) acima de {tolerancia:.0%}:")
+        print(regressoes[["caso", "engine", "linhas", "tempo_s", "tempo_anterior_s", "pico_rss_mb", "pico_anterior_mb"]].to_string(index=False))
+    return comparacao
+
+
+def carregar_historico(arquivo: str = ARQUIVO_HISTORICO) -> list:
+    """Lista de execuções gravadas pelo executar_benchmark (vazia se o arquivo não existir)."""
+    if not os.path.exists(arquivo):
+        return []
+    with open(arquivo, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def comparar_execucoes(anteriores: list, execucao: dict, tolerancia: float = 0.10, minimo_s: float = 0.05) -> pd.DataFrame:
+    """
+
+    Compara cada medição com a última execução anterior que mediu o mesmo caso/engine/escala
+
+    :param anteriores: Execuções anteriores (carregar_historico)
+    :type anteriores: list
+    :param execucao: Execução a comparar
+    :type execucao: dict
+    :param tolerancia: Aumento relativo de tempo ou de pico de memória considerado regressão
+    :type tolerancia: float
+    :param minimo_s: Diferença de tempo mínima (segundos) para contar como regressão, evita ruído
+    em medições muito curtas
+    :type minimo_s: float
+    :return: DataFrame das medições com tempo/pico anteriores, variações e a coluna "regressao"
+    :rtype: pd.DataFrame
+
+    """
+
+    chave = lambda r: (r["caso"], r["engine"], r["linhas"])
+    referencia = {}
+    for anterior in anteriores:
+        for r in anterior["resultados"]:
+            referencia[chave(r)] = r
+    linhas = []
+    for r in execucao["resultados"]:
+        ref = referencia.get(chave(r))
+        tempo_ant = ref["tempo_s"] if ref else np.nan
+        pico_ant = ref["pico_rss_mb"] if ref else np.nan
+        linhas.append({
+            "caso": r["caso"], "engine": r["engine"], "linhas": r["linhas"],
+            "tempo_s": r["tempo_s"], "tempo_anterior_s": tempo_ant,
+            "variacao_tempo": r["tempo_s"] / tempo_ant - 1 if ref else np.nan,
+            "pico_rss_mb": r["pico_rss_mb"], "pico_anterior_mb": pico_ant,
+            "variacao_pico": r["pico_rss_mb"] / pico_ant - 1 if ref else np.nan,
+            "regressao": bool(ref) and (
+                (r["tempo_s"] > tempo_ant * (1 + tolerancia) and r["tempo_s"] - tempo_ant > minimo_s)
+                or r["pico_rss_mb"] > pico_ant * (1 + tolerancia)
+            ),
+            "etapas": r["etapas"],
+        })
+    return pd.DataFrame(linhas, columns=[
+        "caso", "engine", "linhas", "tempo_s", "tempo_anterior_s", "variacao_tempo",
+        "pico_rss_mb", "pico_anterior_mb", "variacao_pico", "regressao", "etapas",
+    ])
+
+
+def _medir(caso, engine, linhas, parametros_dados, isolar):
+    if not isolar:
+        return _executar_caso(caso, engine, linhas, parametros_dados)
+    # Processo novo por medição: o pico de memória não herda o que casos anteriores alocaram
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_executar_caso, caso, engine, linhas, parametros_dados).result()
+
+
+def _executar_caso(caso, engine, linhas, parametros_dados):
+    inicio = time.perf_counter()
+    dados = gerar_dados(linhas, **parametros_dados)
+    tempo_dados = time.perf_counter() - inicio
+    with tempfile.TemporaryDirectory() as pasta, contextlib.redirect_stdout(io.StringIO()):
+        executar = _preparar_caso(caso, engine, dados, pasta)
+        rss_base = psutil.Process().memory_info().rss
+        with _Etapas() as etapas, _PicoMemoria() as pico:
+            inicio = time.perf_counter()
+            linhas_saida = executar()
+            tempo = time.perf_counter() - inicio
+    return {
+        "caso": caso, "engine": engine, "linhas": linhas, "tempo_s": tempo, "tempo_dados_s": tempo_dados,
+        "etapas": etapas.tempos, "rss_base_mb": rss_base / 2**20, "pico_rss_mb": pico.maximo / 2**20,
+        "linhas_saida": linhas_saida,
+    }
+
+
+def _preparar_caso(caso, engine, dados, pasta):
+    """Prepara o que não é medido (ex.: o csv do carregar_arquivo) e retorna a função medida."""
+    match caso:
+        case "desdobrar_classico":
+            return lambda: len(MegaDesdobrador().desdobrar_classico(
+                dados["origem"], dados["destino"], ["UF", "Item"], ["UF", "Item", "Cidade"], "Qtd", engine=engine)[0])
+        case "desdobrar_complexo":
+            return lambda: len(MegaDesdobrador().desdobrar_complexo(
+                dados["demanda"], dados["historico"], dados["lote"], ["UF", "Item"], ["Cidade"], "Qtd", engine=engine)[0])
+        case "carregar_arquivo":
+            arquivo = salvar_arquivo(dados["historico"], "historico", pasta, engine="polars", levantar_erros=True)
+            return lambda: len(carregar_arquivo(arquivo, engine=engine, limpar=True))
+        case "salvar_arquivo":
+            return lambda: salvar_arquivo(dados["historico"], "historico", pasta, engine=engine, levantar_erros=True) and len(dados["historico"])
+        case "diagnosticar_merge":
+            return lambda: len(DataFrameDiagnostics().diagnosticar_merge(
+                dados["demanda"], dados["historico"], ["UF", "Item"], engine=engine, limite=100, exibir=False)["viloes"])
+
+
+class _Etapas:
+    """
+    Soma o tempo de cada etapa registrada pela instrumentação padrão durante o caso (pelo caminho
+    "processo/etapa", tempo acumulado, podem se sobrepor).
+    """
+
+    def __init__(self):
+        self.tempos = {}
+
+    def __enter__(self):
+        INSTRUMENTACAO.destinos.append(self._registrar)
+        return self
+
+    def __exit__(self, *args):
+        INSTRUMENTACAO.destinos.remove(self._registrar)
+
+    def _registrar(self, evento):
+        # Eventos pontuais (registrar, ex.: a auditoria) não são etapas medidas
+        if "thread" in evento:
+            self.tempos[evento["etapa"]] = self.tempos.get(evento["etapa"], 0.0) + evento["tempo_s"]
+
+
+def _versao():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark do MegaDesdobrador, carregar/salvar_arquivo e diagnosticar_merge.")
+    parser.add_argument("--casos", nargs="+", choices=CASOS, default=None)
+    parser.add_argument("--engines", nargs="+", choices=["pandas", "polars"], default=["pandas", "polars"])
+    parser.add_argument("--escalas", nargs="+", type=float, default=[1e5], help="Linhas do histórico, ex.: 1e5 1e6")
+    parser.add_argument("--historico", default=ARQUIVO_HISTORICO)
+    parser.add_argument("--repeticoes", type=int, default=1)
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    parser.add_argument("--n-itens", type=int, default=None)
+    parser.add_argument("--taxa-sem-par", type=float, default=0.02)
+    parser.add_argument("--taxa-negativos", type=float, default=0.01)
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args()
+    resultado = executar_benchmark(
+        args.casos, tuple(args.engines), tuple(int(e) for e in args.escalas), args.historico, args.repeticoes,
+        args.tolerancia, n_itens=args.n_itens, taxa_sem_par=args.taxa_sem_par, taxa_negativos=args.taxa_negativos,
+        semente=args.semente,
+    )
+    sys.exit(1 if resultado["regressao"].any() else 0)
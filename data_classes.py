@@ -1,106 +1,1457 @@
 import pandas as pd
+import polars as pl
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.compute as pc
 import time
 import os
+import json
+import math
+import shutil
+import tempfile
+import datetime
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from .utils import salvar_arquivo, aguardar_salvamentos
+from .instrumentacao import INSTRUMENTACAO, instrumentar
+
+
+def _tomar_linhas(df, idx, com_faltantes=False):
+    """
+    Seleciona linhas de ``df`` por posição (idx = -1 vira NaN), reproduzindo o mesmo upcast
+    de dtype que um merge left do pandas faria quando existem linhas sem par.
+    """
+    if com_faltantes:
+        return df.reset_index(drop=True).reindex(np.append(idx, -1)).iloc[:-1].reset_index(drop=True)
+    return df.take(idx).reset_index(drop=True)
+
+
+def _lazy_de_arrays(colunas, nome_indice):
+    """
+    Monta um LazyFrame (com índice posicional) a partir de arrays/Series numéricos, sem cópia
+    de strings. NaN vira nulo, como no pl.from_pandas.
+    """
+    series = [pl.Series(nome, np.asarray(valores), nan_to_null=True) for nome, valores in colunas.items()]
+    return pl.DataFrame(series).lazy().with_row_index(nome_indice)
+
+
+def _combinar_codigos(a, b):
+    """
+    Combina dois códigos inteiros num só (a * base + b), preservando a ordem lexicográfica
+    (a, b). Só recompacta ``a`` quando o produto se aproxima do limite do int64.
+    """
+    base = int(b.max()) + 1 if len(b) else 1
+    if len(a) and (int(a.max()) + 1) * base >= 2 ** 62:
+        a = pd.factorize(a, sort=True)[0].astype(np.int64)
+    return a * base + b
+
+
+def _codificar_chaves(frames, chaves, retornar_nulos=False):
+    """
+    Fatoriza uma chave composta (várias colunas) em um único código inteiro, consistente entre
+    todos os ``frames``: a mesma combinação de valores recebe o mesmo código em qualquer um deles.
+    Cada coluna é fatorizada uma vez só para todos os frames. Os códigos preservam a ordenação
+    das chaves (como o groupby) e NaN vira um valor comum (como no merge do pandas).
+
+    Retorna um array de códigos por frame e, com ``retornar_nulos``, também a máscara das linhas
+    com alguma chave nula (que o groupby do pandas descartaria).
+    """
+    total = sum(len(df) for df in frames)
+    codigo = np.zeros(total, dtype=np.int64)
+    nulo = np.zeros(total, dtype=bool)
+    for c in chaves:
+        valores = frames[0][c] if len(frames) == 1 else pd.concat([df[c] for df in frames], ignore_index=True)
+        cod_coluna, unicos = pd.factorize(valores, sort=True)
+        faltante = cod_coluna < 0
+        if faltante.any():
+            cod_coluna = np.where(faltante, len(unicos), cod_coluna)
+            nulo |= faltante
+        codigo = _combinar_codigos(codigo, cod_coluna.astype(np.int64))
+
+    divisoes = np.cumsum([len(df) for df in frames])[:-1]
+    if retornar_nulos:
+        return np.split(codigo, divisoes), np.split(nulo, divisoes)
+    return np.split(codigo, divisoes)
+
+
+def _montar_classico(df_origem, df_destino, chaves_origem, chaves_comuns, idx_destino, idx_origem, valor_desdobrado):
+    """Monta o df_ok do clássico a partir das posições, com as mesmas colunas/dtypes do merge."""
+    df_ok = _tomar_linhas(df_destino, idx_destino)
+    extras = [c for c in chaves_origem if c not in chaves_comuns]
+    if extras:
+        df_extras = _tomar_linhas(df_origem[extras], idx_origem, com_faltantes=bool((idx_origem < 0).any()))
+        df_extras.columns = [f"{c}_origem" if c in df_ok.columns else c for c in extras]
+        df_ok = pd.concat([df_ok, df_extras], axis=1)
+    df_ok["valor_desdobrado"] = valor_desdobrado
+    return df_ok
+
+
+def _montar_complexo(df_demanda, fonte_detalhe, chaves_detalhamento, posicao, idx_demanda, idx_hist, falta_hist,
+                     fator, desdobrado, lote_multiplo, final):
+    """Monta o df_ok do complexo a partir das posições, com as mesmas colunas/dtypes do merge."""
+    df_ok = _tomar_linhas(df_demanda, idx_demanda)
+    df_detalhe = _tomar_linhas(fonte_detalhe[chaves_detalhamento], idx_hist, com_faltantes=falta_hist)
+    df_ok = pd.concat([df_ok, df_detalhe], axis=1)
+    df_ok['fator'] = fator
+    df_ok['valor_desdobrado'] = desdobrado
+    df_ok['Lote_Multiplo'] = lote_multiplo
+    df_ok['valor_final'] = final
+    df_ok.index = np.asarray(posicao, dtype=np.int64)
+    return df_ok
+
+
+def _pivotar_largo(fontes, meses, valores, arquivo=None, linhas_por_bloco=500_000):
+    """
+    Formato largo (chaves x AnoMes, soma dos valores) igual ao pivot_table(...).reset_index(),
+    montado direto por posição: cada linha vira um código inteiro de grupo e de mês e os valores
+    somados preenchem uma matriz densa já dimensionada. Os rótulos das chaves só são lidos uma
+    vez por grupo, então o formato longo não precisa existir.
+
+    fontes: lista de (df, colunas, idx) com de onde vêm as chaves de cada linha (idx=None usa
+    todas as linhas de df); meses e valores: arrays alinhados às linhas.
+    arquivo: se informado (.parquet ou .csv) grava o resultado em blocos e retorna o caminho.
+    """
+    codigo, nulo = None, np.zeros(len(valores), dtype=bool)
+    for df, colunas, idx in fontes:
+        # Codifica só as linhas da fonte que aparecem no resultado
+        if idx is None:
+            (cod,), (nulo_fonte,) = _codificar_chaves([df], colunas, retornar_nulos=True)
+        else:
+            inverso, usadas = pd.factorize(idx)
+            (cod,), (nulo_fonte,) = _codificar_chaves([_tomar_linhas(df[colunas], usadas)], colunas, retornar_nulos=True)
+            cod, nulo_fonte = cod[inverso], nulo_fonte[inverso]
+        codigo = cod if codigo is None else _combinar_codigos(codigo, cod)
+        nulo |= nulo_fonte
+    cod_mes, rotulos_mes = pd.factorize(np.asarray(meses), sort=True)
+    linhas = np.flatnonzero(~nulo & (cod_mes >= 0))
+
+    # Grupos ordenados pelas chaves (mesma ordem do groupby) e soma por célula
+    grupo, grupos = pd.factorize(codigo[linhas], sort=True)
+    primeira = np.empty(len(grupos), dtype=np.int64)
+    primeira[grupo[::-1]] = linhas[::-1]
+    celula = grupo * len(rotulos_mes) + cod_mes[linhas]
+    valores = np.asarray(valores)[linhas]
+    matriz = np.full(len(grupos) * len(rotulos_mes), np.nan)
+    ocorrencias = np.bincount(celula, minlength=matriz.size)
+    if len(celula) and ocorrencias.max() > 1:
+        soma = pd.Series(valores).groupby(celula).sum()
+        matriz[soma.index.to_numpy()] = soma.to_numpy()
+    else:
+        matriz[celula] = valores
+    matriz = matriz.reshape(len(grupos), len(rotulos_mes))
+    if np.issubdtype(valores.dtype, np.integer) and (ocorrencias > 0).all():
+        matriz = matriz.astype(valores.dtype)
+
+    colunas_mes = pd.Index(rotulos_mes, name='AnoMes')
+
+    def bloco(inicio, fim):
+        partes = [pd.DataFrame({c: df[c].take(primeira[inicio:fim] if idx is None else idx[primeira[inicio:fim]]).array for c in colunas})
+                  for df, colunas, idx in fontes]
+        partes.append(pd.DataFrame(matriz[inicio:fim], columns=colunas_mes))
+        df_bloco = pd.concat(partes, axis=1)
+        df_bloco.columns.name = 'AnoMes'
+        return df_bloco
+
+    if arquivo is None:
+        return bloco(0, len(grupos))
+
+    os.makedirs(os.path.dirname(arquivo) or ".", exist_ok=True)
+    extensao = os.path.splitext(arquivo)[1].lower()
+    if extensao not in (".parquet", ".csv"):
+        raise ValueError(f"Extensão '{extensao}' não suportada para gravar o pivot em blocos.")
+    escritor = None
+    try:
+        for inicio in range(0, max(len(grupos), 1), linhas_por_bloco):
+            df_bloco = bloco(inicio, inicio + linhas_por_bloco)
+            df_bloco.columns = [str(c) for c in df_bloco.columns]
+            if extensao == ".csv":
+                df_bloco.to_csv(arquivo, mode="w" if inicio == 0 else "a", header=inicio == 0,
+                                sep=";", decimal=",", encoding="utf-8", index=False)
+                continue
+            tabela = pa.Table.from_pandas(df_bloco, schema=escritor.schema if escritor else None, preserve_index=False)
+            if escritor is None:
+                escritor = pq.ParquetWriter(arquivo, tabela.schema)
+            escritor.write_table(tabela)
+    finally:
+        if escritor is not None:
+            escritor.close()
+    return arquivo
+
+
+def _fonte_lazy(fonte):
+    """
+    Aceita DataFrame (pandas/polars), LazyFrame ou caminho(s) de arquivo .parquet/.csv/.arrow
+    (globs permitidos) e devolve um LazyFrame sem materializar os dados.
+    """
+    if isinstance(fonte, pl.LazyFrame):
+        return fonte
+    if isinstance(fonte, pl.DataFrame):
+        return fonte.lazy()
+    if isinstance(fonte, pd.DataFrame):
+        return pl.from_pandas(fonte).lazy()
+
+    caminhos = [str(fonte)] if isinstance(fonte, (str, os.PathLike)) else [str(c) for c in fonte]
+    extensao = os.path.splitext(caminhos[0])[1].lower()
+    match extensao:
+        case ".parquet":
+            return pl.scan_parquet(caminhos)
+        case ".csv":
+            return pl.scan_csv(caminhos, separator=";", decimal_comma=True)
+        case ".arrow" | ".ipc" | ".feather":
+            return pl.scan_ipc(caminhos)
+        case _:
+            raise ValueError(f"Extensão de arquivo '{extensao}' não suportada.")
+
+
+def _tamanho_fonte(fonte):
+    """Estimativa em bytes do tamanho de uma fonte, usada para definir o número de partições."""
+    if isinstance(fonte, pd.DataFrame):
+        return int(fonte.memory_usage(deep=True).sum())
+    if isinstance(fonte, pl.DataFrame):
+        return int(fonte.estimated_size())
+    if isinstance(fonte, pl.LazyFrame):
+        return 0
+    caminhos = [fonte] if isinstance(fonte, (str, os.PathLike)) else fonte
+    return sum(os.path.getsize(c) for c in caminhos if os.path.isfile(c))
+
+
+def _pertence(df, chaves, chaves_alvo):
+    """Máscara das linhas de ``df`` cuja chave composta aparece em ``chaves_alvo``."""
+    cod_df, cod_alvo = _codificar_chaves([df, chaves_alvo], chaves)
+    return np.isin(cod_df, cod_alvo)
+
+
+def _impressao_grupos(df, codigos):
+    """Fingerprint (soma dos hashes das linhas + quantidade) de cada grupo de ``codigos``."""
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return pd.DataFrame({"hash": hashes}).groupby(codigos).agg(hash=("hash", "sum"), linhas=("hash", "size"))
+
+
+def _cenarios_em_colunas(versoes, coluna_valor):
+    """
+    Alinha várias versões de demanda ({nome: DataFrame}) lado a lado, uma coluna por versão,
+    usando todas as colunas que não são ``coluna_valor`` como chave.
+    """
+    primeira = next(iter(versoes.values()))
+    chaves = [c for c in primeira.columns if c != coluna_valor]
+    colunas = {
+        nome: df.groupby(chaves, dropna=False, sort=False)[coluna_valor].sum(min_count=1)
+        for nome, df in versoes.items()
+    }
+    return pd.concat(colunas, axis=1).reset_index(), list(versoes)
+
+
+def _id_particao(df, chaves, n_particoes):
+    """Número da partição de cada linha pelo hash das chaves (numéricos viram float para 1 == 1.0)."""
+    valores = df[chaves].copy()
+    for c in chaves:
+        if pd.api.types.is_numeric_dtype(valores[c]) and not pd.api.types.is_bool_dtype(valores[c]):
+            valores[c] = valores[c].astype("float64")
+    return pd.util.hash_pandas_object(valores, index=False).to_numpy() % n_particoes
+
+
+# Colunas auxiliares do processamento paralelo: posição original das linhas e, no complexo,
+# posição da linha do df_ok dentro das linhas do merge da sua demanda
+_POSICAO = "_posicao_original"
+_DESLOCAMENTO = "_deslocamento_merge"
+
+# Resultado do complexo só em posições (sem o formato longo): linhas da demanda e do detalhamento + valor final
+_Projecao = namedtuple("_Projecao", ["fonte_detalhe", "idx_demanda", "idx_hist", "valor_final"])
+
+
+def _desdobrar_particao(metodo, caminhos, args, saida):
+    """
+    Executa um método de desdobramento sobre uma partição (roda dentro do worker). No complexo
+    grava também as linhas do merge de cada linha da demanda e, em cada linha do df_ok, o
+    deslocamento dentro das linhas da sua demanda, para o índice global (posição no merge) ser
+    refeito no processo principal.
+    """
+    frames = [pl.read_ipc(c, memory_map=True).to_pandas() for c in caminhos]
+    caminho_ok, caminho_erro, caminho_contagem = f"{saida}_ok.arrow", f"{saida}_erro.arrow", None
+    if metodo.startswith("_complexo"):
+        df_ok, df_erro, contagens = getattr(MegaDesdobrador(), metodo)(*frames, *args, contar=True)
+        inicio_demanda = np.cumsum(contagens) - contagens
+        idx_demanda = pd.Index(frames[0][_POSICAO]).get_indexer(df_ok[_POSICAO])
+        df_ok[_DESLOCAMENTO] = df_ok.index.to_numpy() - inicio_demanda[idx_demanda]
+        caminho_contagem = f"{saida}_contagem.arrow"
+        pl.DataFrame({_POSICAO: frames[0][_POSICAO].to_numpy(), "_contagem": contagens}).write_ipc(caminho_contagem)
+    else:
+        df_ok, df_erro = getattr(MegaDesdobrador(), metodo)(*frames, *args)
+    pl.from_pandas(df_ok).write_ipc(caminho_ok)
+    pl.from_pandas(df_erro[[_POSICAO]]).write_ipc(caminho_erro)
+    return caminho_ok, caminho_erro, caminho_contagem
+
+
+def _calcular_share(df_historico, chaves_ligacao, chaves_full, coluna_valor):
+    """Share histórico: soma por chaves_full, negativos viram 0.5 e fator dentro de cada ligação."""
+    dist_hist = df_historico.groupby(chaves_full)[coluna_valor].sum().reset_index()
+    dist_hist[coluna_valor] = np.where(dist_hist[coluna_valor] < 0, 0.5, dist_hist[coluna_valor])
+    soma_grupo = dist_hist.groupby(chaves_ligacao)[coluna_valor].transform('sum')
+    dist_hist['fator'] = dist_hist[coluna_valor] / soma_grupo.replace(0, 1)
+    return dist_hist
+
+
+class IndiceShare:
+    """
+    Índice persistente do share histórico usado pelo desdobrar_complexo.
+
+    Guarda a soma do histórico por chaves_full e período e os fatores já calculados. Pode ser
+    salvo em disco (parquet + meta.json) e reutilizado entre execuções/processos; ao receber um
+    novo histórico só os períodos cujo fingerprint mudou são reagregados, períodos que saíram
+    da janela são descartados e os fatores são recalculados a partir das somas já agregadas.
+
+    Uso:
+        indice = IndiceShare.carregar_ou_construir("cache/share", df_historico, ['UF', 'Item'], ['Cidade'], 'Qtd')
+        MegaDesdobrador().desdobrar_complexo(df_demanda, indice, df_lote, ['UF', 'Item'], ['Cidade'], 'Qtd')
+    """
+    VERSAO = 1
+
+    def __init__(self, chaves_ligacao, chaves_detalhamento, coluna_valor, coluna_periodo="AnoMes"):
+        self.chaves_ligacao = list(chaves_ligacao)
+        self.chaves_detalhamento = list(chaves_detalhamento)
+        self.coluna_valor = coluna_valor
+        self.coluna_periodo = coluna_periodo
+        self.somas = None
+        self.fatores = None
+        self.impressoes = {}
+
+    @property
+    def chaves_full(self):
+        return self.chaves_ligacao + self.chaves_detalhamento
+
+    def construir(self, df_historico):
+        """Agrega o histórico inteiro do zero."""
+        self.impressoes = self._impressoes(df_historico)
+        self.somas = self._agregar(df_historico)
+        self._recalcular_fatores()
+        return self
+
+    def atualizar(self, df_historico):
+        """
+        Atualiza o índice para um novo histórico reagregando apenas os períodos novos ou
+        alterados e descartando os que não existem mais.
+        """
+        if self.somas is None:
+            return self.construir(df_historico)
+
+        novas = self._impressoes(df_historico)
+        removidos = [p for p in self.impressoes if p not in novas]
+        alterados = [p for p, h in novas.items() if self.impressoes.get(p) != h]
+        if not removidos and not alterados:
+            INSTRUMENTACAO.exibir("Índice de share já está atualizado.")
+            return self
+
+        INSTRUMENTACAO.exibir(f"Atualizando índice de share: {len(alterados)} período(s) novo(s)/alterado(s), {len(removidos)} removido(s).")
+        mantidos = ~self.somas["_periodo"].isin(removidos + alterados)
+        novos = self._agregar(df_historico[self._periodos(df_historico).isin(alterados)])
+        self.somas = pd.concat([self.somas[mantidos], novos], ignore_index=True)
+        self.impressoes = novas
+        self._recalcular_fatores()
+        return self
+
+    def validar(self, chaves_ligacao, chaves_detalhamento, coluna_valor):
+        """Garante que o índice foi construído com as mesmas chaves e coluna de valor."""
+        esperado = (list(chaves_ligacao), list(chaves_detalhamento), coluna_valor)
+        atual = (self.chaves_ligacao, self.chaves_detalhamento, self.coluna_valor)
+        if esperado != atual:
+            raise ValueError(f"Índice de share incompatível: construído com {atual}, solicitado {esperado}.")
+        if self.fatores is None:
+            raise ValueError("Índice de share vazio, execute construir() antes de usar.")
+        return self
+
+    def salvar(self, pasta):
+        os.makedirs(pasta, exist_ok=True)
+        self.somas.to_parquet(os.path.join(pasta, "somas.parquet"), index=False)
+        self.fatores.to_parquet(os.path.join(pasta, "fatores.parquet"), index=False)
+        meta = {
+            "versao": self.VERSAO,
+            "chaves_ligacao": self.chaves_ligacao,
+            "chaves_detalhamento": self.chaves_detalhamento,
+            "coluna_valor": self.coluna_valor,
+            "coluna_periodo": self.coluna_periodo,
+            "impressoes": self.impressoes,
+        }
+        with open(os.path.join(pasta, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def carregar(cls, pasta):
+        with open(os.path.join(pasta, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("versao") != cls.VERSAO:
+            raise ValueError(f"Versão do índice de share em '{pasta}' não suportada.")
+        indice = cls(meta["chaves_ligacao"], meta["chaves_detalhamento"], meta["coluna_valor"], meta["coluna_periodo"])
+        indice.impressoes = meta["impressoes"]
+        indice.somas = pd.read_parquet(os.path.join(pasta, "somas.parquet"), memory_map=True)
+        indice.fatores = pd.read_parquet(os.path.join(pasta, "fatores.parquet"), memory_map=True)
+        return indice
+
+    @classmethod
+    def carregar_ou_construir(cls, pasta, df_historico, chaves_ligacao, chaves_detalhamento, coluna_valor, coluna_periodo="AnoMes"):
+        """
+        Reaproveita o índice salvo em ``pasta`` se for compatível, atualizando só o que mudou
+        no histórico; senão constrói do zero. O índice resultante é salvo de volta.
+        """
+        indice = None
+        if os.path.exists(os.path.join(pasta, "meta.json")):
+            try:
+                indice = cls.carregar(pasta).validar(chaves_ligacao, chaves_detalhamento, coluna_valor)
+                if indice.coluna_periodo != coluna_periodo:
+                    raise ValueError("Coluna de período diferente.")
+            except ValueError as e:
+                INSTRUMENTACAO.exibir(f"Índice de share em '{pasta}' descartado: {e}")
+                indice = None
+
+        if indice is None:
+            indice = cls(chaves_ligacao, chaves_detalhamento, coluna_valor, coluna_periodo).construir(df_historico)
+        else:
+            indice.atualizar(df_historico)
+        indice.salvar(pasta)
+        return indice
+
+    # AUXILIARES
+    def _periodos(self, df):
+        if self.coluna_periodo is None:
+            return pd.Series("*", index=df.index)
+        return df[self.coluna_periodo].astype(str)
+
+    def _impressoes(self, df):
+        """Fingerprint por período: soma dos hashes das linhas (independe da ordem) + quantidade."""
+        colunas = self.chaves_full + [self.coluna_valor]
+        hashes = pd.util.hash_pandas_object(df[colunas], index=False)
+        por_periodo = hashes.groupby(self._periodos(df).to_numpy()).agg(["sum", "size"])
+        return {str(p): f"{int(h):016x}-{int(n)}" for p, h, n in zip(por_periodo.index, por_periodo["sum"], por_periodo["size"])}
+
+    def _agregar(self, df):
+        df = df[self.chaves_full + [self.coluna_valor]].assign(_periodo=self._periodos(df))
+        return df.groupby(self.chaves_full + ["_periodo"], dropna=False)[self.coluna_valor].sum().reset_index()
+
+    def _recalcular_fatores(self):
+        self.fatores = _calcular_share(self.somas, self.chaves_ligacao, self.chaves_full, self.coluna_valor)
+
+
+class PesosHierarquia:
+    """
+    Pesos de todos os níveis de uma hierarquia (ex.: Brasil -> UF -> Cidade -> SKU) calculados a
+    partir do destino no nível mais fino, para uso no MegaDesdobrador.desdobrar_hierarquico.
+    Pode ser calculado uma vez e reaproveitado para várias origens sobre o mesmo destino.
+
+    tabelas[k] guarda, para cada grupo do nível k (chaves acumuladas até o nível), o índice do
+    grupo pai em tabelas[k-1] e o peso do grupo dentro do pai; o nível 0 são as chaves da origem.
+    Para as linhas do destino ficam o grupo do penúltimo nível e o peso final da linha.
+    """
+
+    def __init__(self, df_destino, chaves_origem, niveis, coluna_valor):
+        self.chaves_origem = list(chaves_origem)
+        self.niveis = [list(n) for n in niveis]
+        self.coluna_valor = coluna_valor
+        self.n_linhas = len(df_destino)
+        if not self.niveis:
+            raise ValueError("Informe ao menos um nível de chaves para desdobrar.")
+
+        # Códigos acumulados por nível nas linhas do destino (nível k = chaves_origem + niveis[:k])
+        codigos, nulos = [], []
+        for k, chaves in enumerate([self.chaves_origem] + self.niveis[:-1]):
+            (cod,), (nulo,) = _codificar_chaves([df_destino], chaves, retornar_nulos=True)
+            codigos.append(cod if k == 0 else _combinar_codigos(codigos[-1], cod))
+            nulos.append(nulo if k == 0 else nulos[-1] | nulo)
+        valor = df_destino[self.coluna_valor].reset_index(drop=True)
+
+        # Níveis intermediários: soma do destino agrupada direto em cada nível (como o groupby de cada etapa)
+        self.tabelas = [None] * len(self.niveis)
+        codigos_tabela = [None] * len(self.niveis)
+        primeiras_linhas = [None] * len(self.niveis)
+        for k in range(1, len(self.niveis)):
+            linhas = np.flatnonzero(~nulos[k])
+            agrupado = pd.DataFrame({"_cod": codigos[k][linhas], "_linha": linhas, "_pai": codigos[k - 1][linhas],
+                                     "_soma": valor.to_numpy()[linhas]}).groupby("_cod").agg(
+                _linha=("_linha", "first"), _pai=("_pai", "first"), _soma=("_soma", "sum"))
+            self.tabelas[k] = _tomar_linhas(df_destino[self.chaves_nivel(k)], agrupado["_linha"].to_numpy())
+            self.tabelas[k]["_pai"] = agrupado["_pai"].to_numpy()
+            self.tabelas[k]["_soma"] = agrupado["_soma"].to_numpy()
+            codigos_tabela[k] = agrupado.index.to_numpy()
+            primeiras_linhas[k] = agrupado["_linha"].to_numpy()
+
+        # Nível 0: grupos da origem que existem no primeiro nível do destino
+        if len(self.niveis) > 1:
+            codigos_tabela[0], primeira = np.unique(self.tabelas[1]["_pai"].to_numpy(), return_index=True)
+            linhas0 = primeiras_linhas[1][primeira]
+        else:
+            codigos_tabela[0], linhas0 = np.unique(codigos[0][~nulos[0]], return_index=True)
+            linhas0 = np.flatnonzero(~nulos[0])[linhas0]
+        self.tabelas[0] = _tomar_linhas(df_destino[self.chaves_origem], linhas0)
+
+        # Pai e peso de cada grupo dentro do pai (mesma regra do clássico)
+        for k in range(1, len(self.niveis)):
+            tabela = self.tabelas[k]
+            tabela["_pai"] = np.searchsorted(codigos_tabela[k - 1], tabela["_pai"].to_numpy())
+            soma_pai = tabela["_soma"].groupby(tabela["_pai"].to_numpy()).transform("sum")
+            tabela["_peso"] = np.where(soma_pai != 0, tabela["_soma"] / soma_pai, 0)
+
+        # Último nível: linhas do destino dentro do grupo do penúltimo nível
+        ultimo = len(self.niveis) - 1
+        soma_linha = valor.groupby(codigos[ultimo]).transform("sum").where(~nulos[ultimo])
+        self.peso_linha = np.where(soma_linha != 0, valor / soma_linha, 0)
+        self.grupo_linha = np.where(nulos[ultimo], -1, np.searchsorted(codigos_tabela[ultimo], codigos[ultimo]))
+
+    def chaves_nivel(self, k):
+        """Chaves acumuladas do nível k (0 = chaves da origem)."""
+        return self.chaves_origem + [c for nivel in self.niveis[:k] for c in nivel]
+
+    def validar(self, df_destino, chaves_origem, niveis, coluna_valor):
+        esperado = (list(chaves_origem), [list(n) for n in niveis], coluna_valor, len(df_destino))
+        atual = (self.chaves_origem, self.niveis, self.coluna_valor, self.n_linhas)
+        if esperado != atual:
+            raise ValueError(f"Pesos de hierarquia incompatíveis: calculados para {atual[:3]}, solicitado {esperado[:3]}.")
+        return self
+
+
+class ResultadoDesdobramento:
+    """
+    Resultado de um desdobramento, sem ligação com a instância do MegaDesdobrador que o gerou
+    (ver MegaDesdobrador.desdobrar).
+
+    df_ok / df_erro: resultado principal e erros (caminhos no particionado e com arquivo_pivot).
+    df_longo: formato longo do complexo quando df_ok é o pivot. soma_origem e auditoria: totais
+    (origem, desdobrado, erros; no hierárquico os do último nível). retorno: a mesma tupla do
+    método desdobrar_* equivalente (com a auditoria por cenário/nível, quando houver).
+    """
+
+    def __init__(self, modo, df_ok, df_erro, soma_origem, auditoria, retorno, df_longo=None):
+        self.modo = modo
+        self.df_ok = df_ok
+        self.df_erro = df_erro
+        self.soma_origem = soma_origem
+        self.auditoria = auditoria
+        self.retorno = retorno
+        self.df_longo = df_longo
+
+    def salvar(self, caminho_base="outputs", formato="xlsx", em_segundo_plano=None, compressao=None):
+        """Igual ao MegaDesdobrador.salvar_resultados, gravando df_ok (o pivot, se houver) e df_erro."""
+        saidas = {"resultado_ok": self.df_ok, "resultado_erros": self.df_erro}
+        return _salvar_resultados({nome: df for nome, df in saidas.items() if isinstance(df, pd.DataFrame)},
+                                  caminho_base, formato, em_segundo_plano, compressao)
+
 
 class MegaDesdobrador:
-    def __init__(self):
+    # Quantas vezes o tamanho da entrada uma partição ocupa em memória durante o processamento
+    FATOR_MEMORIA = 6
+
+    # Modos da API sem estado (desdobrar) e o método que executa cada um
+    MODOS = {
+        "classico": "_executar_classico", "complexo": "_executar_complexo",
+        "complexo_particionado": "_executar_particionado", "cenarios": "_executar_cenarios",
+        "delta": "_executar_delta", "hierarquico": "_executar_hierarquico",
+    }
+
+    def __init__(self, instrumentacao=None):
+        # Último resultado dos métodos desdobrar_* (a API desdobrar não grava nada aqui)
         self.df_ok = None
         self.df_erro = None
         self.soma_origem_total = 0
+        self.auditoria = None
+        # Etapas, prints e auditoria (ver configurar_instrumentacao); None usa a instrumentação padrão
+        self.instrumentacao = instrumentacao or INSTRUMENTACAO
 
-    def desdobrar_classico(self, df_origem, df_destino, chaves_origem, chaves_destino, coluna_valor):
+    def desdobrar(self, modo, *args, **kwargs):
+        """
+        API sem estado: executa o modo ("classico", "complexo", "complexo_particionado",
+        "cenarios", "delta" ou "hierarquico") com os mesmos parâmetros do desdobrar_<modo> /
+        redesdobrar_delta e retorna um ResultadoDesdobramento, sem gravar nada na instância.
+        A mesma instância pode ser usada ao mesmo tempo por várias threads.
+        """
+        if modo not in self.MODOS:
+            raise ValueError(f"Modo '{modo}' não suportado.")
+        return getattr(self, self.MODOS[modo])(*args, **kwargs)
+
+    def desdobrar_classico(self, df_origem, df_destino, chaves_origem, chaves_destino, coluna_valor, engine="pandas", n_jobs=1):
         """
         Desdobra valores da origem baseando-se no peso atual do destino.
         Ideal para: Abrir Demanda em Itens/Cidades que já possuem valores no destino.
+
+        engine="polars" executa checagem de erros, pesos e projeção num único plano LazyFrame
+        e devolve o mesmo resultado do caminho pandas.
+        n_jobs > 1 (ou -1 para todos os núcleos) divide origem e destino por hash das chaves
+        comuns e processa as partições em paralelo.
         """
-        inicio_proc = time.time()
-        self.soma_origem_total = df_origem[coluna_valor].sum()
+        return self._guardar(self._executar_classico(df_origem, df_destino, chaves_origem, chaves_destino, coluna_valor, engine, n_jobs))
+
+    @instrumentar("desdobrar_classico")
+    def _executar_classico(self, df_origem, df_destino, chaves_origem, chaves_destino, coluna_valor, engine="pandas", n_jobs=1):
+        inicio_proc = time.perf_counter()
+        v_in = df_origem[coluna_valor].sum()
         chaves_comuns = [c for c in chaves_origem if c in chaves_destino]
 
-        # Identificar erros (Origem sem par no Destino)
-        check = df_origem.merge(df_destino[chaves_comuns].drop_duplicates(), on=chaves_comuns, how="left", indicator=True)
-        self.df_erro = check[check["_merge"] == "left_only"].drop(columns="_merge")
-        df_origem_valida = check[check["_merge"] == "both"].drop(columns="_merge")
+        engine = self._validar_engine(engine)
+        if n_jobs != 1:
+            df_ok, pos_erro = self._desdobrar_paralelo(
+                f"_classico_{engine}", [(df_origem, chaves_comuns), (df_destino, chaves_comuns)],
+                (chaves_origem, chaves_comuns, coluna_valor), n_jobs
+            )
+            df_erro = df_origem.reset_index(drop=True).iloc[pos_erro]
+        elif engine == "polars":
+            df_ok, df_erro = self._classico_polars(df_origem, df_destino, chaves_origem, chaves_comuns, coluna_valor)
+        else:
+            df_ok, df_erro = self._classico_pandas(df_origem, df_destino, chaves_origem, chaves_comuns, coluna_valor)
 
-        # Calcular Pesos no Destino
-        destino_agrupado = df_destino.groupby(chaves_comuns)[coluna_valor].sum().reset_index().rename(columns={coluna_valor: "soma_destino"})
-        df_destino_ok = df_destino.merge(destino_agrupado, on=chaves_comuns, how="left")
-        
-        df_destino_ok["peso"] = np.where(df_destino_ok["soma_destino"] != 0, 
-                                         df_destino_ok[coluna_valor] / df_destino_ok["soma_destino"], 0)
+        auditoria = self._exibir_auditoria("CLÁSSICO", v_in, df_ok["valor_desdobrado"].sum(), df_erro[coluna_valor].sum(), time.perf_counter() - inicio_proc)
+        return ResultadoDesdobramento("classico", df_ok, df_erro, v_in, auditoria, (df_ok, df_erro))
 
-        # Aplicar Desdobramento
-        df_destino_ok = df_destino_ok.merge(df_origem_valida[chaves_origem + [coluna_valor]], 
-                                            on=chaves_comuns, how="left", suffixes=("", "_origem"))
-        
-        df_destino_ok["valor_desdobrado"] = df_destino_ok["peso"] * df_destino_ok[f"{coluna_valor}_origem"]
-        
-        self.df_ok = df_destino_ok.drop(columns=["soma_destino", "peso", f"{coluna_valor}_origem"])
-        
-        self._exibir_auditoria("CLÁSSICO", self.soma_origem_total, self.df_ok["valor_desdobrado"].sum(), self.df_erro[coluna_valor].sum(), time.time() - inicio_proc)
-        return self.df_ok, self.df_erro
-
-    def desdobrar_complexo(self, df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, pivotar=True):
+    def desdobrar_complexo(self, df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, pivotar=True, engine="pandas", n_jobs=1,
+                           manter_longo=True, arquivo_pivot=None):
         """
         Projeta a demanda baseando-se no histórico de 6 meses e aplica lote mínimo.
         Ideal para: Abrir Forecast consolidado em granularidade SKU/UF/Cidade.
+
+        engine="polars" executa share, projeção, lote e separação de erros num único plano
+        LazyFrame e devolve o mesmo resultado do caminho pandas.
+        n_jobs > 1 (ou -1 para todos os núcleos) divide demanda e histórico por hash das
+        chaves_ligacao e processa as partições em paralelo.
+        df_historico pode ser um IndiceShare para reaproveitar o share já calculado.
+
+        O pivot (chaves x AnoMes) é montado por preenchimento de uma matriz densa sobre códigos
+        inteiros. Com manter_longo=False (e pivotar=True) o formato longo nem chega a ser montado:
+        o pivot sai direto das posições de demanda/histórico e self.df_ok guarda o resultado largo.
+        arquivo_pivot (.parquet ou .csv) grava o resultado largo em blocos e retorna o caminho.
+        """
+        return self._guardar(self._executar_complexo(df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor,
+                                                     pivotar, engine, n_jobs, manter_longo, arquivo_pivot))
+
+    @instrumentar("desdobrar_complexo")
+    def _executar_complexo(self, df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, pivotar=True, engine="pandas",
+                           n_jobs=1, manter_longo=True, arquivo_pivot=None):
+        inicio_proc = time.perf_counter()
+        v_in = df_demanda[coluna_valor].sum()
+        chaves_full = chaves_ligacao + chaves_detalhamento
+        longo = not pivotar or manter_longo
+
+        engine = self._validar_engine(engine)
+        if n_jobs != 1:
+            if isinstance(df_historico, IndiceShare):
+                # Reagregar a tabela de somas já agregadas reproduz os mesmos fatores em cada partição
+                df_historico = df_historico.validar(chaves_ligacao, chaves_detalhamento, coluna_valor).fatores[chaves_full + [coluna_valor]]
+            # Lote só é particionado se o Item fizer parte da ligação, senão vai inteiro para cada partição
+            df_ok, pos_erro = self._desdobrar_paralelo(
+                f"_complexo_{engine}",
+                [(df_demanda, chaves_ligacao), (df_historico, chaves_ligacao),
+                 (df_lote, ['Item'] if chaves_ligacao == ['Item'] else None)],
+                (chaves_ligacao, chaves_detalhamento, coluna_valor), n_jobs
+            )
+            df_erro = df_demanda.iloc[pos_erro].copy()
+        elif engine == "polars":
+            df_ok, df_erro = self._complexo_polars(df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, longo=longo)
+        else:
+            df_ok, df_erro = self._complexo_pandas(df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, longo=longo)
+
+        if isinstance(df_ok, _Projecao):
+            projecao = df_ok
+            # Rótulos vêm direto da demanda (ligação e AnoMes) e do detalhamento, por posição
+            fonte_mes, idx_mes = (projecao.fonte_detalhe, projecao.idx_hist) if 'AnoMes' in chaves_detalhamento else (df_demanda, projecao.idx_demanda)
+            fontes = [(df_demanda, chaves_ligacao, projecao.idx_demanda), (projecao.fonte_detalhe, chaves_detalhamento, projecao.idx_hist)]
+            with self.instrumentacao.etapa("pivot"):
+                df_ok = _pivotar_largo(fontes, fonte_mes['AnoMes'].to_numpy()[idx_mes], projecao.valor_final, arquivo=arquivo_pivot)
+            v_out = projecao.valor_final.sum()
+        else:
+            v_out = df_ok['valor_final'].sum()
+            if not longo:
+                # No paralelo as partições voltam no formato longo: o pivot (e o arquivo_pivot) sai dele
+                with self.instrumentacao.etapa("pivot"):
+                    df_ok = self._executar_pivot(df_ok, chaves_full, 'valor_final', arquivo=arquivo_pivot)
+        auditoria = self._exibir_auditoria("COMPLEXO", v_in, v_out, df_erro[coluna_valor].sum(), time.perf_counter() - inicio_proc)
+
+        if not longo:
+            # df_ok é o resultado largo ou o caminho do arquivo_pivot
+            return ResultadoDesdobramento("complexo", df_ok, df_erro, v_in, auditoria, (df_ok, df_erro))
+        if pivotar and not df_ok.empty:
+            with self.instrumentacao.etapa("pivot"):
+                pivot = self._executar_pivot(df_ok, chaves_full, 'valor_final', arquivo=arquivo_pivot)
+            return ResultadoDesdobramento("complexo", pivot, df_erro, v_in, auditoria, (pivot, df_erro), df_longo=df_ok)
+        return ResultadoDesdobramento("complexo", df_ok, df_erro, v_in, auditoria, (df_ok, df_erro), df_longo=df_ok)
+
+    def desdobrar_complexo_particionado(self, demanda, historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor,
+                                        pasta_saida="outputs", memoria_mb=2048, n_particoes=None, engine="polars"):
+        """
+        Versão out-of-core do desdobrar_complexo para históricos maiores que a memória.
+        Demanda e histórico podem ser DataFrames, LazyFrames ou caminhos (.parquet/.csv/.arrow, globs);
+        o histórico também pode ser um IndiceShare.
+        Os dados são divididos por hash das chaves_ligacao num único passe em streaming e cada
+        partição é desdobrada isoladamente, gravando resultado_ok/ e resultado_erros/ em parquet
+        parte a parte. Retorna os caminhos das duas pastas.
+
+        memoria_mb: orçamento de memória usado para estimar o número de partições.
+        n_particoes: força o número de partições (ignora memoria_mb).
+        """
+        return self._guardar(self._executar_particionado(demanda, historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor,
+                                                         pasta_saida, memoria_mb, n_particoes, engine))
+
+    @instrumentar("desdobrar_complexo_particionado")
+    def _executar_particionado(self, demanda, historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor,
+                               pasta_saida="outputs", memoria_mb=2048, n_particoes=None, engine="polars"):
+        inicio_proc = time.perf_counter()
+        engine = self._validar_engine(engine)
+        chaves_full = chaves_ligacao + chaves_detalhamento
+        if isinstance(historico, IndiceShare):
+            historico = historico.validar(chaves_ligacao, chaves_detalhamento, coluna_valor).fatores[chaves_full + [coluna_valor]]
+
+        if n_particoes is None:
+            tamanho = _tamanho_fonte(demanda) + _tamanho_fonte(historico)
+            n_particoes = max(1, math.ceil(tamanho * self.FATOR_MEMORIA / (memoria_mb * 1024 ** 2)))
+        self.instrumentacao.exibir(f"Desdobrando em {n_particoes} partição(ões).")
+
+        lf_demanda = _fonte_lazy(demanda)
+        lf_historico = _fonte_lazy(historico)
+        # Mesmos dtypes nas chaves para o hash cair na mesma partição nos dois lados
+        schema_demanda = lf_demanda.collect_schema()
+        lf_historico = lf_historico.select(chaves_full + [coluna_valor]).with_columns(
+            [pl.col(c).cast(schema_demanda[c]) for c in chaves_ligacao]
+        )
+        if isinstance(df_lote, pd.DataFrame):
+            df_lote = df_lote[['Item', 'Lote_Multiplo']]
+        else:
+            df_lote = _fonte_lazy(df_lote).select('Item', 'Lote_Multiplo').collect().to_pandas()
+
+        pasta_particoes = os.path.join(pasta_saida, "_particoes")
+        pasta_ok = os.path.join(pasta_saida, "resultado_ok")
+        pasta_erro = os.path.join(pasta_saida, "resultado_erros")
+        for pasta in (pasta_particoes, pasta_ok, pasta_erro):
+            shutil.rmtree(pasta, ignore_errors=True)
+            os.makedirs(pasta)
+
+        # Passe único em streaming: grava cada lado já separado por partição
+        particao = (pl.struct(chaves_ligacao).hash(seed=0) % n_particoes).alias("_particao")
+        with self.instrumentacao.etapa("particionar", particoes=n_particoes):
+            for nome, lf in (("demanda", lf_demanda), ("historico", lf_historico)):
+                lf.with_columns(particao).sink_parquet(
+                    pl.PartitionByKey(os.path.join(pasta_particoes, nome), by="_particao", include_key=False), mkdir=True
+                )
+
+        v_in = v_out = v_err = 0
+        try:
+            for i in range(n_particoes):
+                pasta_demanda_i = os.path.join(pasta_particoes, "demanda", f"_particao={i}")
+                if not os.path.isdir(pasta_demanda_i):
+                    continue
+                with self.instrumentacao.etapa("particao", particao=i) as evento:
+                    df_demanda_i = pl.read_parquet(pasta_demanda_i).to_pandas()
+                    pasta_hist_i = os.path.join(pasta_particoes, "historico", f"_particao={i}")
+                    if os.path.isdir(pasta_hist_i):
+                        df_hist_i = pl.read_parquet(pasta_hist_i).to_pandas()
+                    else:
+                        df_hist_i = lf_historico.clear().collect().to_pandas()
+
+                    if engine == "polars":
+                        df_ok_i, df_erro_i = self._complexo_polars(df_demanda_i, df_hist_i, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor)
+                    else:
+                        df_ok_i, df_erro_i = self._complexo_pandas(df_demanda_i, df_hist_i, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor)
+
+                    v_in += df_demanda_i[coluna_valor].sum()
+                    v_out += df_ok_i['valor_final'].sum()
+                    v_err += df_erro_i[coluna_valor].sum()
+                    pl.from_pandas(df_ok_i).write_parquet(os.path.join(pasta_ok, f"parte_{i:05d}.parquet"))
+                    pl.from_pandas(df_erro_i).write_parquet(os.path.join(pasta_erro, f"parte_{i:05d}.parquet"))
+                    evento["linhas_saida"] = [len(df_ok_i), len(df_erro_i)]
+                    del df_demanda_i, df_hist_i, df_ok_i, df_erro_i
+        finally:
+            shutil.rmtree(pasta_particoes, ignore_errors=True)
+
+        # Resultados ficam em disco, não na instância
+        auditoria = self._exibir_auditoria("COMPLEXO PARTICIONADO", v_in, v_out, v_err, time.perf_counter() - inicio_proc)
+        return ResultadoDesdobramento("complexo_particionado", pasta_ok, pasta_erro, v_in, auditoria, (pasta_ok, pasta_erro))
+
+    def desdobrar_cenarios(self, df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, cenarios=None):
+        """
+        Desdobra vários cenários de demanda (base/otimista/pessimista, revisões...) de uma vez,
+        com o mesmo histórico e lote. O share e o mapeamento demanda -> detalhe são calculados
+        uma única vez e aplicados a todos os cenários numa multiplicação vetorizada; a regra de
+        Lote_Multiplo é aplicada coluna a coluna.
+
+        df_demanda: DataFrame com uma coluna por cenário (nomes em ``cenarios``) ou dict
+        {cenario: DataFrame} em que cada versão tem a demanda em ``coluna_valor``.
+        coluna_valor: coluna de valor do histórico (e das versões, quando dict).
+
+        Retorna (df_ok, df_erro, auditoria): df_ok em formato largo, com uma coluna de valor
+        final por cenário (0 onde o cenário não gera valor), e a auditoria por cenário.
         """
-        inicio_proc = time.time()
-        self.soma_origem_total = df_demanda[coluna_valor].sum()
+        return self._guardar(self._executar_cenarios(df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, cenarios))
+
+    @instrumentar("desdobrar_cenarios")
+    def _executar_cenarios(self, df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, cenarios=None):
+        inicio_proc = time.perf_counter()
+        if isinstance(df_demanda, dict):
+            df_demanda, cenarios = _cenarios_em_colunas(df_demanda, coluna_valor)
+        if not cenarios:
+            raise ValueError("Informe as colunas de cenários ou um dict de versões de demanda.")
+        cenarios = list(cenarios)
         chaves_full = chaves_ligacao + chaves_detalhamento
-        
-        # Share Histórico
-        dist_hist = df_historico.groupby(chaves_full)[coluna_valor].sum().reset_index()
-        dist_hist[coluna_valor] = np.where(dist_hist[coluna_valor] < 0, 0.5, dist_hist[coluna_valor])
-        soma_grupo = dist_hist.groupby(chaves_ligacao)[coluna_valor].transform('sum')
-        dist_hist['fator'] = dist_hist[coluna_valor] / soma_grupo.replace(0, 1)
+
+        # Share e mapeamento demanda -> detalhe -> lote uma vez só, sobre chaves codificadas
+        base = df_demanda.drop(columns=cenarios)
+        mapa, fonte_detalhe, erro = self._mapear_complexo(base, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, how='inner')
+        idx_demanda = mapa['_idx_demanda'].to_numpy()
+        idx_lote = mapa['_idx_lote'].to_numpy()
+        lote_multiplo = _tomar_linhas(df_lote[['Lote_Multiplo']], idx_lote, com_faltantes=bool((idx_lote < 0).any()))['Lote_Multiplo'].fillna(0)
+
+        # Projeção de todos os cenários: (linhas do mapa x cenários)
+        valores = df_demanda[cenarios].to_numpy(dtype="float64")
+        desdobrado = valores[idx_demanda] * mapa['fator'].to_numpy()[:, None]
+        lote = lote_multiplo.to_numpy(dtype="float64")[:, None]
+        # Regra Lote: < 0.5 vira 0 | entre 0.5 e 1.0 vira Lote
+        final = np.where(desdobrado < 0.5 * lote, 0, desdobrado)
+        final = np.where((desdobrado >= 0.5 * lote) & (desdobrado <= lote), lote, final)
+        final = np.where(final > 0, final, 0.0)
+
+        # Separação
+        manter = (final > 0).any(axis=1)
+        df_ok = pd.concat([
+            _tomar_linhas(base, idx_demanda[manter]),
+            _tomar_linhas(fonte_detalhe[chaves_detalhamento], mapa['_idx_hist'].to_numpy()[manter]),
+        ], axis=1)
+        df_ok['fator'] = mapa['fator'].to_numpy()[manter]
+        df_ok['Lote_Multiplo'] = lote_multiplo.to_numpy()[manter]
+        df_ok[cenarios] = final[manter]
+        df_erro = df_demanda[erro].copy()
+
+        auditoria = pd.DataFrame({
+            'cenario': cenarios,
+            'soma_origem': np.nansum(valores, axis=0),
+            'soma_desdobrado': final.sum(axis=0),
+            'soma_erros': df_erro[cenarios].sum().to_numpy(),
+        })
+        auditoria['taxa_erro'] = np.where(auditoria['soma_origem'] > 0, auditoria['soma_erros'] / auditoria['soma_origem'] * 100, 0)
+
+        self.instrumentacao.exibir(f"\n>>> RELATÓRIO MEGA DESDOBRADOR | MODO: CENÁRIOS ({len(cenarios)})")
+        self.instrumentacao.exibir(f"{'-'*50}")
+        self.instrumentacao.exibir(auditoria.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+        self.instrumentacao.exibir(f"Tempo:           {time.perf_counter() - inicio_proc:.2f}s")
+        self.instrumentacao.exibir(f"{'-'*50}")
+        v_in = auditoria['soma_origem'].sum()
+        totais = {"origem": v_in, "desdobrado": auditoria['soma_desdobrado'].sum(), "erros": auditoria['soma_erros'].sum()}
+        return ResultadoDesdobramento("cenarios", df_ok, df_erro, v_in, totais, (df_ok, df_erro, auditoria))
+
+    def redesdobrar_delta(self, resultado_anterior, df_demanda_anterior, df_demanda_nova, df_historico, df_lote,
+                          chaves_ligacao, chaves_detalhamento, coluna_valor, pivotar=True, engine="pandas", auditoria_anterior=None):
+        """
+        Atualiza um resultado do desdobrar_complexo quando só parte da demanda mudou.
+        Compara as duas versões da demanda por grupo de chaves_ligacao (fingerprint das linhas),
+        desdobra de novo apenas os grupos alterados, incluídos ou removidos e substitui esses
+        grupos em df_ok (longo ou pivotado) e df_erro. Os totais da auditoria também são
+        atualizados só com a diferença.
+
+        resultado_anterior: (df_ok, df_erro) devolvido pelo desdobrar_complexo com o mesmo ``pivotar``.
+        auditoria_anterior: dict {"origem", "desdobrado", "erros"} da execução anterior
+        (``self.auditoria``); se None é recalculado a partir dos resultados anteriores.
+
+        Linhas novas entram no fim de df_ok longo; o pivotado é reordenado pelas chaves.
+        """
+        return self._guardar(self._executar_delta(resultado_anterior, df_demanda_anterior, df_demanda_nova, df_historico, df_lote,
+                                                  chaves_ligacao, chaves_detalhamento, coluna_valor, pivotar, engine, auditoria_anterior))
+
+    @instrumentar("redesdobrar_delta")
+    def _executar_delta(self, resultado_anterior, df_demanda_anterior, df_demanda_nova, df_historico, df_lote,
+                        chaves_ligacao, chaves_detalhamento, coluna_valor, pivotar=True, engine="pandas", auditoria_anterior=None):
+        inicio_proc = time.perf_counter()
+        engine = self._validar_engine(engine)
+        chaves_full = chaves_ligacao + chaves_detalhamento
+        df_ok_ant, df_erro_ant = resultado_anterior
+
+        if list(df_demanda_anterior.columns) != list(df_demanda_nova.columns):
+            self.instrumentacao.exibir("Colunas da demanda mudaram, desdobrando tudo novamente.")
+            return self._executar_complexo(df_demanda_nova, df_historico, df_lote, chaves_ligacao, chaves_detalhamento,
+                                           coluna_valor, pivotar=pivotar, engine=engine)
+
+        # Grupos alterados, incluídos ou removidos
+        cod_ant, cod_nova = _codificar_chaves([df_demanda_anterior, df_demanda_nova], chaves_ligacao)
+        comparacao = _impressao_grupos(df_demanda_anterior, cod_ant).join(
+            _impressao_grupos(df_demanda_nova, cod_nova), how="outer", lsuffix="_ant", rsuffix="_nova"
+        )
+        alterados = comparacao.index[
+            (comparacao["hash_ant"] != comparacao["hash_nova"]) | (comparacao["linhas_ant"] != comparacao["linhas_nova"])
+        ].to_numpy()
+        if len(alterados) == 0:
+            self.instrumentacao.exibir("Nenhum grupo da demanda foi alterado.")
+            v_in = auditoria_anterior["origem"] if auditoria_anterior is not None else df_demanda_nova[coluna_valor].sum()
+            return ResultadoDesdobramento("delta", df_ok_ant, df_erro_ant, v_in, auditoria_anterior, (df_ok_ant, df_erro_ant))
+
+        mask_ant = np.isin(cod_ant, alterados)
+        mask_nova = np.isin(cod_nova, alterados)
+        demanda_delta = df_demanda_nova[mask_nova]
+        afetados = pd.concat([df_demanda_anterior.loc[mask_ant, chaves_ligacao], demanda_delta[chaves_ligacao]]).drop_duplicates()
+        self.instrumentacao.exibir(f"Redesdobrando {len(alterados)} grupo(s) de {len(comparacao)} ({mask_nova.sum()} linha(s) da nova demanda).")
+
+        # Desdobra só os grupos afetados (histórico filtrado para as mesmas ligações)
+        if isinstance(df_historico, IndiceShare):
+            hist_delta = df_historico
+        else:
+            hist_delta = df_historico[_pertence(df_historico, chaves_ligacao, afetados)]
+        if demanda_delta.empty:
+            ok_delta, erro_delta = df_ok_ant.iloc[:0], df_erro_ant.iloc[:0]
+        elif engine == "polars":
+            ok_delta, erro_delta = self._complexo_polars(demanda_delta, hist_delta, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor)
+        else:
+            ok_delta, erro_delta = self._complexo_pandas(demanda_delta, hist_delta, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor)
+
+        # Substitui os grupos afetados
+        remover_ok = _pertence(df_ok_ant, chaves_ligacao, afetados)
+        remover_erro = _pertence(df_erro_ant, chaves_ligacao, afetados)
+        if pivotar:
+            if ok_delta.empty:
+                ok_delta = df_ok_ant.iloc[:0]
+            else:
+                ok_delta = _pivotar_largo([(ok_delta, chaves_full, None)], ok_delta['AnoMes'].to_numpy(), ok_delta['valor_final'].to_numpy())
+            df_ok = pd.concat([df_ok_ant[~remover_ok], ok_delta], ignore_index=True)
+            meses = sorted(c for c in df_ok.columns if c not in chaves_full)
+            df_ok = df_ok[chaves_full + meses].sort_values(chaves_full, kind="stable").reset_index(drop=True)
+            df_ok.columns.name = 'AnoMes'
+        else:
+            inicio_indice = df_ok_ant.index.max() + 1 if len(df_ok_ant) else 0
+            ok_delta.index = np.arange(inicio_indice, inicio_indice + len(ok_delta))
+            df_ok = pd.concat([df_ok_ant[~remover_ok], ok_delta])
+        df_erro = pd.concat([df_erro_ant[~remover_erro], erro_delta])
+
+        # Auditoria incremental: total anterior - grupos removidos + grupos recalculados
+        def soma_ok(df):
+            if pivotar:
+                return np.nansum(df[[c for c in df.columns if c not in chaves_full]].to_numpy(dtype="float64"))
+            return df['valor_final'].sum()
+
+        if auditoria_anterior is None:
+            auditoria_anterior = {"origem": df_demanda_anterior[coluna_valor].sum(), "desdobrado": soma_ok(df_ok_ant),
+                                  "erros": df_erro_ant[coluna_valor].sum()}
+        v_in = auditoria_anterior["origem"] - df_demanda_anterior.loc[mask_ant, coluna_valor].sum() + demanda_delta[coluna_valor].sum()
+        v_out = auditoria_anterior["desdobrado"] - soma_ok(df_ok_ant[remover_ok]) + (soma_ok(ok_delta) if len(ok_delta) else 0)
+        v_err = auditoria_anterior["erros"] - df_erro_ant.loc[remover_erro, coluna_valor].sum() + erro_delta[coluna_valor].sum()
+
+        auditoria = self._exibir_auditoria("COMPLEXO DELTA", v_in, v_out, v_err, time.perf_counter() - inicio_proc)
+        return ResultadoDesdobramento("delta", df_ok, df_erro, v_in, auditoria, (df_ok, df_erro))
+
+    def desdobrar_hierarquico(self, df_origem, df_destino, chaves_origem, niveis, coluna_valor, pesos=None):
+        """
+        Desdobra a origem por vários níveis de uma hierarquia de uma vez, a partir do destino no
+        nível mais fino. Equivale a encadear desdobrar_classico nível a nível (destino agregado em
+        cada nível, resultado de um nível como origem do próximo), mas os pesos de todos os níveis
+        são calculados sobre as chaves codificadas sem materializar os DataFrames intermediários
+        e a explosão final é um único join.
+
+        niveis: chaves acrescentadas em cada nível, ex.: [['UF'], ['Cidade'], ['SKU']].
+        pesos: PesosHierarquia já calculado para o mesmo destino (reaproveita os pesos).
+
+        Retorna (df_ok, erros_niveis, auditoria): erros_niveis tem um DataFrame por nível (no
+        nível 1 as linhas da origem sem par; nos demais os grupos que não têm filhos no nível
+        seguinte, com o valor que chegou até eles) e auditoria traz os totais de cada nível.
+        """
+        return self._guardar(self._executar_hierarquico(df_origem, df_destino, chaves_origem, niveis, coluna_valor, pesos))
+
+    @instrumentar("desdobrar_hierarquico")
+    def _executar_hierarquico(self, df_origem, df_destino, chaves_origem, niveis, coluna_valor, pesos=None):
+        inicio_proc = time.perf_counter()
+        if pesos is None:
+            with self.instrumentacao.etapa("pesos"):
+                pesos = PesosHierarquia(df_destino, chaves_origem, niveis, coluna_valor)
+        pesos.validar(df_destino, chaves_origem, niveis, coluna_valor)
+        n_niveis = len(pesos.niveis)
+
+        # Nível 1: origem -> grupos do nível 0 do destino
+        cod_origem, cod_tabela = _codificar_chaves([df_origem, pesos.tabelas[0]], chaves_origem)
+        grupo_origem = pd.Index(cod_tabela).get_indexer(cod_origem)
+        valida = grupo_origem >= 0
+        valor_origem = df_origem[coluna_valor].to_numpy()
+        erros_niveis = [df_origem.reset_index(drop=True)[~valida]]
+
+        # Valor que chega em cada grupo de cada nível (somado quando a origem tem chaves repetidas)
+        chegada = np.bincount(grupo_origem[valida], weights=np.nan_to_num(valor_origem[valida].astype("float64")),
+                              minlength=len(pesos.tabelas[0]))
+        entrada, erro = np.nansum(valor_origem.astype("float64")), erros_niveis[0][coluna_valor].sum()
+        totais = []
+        for k in range(1, n_niveis):
+            pai = pesos.tabelas[k]["_pai"].to_numpy()
+            if k > 1:
+                erros_niveis.append(self._erro_nivel(pesos, k - 1, chegada, np.bincount(pai, minlength=len(chegada)) > 0))
+                erro = erros_niveis[-1][coluna_valor].sum()
+            chegada = pesos.tabelas[k]["_peso"].to_numpy() * chegada[pai]
+            totais.append((entrada, np.nansum(chegada), erro))
+            entrada = totais[-1][1]
+
+        # Explosão final: linhas do destino x linhas da origem do mesmo grupo do nível 0
+        ancestrais = [pesos.grupo_linha]
+        for k in range(n_niveis - 1, 0, -1):
+            ancestrais.insert(0, np.where(ancestrais[0] >= 0, pesos.tabelas[k]["_pai"].to_numpy()[ancestrais[0]], -1))
+        pos_valida = np.flatnonzero(valida)
+        pares = pd.DataFrame({'_grupo': ancestrais[0], '_idx_destino': np.arange(pesos.n_linhas)}).merge(
+            pd.DataFrame({'_grupo': grupo_origem[pos_valida], '_idx_origem': pos_valida}), on='_grupo', how='left'
+        )
+        idx_destino = pares['_idx_destino'].to_numpy()
+        idx_origem = pares['_idx_origem'].fillna(-1).to_numpy(dtype=np.int64)
+        valor = _tomar_linhas(df_origem[[coluna_valor]], idx_origem, com_faltantes=bool((idx_origem < 0).any()))[coluna_valor].to_numpy()
+        # Mesma ordem de multiplicação do encadeamento: peso do nível * valor que veio do nível anterior
+        for k in range(1, n_niveis):
+            grupo = ancestrais[k][idx_destino]
+            valor = np.where(grupo >= 0, pesos.tabelas[k]["_peso"].to_numpy()[grupo], np.nan) * valor
+        valor = pesos.peso_linha[idx_destino] * valor
+
+        df_ok = _tomar_linhas(df_destino, idx_destino)
+        df_ok["valor_desdobrado"] = valor
+        if n_niveis > 1:
+            grupo = pesos.grupo_linha[pesos.grupo_linha >= 0]
+            erros_niveis.append(self._erro_nivel(pesos, n_niveis - 1, chegada, np.bincount(grupo, minlength=len(chegada)) > 0))
+            erro = erros_niveis[-1][coluna_valor].sum()
+        totais.append((entrada, np.nansum(valor), erro))
+
+        auditoria = pd.DataFrame(totais, columns=["soma_entrada", "soma_desdobrado", "soma_erros"])
+        auditoria.insert(0, "nivel", [" -> ".join([str(pesos.chaves_nivel(k)), str(pesos.chaves_nivel(k + 1))]) for k in range(n_niveis)])
+        for k, linha in auditoria.iterrows():
+            totais_nivel = self._exibir_auditoria(f"HIERÁRQUICO | NÍVEL {k + 1}", linha["soma_entrada"], linha["soma_desdobrado"], linha["soma_erros"],
+                                                  time.perf_counter() - inicio_proc)
+
+        # A auditoria do resultado é a do último nível, como no relatório
+        return ResultadoDesdobramento("hierarquico", df_ok, erros_niveis[0], df_origem[coluna_valor].sum(), totais_nivel,
+                                      (df_ok, erros_niveis, auditoria))
+
+    def _erro_nivel(self, pesos, k, chegada, tem_filho):
+        """Grupos do nível k sem filhos no nível seguinte, com o valor que chegou até eles."""
+        sem_filho = np.flatnonzero(~tem_filho)
+        df_erro = _tomar_linhas(pesos.tabelas[k][pesos.chaves_nivel(k)], sem_filho)
+        df_erro[pesos.coluna_valor] = chegada[sem_filho]
+        return df_erro
+
+    # PARALELO
+    def _desdobrar_paralelo(self, metodo, entradas, args, n_jobs):
+        """
+        Divide as entradas por hash das chaves e roda ``metodo`` em cada partição num pool de
+        processos. As partições trafegam como arquivos Arrow IPC (memory-map nos workers) em vez
+        de DataFrames serializados via pickle. Entradas com chaves None são replicadas para todas
+        as partições. Retorna df_ok na ordem e com o índice do processamento serial (no complexo,
+        a posição no merge) e as posições (na primeira entrada) das linhas com erro.
+        """
+        n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+        pasta = tempfile.mkdtemp(prefix="desdobrador_")
+        try:
+            particoes = [[] for _ in range(n_jobs)]
+            for j, (df, chaves) in enumerate(entradas):
+                if chaves is None:
+                    caminho = os.path.join(pasta, f"entrada{j}.arrow")
+                    pl.from_pandas(df).write_ipc(caminho)
+                    for tarefa in particoes:
+                        tarefa.append(caminho)
+                    continue
+                df = df.reset_index(drop=True)
+                df[_POSICAO] = np.arange(len(df))
+                ids = _id_particao(df, chaves, n_jobs)
+                for i in range(n_jobs):
+                    caminho = os.path.join(pasta, f"entrada{j}_{i}.arrow")
+                    pl.from_pandas(df[ids == i]).write_ipc(caminho)
+                    particoes[i].append(caminho)
+
+            # spawn: fork de um processo com o pool de threads do polars ativo pode travar
+            with self.instrumentacao.etapa("processar_particoes", processos=n_jobs), \
+                    ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futuros = [
+                    pool.submit(_desdobrar_particao, metodo, caminhos, args, os.path.join(pasta, f"saida{i}"))
+                    for i, caminhos in enumerate(particoes)
+                ]
+                saidas = [f.result() for f in futuros]
+
+            df_ok = pd.concat([pl.read_ipc(ok, memory_map=False).to_pandas() for ok, _, _ in saidas], ignore_index=True)
+            if saidas[0][2] is None:
+                df_ok = df_ok.sort_values(_POSICAO, kind="stable").drop(columns=_POSICAO).reset_index(drop=True)
+            else:
+                # Posição global no merge = início das linhas da demanda no merge completo + deslocamento
+                contagens = np.zeros(len(entradas[0][0]), dtype=np.int64)
+                for _, _, contagem in saidas:
+                    contagem = pl.read_ipc(contagem, memory_map=False)
+                    contagens[contagem[_POSICAO].to_numpy()] = contagem["_contagem"].to_numpy()
+                inicio_demanda = np.cumsum(contagens) - contagens
+                df_ok.index = inicio_demanda[df_ok[_POSICAO].to_numpy()] + df_ok[_DESLOCAMENTO].to_numpy()
+                df_ok = df_ok.drop(columns=[_POSICAO, _DESLOCAMENTO]).sort_index(kind="stable")
+            pos_erro = np.sort(np.concatenate([pl.read_ipc(erro, memory_map=False)[_POSICAO].to_numpy() for _, erro, _ in saidas]))
+            return df_ok, pos_erro
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    # ENGINE PANDAS (joins e groupbys sobre chaves codificadas em inteiros)
+    def _classico_pandas(self, df_origem, df_destino, chaves_origem, chaves_comuns, coluna_valor):
+        etapa = self.instrumentacao.etapa
+        with etapa("codificar_chaves"):
+            (cod_origem, cod_destino), (_, nulo_destino) = _codificar_chaves([df_origem, df_destino], chaves_comuns, retornar_nulos=True)
+
+        # Identificar erros (Origem sem par no Destino)
+        with etapa("erros") as evento:
+            valida = np.isin(cod_origem, cod_destino)
+            df_erro = df_origem.reset_index(drop=True)[~valida]
+            evento["linhas"] = len(df_erro)
+
+        # Calcular Pesos no Destino (groupby do pandas descarta chaves nulas)
+        with etapa("pesos"):
+            valor_destino = df_destino[coluna_valor].reset_index(drop=True)
+            soma_destino = valor_destino.groupby(cod_destino).transform('sum').where(~nulo_destino)
+            peso = np.where(soma_destino != 0, valor_destino / soma_destino, 0)
+
+        # Aplicar Desdobramento
+        with etapa("projecao") as evento:
+            pos_valida = np.flatnonzero(valida)
+            pares = pd.DataFrame({'_cod': cod_destino, '_idx_destino': np.arange(len(cod_destino))}).merge(
+                pd.DataFrame({'_cod': cod_origem[pos_valida], '_idx_origem': pos_valida}), on='_cod', how='left'
+            )
+            idx_destino = pares['_idx_destino'].to_numpy()
+            idx_origem = pares['_idx_origem'].fillna(-1).to_numpy(dtype=np.int64)
+            valor_origem = _tomar_linhas(df_origem[[coluna_valor]], idx_origem, com_faltantes=bool((idx_origem < 0).any()))[coluna_valor]
+            evento["linhas"] = len(pares)
+
+        with etapa("montar"):
+            df_ok = _montar_classico(df_origem, df_destino, chaves_origem, chaves_comuns, idx_destino, idx_origem,
+                                     (peso[idx_destino] * valor_origem).to_numpy())
+        return df_ok, df_erro
+
+    def _complexo_pandas(self, df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, longo=True, contar=False):
+        """contar=True retorna também as linhas do merge de cada linha da demanda (usado no paralelo)."""
+        etapa = self.instrumentacao.etapa
+        mapa, fonte_detalhe, erro = self._mapear_complexo(df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor)
 
         # Projeção
-        df_merged = df_demanda.merge(dist_hist[chaves_full + ['fator']], on=chaves_ligacao, how='left')
-        df_merged['valor_desdobrado'] = df_merged[coluna_valor] * df_merged['fator']
+        with etapa("projecao") as evento:
+            idx_demanda = mapa['_idx_demanda'].to_numpy()
+            fator = mapa['fator'].to_numpy()
+            desdobrado = df_demanda[coluna_valor].to_numpy()[idx_demanda] * fator
+            evento["linhas"] = len(mapa)
 
         # Lote Mínimo
-        df_merged = df_merged.merge(df_lote[['Item', 'Lote_Multiplo']], on='Item', how='left').fillna({'Lote_Multiplo': 0})
-        # Regra Lote: < 0.5 vira 0 | entre 0.5 e 1.0 vira Lote
-        df_merged['valor_final'] = np.where(df_merged['valor_desdobrado'] < (0.5 * df_merged['Lote_Multiplo']), 0, df_merged['valor_desdobrado'])
-        cond_lote = (df_merged['valor_desdobrado'] >= (0.5 * df_merged['Lote_Multiplo'])) & (df_merged['valor_desdobrado'] <= df_merged['Lote_Multiplo'])
-        df_merged['valor_final'] = np.where(cond_lote, df_merged['Lote_Multiplo'], df_merged['valor_final'])
+        with etapa("lote"):
+            idx_lote = mapa['_idx_lote'].to_numpy()
+            lote_multiplo = _tomar_linhas(df_lote[['Lote_Multiplo']], idx_lote, com_faltantes=bool((idx_lote < 0).any()))['Lote_Multiplo'].fillna(0).to_numpy()
+            # Regra Lote: < 0.5 vira 0 | entre 0.5 e 1.0 vira Lote
+            final = np.where(desdobrado < (0.5 * lote_multiplo), 0, desdobrado)
+            cond_lote = (desdobrado >= (0.5 * lote_multiplo)) & (desdobrado <= lote_multiplo)
+            final = np.where(cond_lote, lote_multiplo, final)
 
         # Separação
-        self.df_ok = df_merged[df_merged['fator'].notna() & (df_merged['valor_final'] > 0)].copy()
-        self.df_erro = df_demanda[~df_demanda.set_index(chaves_ligacao).index.isin(dist_hist.set_index(chaves_ligacao).index)].copy()
+        with etapa("montar") as evento:
+            manter = ~np.isnan(fator) & (final > 0)
+            idx_hist = mapa['_idx_hist'].to_numpy()
+            df_erro = df_demanda[erro].copy()
+            evento["linhas"] = int(manter.sum())
+            if not longo:
+                return _Projecao(fonte_detalhe, idx_demanda[manter], idx_hist[manter], final[manter]), df_erro
+            df_ok = _montar_complexo(df_demanda, fonte_detalhe, chaves_detalhamento, np.flatnonzero(manter), idx_demanda[manter],
+                                     idx_hist[manter], bool((idx_hist < 0).any()), fator[manter], desdobrado[manter],
+                                     lote_multiplo[manter], final[manter])
+        if contar:
+            return df_ok, df_erro, np.bincount(idx_demanda, minlength=len(df_demanda))
+        return df_ok, df_erro
+
+    def _mapear_complexo(self, df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, how='left'):
+        """
+        Liga demanda -> grupos do histórico -> lote usando códigos inteiros no lugar das chaves.
+        Retorna (mapa, fonte_detalhe, erro): mapa com _idx_demanda, _idx_hist, fator e _idx_lote
+        (-1 quando sem par) na mesma ordem do merge por rótulos; fonte_detalhe é o DataFrame para
+        onde _idx_hist aponta; erro marca as linhas da demanda sem histórico.
+        """
+        etapa = self.instrumentacao.etapa
+        with etapa("share") as evento:
+            if isinstance(df_historico, IndiceShare):
+                fonte_detalhe = df_historico.validar(chaves_ligacao, chaves_detalhamento, coluna_valor).fatores
+                cod_demanda, cod_fonte = _codificar_chaves([df_demanda, fonte_detalhe], chaves_ligacao)
+                grupos = pd.DataFrame({'_lig': cod_fonte, '_idx_hist': np.arange(len(fonte_detalhe)), 'fator': fonte_detalhe['fator'].to_numpy()})
+            else:
+                # Share Histórico: agrupar pelo código de chaves_full dá a mesma ordem do groupby por rótulos
+                fonte_detalhe = df_historico
+                (cod_demanda, cod_hist), (_, nulo_lig) = _codificar_chaves([df_demanda, df_historico], chaves_ligacao, retornar_nulos=True)
+                (cod_det,), (nulo_det,) = _codificar_chaves([df_historico], chaves_detalhamento, retornar_nulos=True)
+                cod_full = _combinar_codigos(cod_hist, cod_det)
+                linhas = np.flatnonzero(~(nulo_lig | nulo_det))
+                agregado = pd.DataFrame({
+                    '_full': cod_full[linhas], '_lig': cod_hist[linhas], '_idx_hist': linhas,
+                    '_soma': df_historico[coluna_valor].to_numpy()[linhas],
+                }).groupby('_full').agg(_lig=('_lig', 'first'), _idx_hist=('_idx_hist', 'first'), _soma=('_soma', 'sum'))
+                soma = pd.Series(np.where(agregado['_soma'] < 0, 0.5, agregado['_soma']))
+                soma_grupo = soma.groupby(agregado['_lig'].to_numpy()).transform('sum')
+                grupos = pd.DataFrame({'_lig': agregado['_lig'].to_numpy(), '_idx_hist': agregado['_idx_hist'].to_numpy(),
+                                       'fator': (soma / soma_grupo.replace(0, 1)).to_numpy()})
+            evento["linhas"] = len(grupos)
+
+        # Projeção
+        with etapa("ligacao") as evento:
+            erro = ~np.isin(cod_demanda, grupos['_lig'].to_numpy())
+            mapa = pd.DataFrame({'_lig': cod_demanda, '_idx_demanda': np.arange(len(cod_demanda))}).merge(grupos, on='_lig', how=how)
+            mapa['_idx_hist'] = mapa['_idx_hist'].fillna(-1).astype(np.int64)
+            evento["linhas"] = len(mapa)
+
+        # Lote Mínimo: Item vem do detalhamento (histórico) ou da demanda
+        with etapa("ligacao_lote"):
+            if 'Item' in chaves_detalhamento:
+                fonte_item, idx_item = fonte_detalhe, mapa['_idx_hist'].to_numpy()
+            else:
+                fonte_item, idx_item = df_demanda, mapa['_idx_demanda'].to_numpy()
+            cod_item, cod_lote = _codificar_chaves([fonte_item, df_lote], ['Item'])
+            mapa['_item'] = np.where(idx_item >= 0, cod_item[idx_item], -1)
+            mapa = mapa.merge(pd.DataFrame({'_item': cod_lote, '_idx_lote': np.arange(len(cod_lote))}), on='_item', how='left')
+            mapa['_idx_lote'] = mapa['_idx_lote'].fillna(-1).astype(np.int64)
+        return mapa, fonte_detalhe, erro
+
+    # ENGINE POLARS (plano lazy só sobre códigos inteiros e valores; rótulos voltam por posição)
+    def _classico_polars(self, df_origem, df_destino, chaves_origem, chaves_comuns, coluna_valor):
+        etapa = self.instrumentacao.etapa
+        with etapa("codificar_chaves"):
+            (cod_origem, cod_destino), (_, nulo_destino) = _codificar_chaves([df_origem, df_destino], chaves_comuns, retornar_nulos=True)
+        origem = _lazy_de_arrays({"_cod": cod_origem, "_valor_origem": df_origem[coluna_valor]}, "_idx_origem")
+        destino = _lazy_de_arrays({"_cod": cod_destino, "_nulo": nulo_destino, "_valor": df_destino[coluna_valor]}, "_idx_destino")
+
+        # Identificar erros (Origem sem par no Destino) - NaN casa com NaN como no merge do pandas
+        chaves_destino = destino.select("_cod").unique()
+        origem_valida = origem.join(chaves_destino, on="_cod", how="semi")
+        erros = origem.join(chaves_destino, on="_cod", how="anti").select("_idx_origem")
 
-        self._exibir_auditoria("COMPLEXO", self.soma_origem_total, self.df_ok['valor_final'].sum(), self.df_erro[coluna_valor].sum(), time.time() - inicio_proc)
+        # Calcular Pesos no Destino (groupby do pandas descarta chaves nulas)
+        soma_destino = pl.when(pl.col("_nulo")).then(None).otherwise(pl.col("_valor").sum().over("_cod"))
+        peso = pl.when(soma_destino == 0).then(0.0).otherwise(pl.col("_valor") / soma_destino)
 
-        if pivotar and not self.df_ok.empty:
-            return self._executar_pivot(chaves_full, 'valor_final'), self.df_erro
-        return self.df_ok, self.df_erro
+        # Aplicar Desdobramento
+        projecao = (
+            destino.with_columns(peso.alias("_peso"))
+            .join(origem_valida, on="_cod", how="left", maintain_order="left_right")
+            .select("_idx_destino", "_idx_origem", (pl.col("_peso") * pl.col("_valor_origem")).alias("valor_desdobrado"))
+        )
+        with etapa("executar_plano") as evento:
+            res, err = pl.collect_all([projecao, erros])
+            evento["linhas"] = len(res)
+
+        with etapa("montar"):
+            df_ok = _montar_classico(df_origem, df_destino, chaves_origem, chaves_comuns, res["_idx_destino"].to_numpy(),
+                                     res["_idx_origem"].fill_null(-1).to_numpy(), res["valor_desdobrado"].to_numpy())
+
+        mascara_erro = np.zeros(len(df_origem), dtype=bool)
+        mascara_erro[err["_idx_origem"].to_numpy()] = True
+        df_erro = df_origem.reset_index(drop=True)[mascara_erro]
+        return df_ok, df_erro
+
+    def _complexo_polars(self, df_demanda, df_historico, df_lote, chaves_ligacao, chaves_detalhamento, coluna_valor, longo=True, contar=False):
+        """contar=True retorna também as linhas do merge de cada linha da demanda (usado no paralelo)."""
+        # Item vem do detalhamento (histórico/índice) ou da demanda
+        item_no_historico = 'Item' in chaves_detalhamento
+        valor = pl.col("_valor")
+
+        # Share Histórico (ordenado pelo código de chaves_full = mesma ordem do groupby do pandas)
+        etapa = self.instrumentacao.etapa
+        with etapa("codificar_chaves"):
+            if isinstance(df_historico, IndiceShare):
+                # Fatores já prontos: o detalhamento volta do próprio índice
+                df_historico = df_historico.validar(chaves_ligacao, chaves_detalhamento, coluna_valor).fatores
+                cod_demanda, cod_hist = _codificar_chaves([df_demanda, df_historico], chaves_ligacao)
+                colunas = {"_lig": cod_hist, "fator": df_historico['fator']}
+                if item_no_historico:
+                    cod_item_hist, cod_item_lote = _codificar_chaves([df_historico, df_lote], ['Item'])
+                    colunas["_item"] = cod_item_hist
+                dist_hist = _lazy_de_arrays(colunas, "_idx_hist")
+            else:
+                (cod_demanda, cod_hist), (_, nulo_lig) = _codificar_chaves([df_demanda, df_historico], chaves_ligacao, retornar_nulos=True)
+                (cod_det,), (nulo_det,) = _codificar_chaves([df_historico], chaves_detalhamento, retornar_nulos=True)
+                colunas = {"_full": _combinar_codigos(cod_hist, cod_det), "_lig": cod_hist, "_nulo": nulo_lig | nulo_det,
+                           "_valor": df_historico[coluna_valor]}
+                if item_no_historico:
+                    cod_item_hist, cod_item_lote = _codificar_chaves([df_historico, df_lote], ['Item'])
+                    colunas["_item"] = cod_item_hist
+                soma_grupo = valor.sum().over("_lig")
+                dist_hist = (
+                    _lazy_de_arrays(colunas, "_idx_hist")
+                    .filter(~pl.col("_nulo"))
+                    .group_by("_full").agg(pl.all().exclude("_valor").first(), valor.sum())
+                    .sort("_full")
+                    .with_columns(pl.when(valor < 0).then(0.5).otherwise(valor).alias("_valor"))
+                    .with_columns((valor / pl.when(soma_grupo == 0).then(1).otherwise(soma_grupo)).alias('fator'))
+                )
+
+        dist_hist = dist_hist.select(["_lig", "_idx_hist", 'fator'] + (["_item"] if item_no_historico else []))
+
+        colunas = {"_lig": cod_demanda, "_valor": df_demanda[coluna_valor]}
+        if not item_no_historico:
+            colunas["_item"], cod_item_lote = _codificar_chaves([df_demanda, df_lote], ['Item'])
+        demanda = _lazy_de_arrays(colunas, "_idx_demanda")
+        lote = _lazy_de_arrays({"_item": cod_item_lote, "Lote_Multiplo": df_lote['Lote_Multiplo']}, "_idx_lote")
+        erros = demanda.join(dist_hist.select("_lig").unique(), on="_lig", how="anti").select("_idx_demanda")
+
+        # Projeção e Lote Mínimo
+        lote_multiplo = pl.col('Lote_Multiplo').fill_null(0)
+        desdobrado = pl.col('valor_desdobrado')
+        merged = (
+            demanda.join(dist_hist, on="_lig", how="left", maintain_order="left_right")
+            .with_columns((valor * pl.col('fator')).alias('valor_desdobrado'))
+            .join(lote, on="_item", how="left", maintain_order="left_right")
+            .with_row_index("_posicao")
+        )
+        # Regra Lote: < 0.5 vira 0 | entre 0.5 e 1.0 vira Lote
+        valor_final = (
+            pl.when((desdobrado >= 0.5 * lote_multiplo) & (desdobrado <= lote_multiplo)).then(lote_multiplo)
+            .when(desdobrado < 0.5 * lote_multiplo).then(0)
+            .otherwise(desdobrado)
+        )
+        ok = (
+            merged.with_columns(valor_final.alias('valor_final'))
+            .filter(pl.col('fator').is_not_null() & (pl.col('valor_final') > 0))
+            .select("_posicao", "_idx_demanda", "_idx_hist", "_idx_lote", 'fator', 'valor_desdobrado', 'valor_final')
+        )
+        # Faltantes no merge completo definem o dtype das colunas (NaN faz upcast no pandas)
+        faltantes = merged.select(
+            pl.col("_idx_hist").is_null().any().alias("hist"),
+            pl.col("_idx_lote").is_null().any().alias("lote"),
+        )
+        consultas = [ok, erros, faltantes] + ([merged.group_by("_idx_demanda").len()] if contar else [])
+        with etapa("executar_plano") as evento:
+            res, err, falt, *contagem = pl.collect_all(consultas)
+            evento["linhas"] = len(res)
+
+        mascara_erro = np.zeros(len(df_demanda), dtype=bool)
+        mascara_erro[err["_idx_demanda"].to_numpy()] = True
+        df_erro = df_demanda[mascara_erro].copy()
+        if not longo:
+            return _Projecao(df_historico, res["_idx_demanda"].to_numpy(), res["_idx_hist"].to_numpy(), res['valor_final'].to_numpy()), df_erro
+
+        with etapa("montar"):
+            idx_lote = res["_idx_lote"].fill_null(-1).to_numpy()
+            lote_multiplo = _tomar_linhas(df_lote[['Lote_Multiplo']], idx_lote, com_faltantes=falt["lote"][0])['Lote_Multiplo'].fillna(0)
+            df_ok = _montar_complexo(df_demanda, df_historico, chaves_detalhamento, res["_posicao"].to_numpy(), res["_idx_demanda"].to_numpy(),
+                                     res["_idx_hist"].to_numpy(), falt["hist"][0], res['fator'].to_numpy(), res['valor_desdobrado'].to_numpy(),
+                                     lote_multiplo.to_numpy(), res['valor_final'].to_numpy())
+        if contar:
+            contagens = np.zeros(len(df_demanda), dtype=np.int64)
+            contagens[contagem[0]["_idx_demanda"].to_numpy()] = contagem[0]["len"].to_numpy()
+            return df_ok, df_erro, contagens
+        return df_ok, df_erro
 
     # AUXILIARES
-    def _executar_pivot(self, chaves_index, col_valor):
-        return self.df_ok.pivot_table(index=chaves_index, columns='AnoMes', values=col_valor, aggfunc='sum').reset_index()
+    @staticmethod
+    def _validar_engine(engine):
+        engine = engine.lower().strip()
+        if engine not in ("pandas", "polars"):
+            raise ValueError(f"Engine '{engine}' não suportada.")
+        return engine
+
+    def _executar_pivot(self, df_ok, chaves_index, col_valor, arquivo=None):
+        return _pivotar_largo([(df_ok, chaves_index, None)], df_ok['AnoMes'].to_numpy(), df_ok[col_valor].to_numpy(), arquivo=arquivo)
+
+    def _guardar(self, resultado):
+        """Guarda o resultado na instância (df_ok, df_erro, auditoria...) e retorna a tupla dos métodos desdobrar_*."""
+        df_ok = resultado.df_ok if resultado.df_longo is None else resultado.df_longo
+        self.df_ok = df_ok if isinstance(df_ok, pd.DataFrame) else None
+        self.df_erro = resultado.df_erro if isinstance(resultado.df_erro, pd.DataFrame) else None
+        self.soma_origem_total = resultado.soma_origem
+        if resultado.auditoria is not None:
+            self.auditoria = resultado.auditoria
+        return resultado.retorno
 
     def _exibir_auditoria(self, modo, v_in, v_out, v_err, tempo):
         taxa_erro = (v_err / v_in) * 100 if v_in > 0 else 0
-        print(f"\n>>> RELATÓRIO MEGA DESDOBRADOR | MODO: {modo}")
-        print(f"{'-'*50}")
-        print(f"Soma Origem:     {v_in:>15.2f}")
-        print(f"Soma Desdobrado: {v_out:>15.2f}")
-        print(f"Soma Erros:      {v_err:>15.2f} ({taxa_erro:.1f}%)")
-        print(f"Status:          {'✅ DENTRO DA MARGEM' if taxa_erro <= 5 else '⚠️ FORA DA MARGEM'}")
-        print(f"Tempo:           {tempo:.2f}s")
-        print(f"{'-'*50}")
-
-    def salvar_resultados(self, caminho_base="outputs", formato="xlsx"):
-        # Implementação de salvamento robusta (semelhante à que você enviou)
-        os.makedirs(caminho_base, exist_ok=True)
-        if formato == "xlsx":
-            self.df_ok.to_excel(f"{caminho_base}/resultado_ok.xlsx", index=False)
-            self.df_erro.to_excel(f"{caminho_base}/resultado_erros.xlsx", index=False)
-        else:
-            self.df_ok.to_csv(f"{caminho_base}/resultado_ok.csv", index=False)
-            self.df_erro.to_csv(f"{caminho_base}/resultado_erros.csv", index=False)
+        self.instrumentacao.registrar("auditoria", modo=modo, origem=float(v_in), desdobrado=float(v_out), erros=float(v_err),
+                                      taxa_erro=float(taxa_erro), tempo_s=tempo)
+        self.instrumentacao.exibir(f"\n>>> RELATÓRIO MEGA DESDOBRADOR | MODO: {modo}")
+        self.instrumentacao.exibir(f"{'-'*50}")
+        self.instrumentacao.exibir(f"Soma Origem:     {v_in:>15.2f}")
+        self.instrumentacao.exibir(f"Soma Desdobrado: {v_out:>15.2f}")
+        self.instrumentacao.exibir(f"Soma Erros:      {v_err:>15.2f} ({taxa_erro:.1f}%)")
+        self.instrumentacao.exibir(f"Status:          {'✅ DENTRO DA MARGEM' if taxa_erro <= 5 else '⚠️ FORA DA MARGEM'}")
+        self.instrumentacao.exibir(f"Tempo:           {tempo:.2f}s")
+        self.instrumentacao.exibir(f"{'-'*50}")
+        return {"origem": v_in, "desdobrado": v_out, "erros": v_err}
+
+    def salvar_resultados(self, caminho_base="outputs", formato="xlsx", em_segundo_plano=None, compressao=None):
+        """
+        Salva df_ok e df_erro ao mesmo tempo e retorna os caminhos. em_segundo_plano=False grava um arquivo
+        de cada vez; True, "thread" ou "process" retornam os Futures na hora (ver aguardar_salvamentos).
+        """
+        return _salvar_resultados({"resultado_ok": self.df_ok, "resultado_erros": self.df_erro}, caminho_base, formato,
+                                  em_segundo_plano, compressao)
+
+
+def _salvar_resultados(saidas, caminho_base, formato, em_segundo_plano, compressao):
+    os.makedirs(caminho_base, exist_ok=True)
+    if formato == "xlsx":
+        extensao, params = "excel", {"sheet_name": "Sheet1"}
+    else:
+        extensao, params = "csv", {"sep": ",", "decimal": "."}
+    # None grava os arquivos em paralelo (threads) e espera; False grava um de cada vez. Os erros são
+    # levantados, não só exibidos
+    modo = em_segundo_plano if em_segundo_plano is not None else "thread"
+    resultados = [
+        salvar_arquivo(df, nome, caminho_base, extensao, compressao=compressao,
+                       em_segundo_plano=modo, levantar_erros=True, **params)
+        for nome, df in saidas.items()
+    ]
+    if not modo or em_segundo_plano:
+        return resultados
+    return aguardar_salvamentos(resultados)
+
+
+class PerfilDataFrame:
+    """
+    Perfil de um DataFrame gerado pelo DataFrameDiagnostics.perfilar: por coluna o tipo, nulos,
+    exemplo, distintos aproximados (HyperLogLog), min/max/média/desvio e quantis (aproximados no
+    Pandas, exatos no Polars). Tipos e textos seguem o padrão do Pandas nas duas engines. Pode ser
+    salvo em json (salvar/carregar) e comparado com o perfil de outra carga (comparar).
+    """
+
+    def __init__(self, nome, linhas, linhas_perfiladas, engine, colunas):
+        self.nome = nome
+        self.linhas = linhas
+        self.linhas_perfiladas = linhas_perfiladas
+        self.engine = engine
+        self.colunas = colunas
+
+    def exibir(self):
+        print(f"\n{'=' * 60}")
+        print(f"🔎 PERFIL: {self.nome}")
+        print(f"{'=' * 60}")
+        print(f"Formato (Linhas, Colunas): {(self.linhas, len(self.colunas))}")
+        if self.linhas_perfiladas != self.linhas:
+            print(f"Amostra: {self.linhas_perfiladas} linhas")
+        with pd.option_context("display.max_columns", None, "display.width", 200):
+            print(self.colunas)
+        print(f"\n{'=' * 60}\n")
+
+    def salvar(self, arquivo):
+        dados = {
+            "nome": self.nome, "linhas": self.linhas, "linhas_perfiladas": self.linhas_perfiladas,
+            "engine": self.engine, "colunas": json.loads(self.colunas.to_json(orient="split")),
+        }
+        with open(arquivo, "w", encoding="utf-8") as f:
+            json.dump(dados, f, ensure_ascii=False, indent=1)
+        return arquivo
+
+    @classmethod
+    def carregar(cls, arquivo):
+        with open(arquivo, encoding="utf-8") as f:
+            dados = json.load(f)
+        split = dados.pop("colunas")
+        colunas = pd.DataFrame(split["data"], index=pd.Index(split["index"]), columns=split["columns"])
+        return cls(colunas=colunas.astype({c: "float64" for c in COLUNAS_PERFIL_NUMERICAS}), **dados)
+
+    def comparar(self, outro, tolerancia=0.05):
+        """
+        Compara coluna a coluna com outro perfil (ex.: carga anterior). Marca em "mudou" colunas
+        novas/removidas, tipo diferente ou variação relativa acima da tolerância em % de nulos
+        (pontos percentuais / 100), distintos ou média.
+        """
+        a, b = self.colunas, outro.colunas
+        comp = pd.DataFrame(index=a.index.union(b.index, sort=False))
+        comp["presente"] = np.select(
+            [comp.index.isin(a.index) & comp.index.isin(b.index), comp.index.isin(a.index)],
+            ["ambos", self.nome], outro.nome)
+        for campo in ("Dtype", "% Nulos", "Distintos (aprox)", "Media"):
+            comp[f"{campo} ({self.nome})"] = a[campo].reindex(comp.index)
+            comp[f"{campo} ({outro.nome})"] = b[campo].reindex(comp.index)
+
+        def variacao(campo):
+            x = a[campo].reindex(comp.index).astype("float64")
+            y = b[campo].reindex(comp.index).astype("float64")
+            return ((y - x).abs() / x.abs().where(x != 0, 1)).fillna(0)
+
+        comp["mudou"] = (
+            (comp["presente"] != "ambos")
+            | (a["Dtype"].reindex(comp.index) != b["Dtype"].reindex(comp.index))
+            | ((b["% Nulos"].reindex(comp.index) - a["% Nulos"].reindex(comp.index)).abs().fillna(0) > tolerancia * 100)
+            | (variacao("Distintos (aprox)") > tolerancia)
+            | (variacao("Media") > tolerancia)
+        )
+        return comp
 
 class DataFrameDiagnostics:
     """
@@ -110,7 +1461,14 @@ class DataFrameDiagnostics:
     def __init__(self):
         pass
 
-    def prints_uteis(self, df: pd.DataFrame, nome: str ="DataFrame"):
+    def prints_uteis(
+        self,
+        df: pd.DataFrame,
+        nome: str = "DataFrame",
+        aproximado: bool = False,
+        engine: str = "pandas",
+        amostra: int | float | None = None
+    ):
         """
         Exibe uma visão geral técnica do DataFrame: Tipos, Nulos e Estatísticas.
 
@@ -120,7 +1478,19 @@ class DataFrameDiagnostics:
             nome (str):
                 Nome para diferenciar nos prints, caso esteja vendo mais de um
                 DataFrame.
+            aproximado (bool):
+                Se True usa o perfil de uma passada (perfilar), bem mais rápido
+                em DataFrames grandes, e retorna o PerfilDataFrame.
+            engine (str):
+                Engine do perfil aproximado ("pandas" ou "polars").
+            amostra (int | float | None):
+                Amostra de linhas do perfil aproximado (int = quantidade, float = fração).
         """
+        if aproximado or engine == "polars" or amostra is not None:
+            perfil = self.perfilar(df, nome, engine=engine, amostra=amostra)
+            perfil.exibir()
+            return perfil
+
         print(f"\n{'=' * 60}")
         print(f"🔎 PRINTS UTEIS: {nome}")
         print(f"{'=' * 60}")
@@ -129,14 +1499,12 @@ class DataFrameDiagnostics:
 
         # Tipagem e Nulos
         print("\n--- 1. Tipagem e Nulos (Amostra) ---")
+        nulos = df.isnull().sum()
         info_df = pd.DataFrame({
             'Dtype': df.dtypes,
-            'Nulos': df.isnull().sum(),
-            '% Nulos': (df.isnull().sum() / len(df)) * 100,
-            'Exemplo Unico': [
-                df[c].dropna().unique()[0] if not df[c].dropna().empty else np.nan
-                for c in df.columns
-            ]
+            'Nulos': nulos,
+            '% Nulos': (nulos / len(df)) * 100,
+            'Exemplo Unico': [_primeiro_valido(df[c]) for c in df.columns]
         })
         print(info_df)
 
@@ -149,6 +1517,60 @@ class DataFrameDiagnostics:
 
         print(f"\n{'=' * 60}\n")
 
+    def perfilar(
+        self,
+        df: pd.DataFrame,
+        nome: str = "DataFrame",
+        engine: str = "pandas",
+        amostra: int | float | None = None,
+        linhas_por_bloco: int = 1_000_000,
+        semente: int = 0
+    ) -> "PerfilDataFrame":
+        """
+        Perfil do DataFrame em uma única passada: tipos, nulos, exemplo, min/max/média/desvio,
+        distintos aproximados (HyperLogLog no Pandas, approx_n_unique no Polars) e quantis
+        (no Pandas aproximados por uma amostra uniforme de até 10.000 valores por coluna, no
+        Polars exatos). Tipos, exemplo e min/max saem no formato do Pandas nas duas engines,
+        então perfis de engines diferentes podem ser comparados.
+
+        Args:
+            df (pd.DataFrame):
+                Dataframe a ser perfilado (Pandas ou Polars).
+            nome (str):
+                Nome do perfil, usado nos prints e na comparação.
+            engine (str):
+                "pandas" (blocos de linhas_por_bloco linhas) ou "polars"
+                (uma única consulta, multithread). Se alguma coluna não converte
+                para Polars o perfil é feito no Pandas (fica em .engine).
+            amostra (int | float | None):
+                Perfila só uma amostra de linhas: int = quantidade, float = fração.
+            linhas_por_bloco (int):
+                Tamanho dos blocos no Pandas.
+            semente (int):
+                Semente da amostragem.
+
+        Returns:
+            PerfilDataFrame: Perfil com a tabela por coluna em .colunas.
+        """
+        if engine not in ("pandas", "polars"):
+            raise ValueError(f"Engine '{engine}' não suportada.")
+        linhas = len(df)
+        if amostra is not None:
+            n = min(linhas, int(amostra * linhas) if isinstance(amostra, float) else int(amostra))
+            df = (df.sample(n, seed=semente) if isinstance(df, pl.DataFrame)
+                  else df.sample(n, random_state=semente))
+
+        if engine == "polars":
+            try:
+                colunas = _perfil_polars(df if isinstance(df, pl.DataFrame) else pl.from_pandas(df))
+            except (TypeError, pl.exceptions.PolarsError, pa.ArrowException) as e:
+                # Colunas object com tipos misturados não convertem para Polars
+                print(f"Perfil no Polars não foi possível ({e}), usando Pandas.")
+                engine = "pandas"
+        if engine == "pandas":
+            colunas = _perfil_pandas(df.to_pandas() if isinstance(df, pl.DataFrame) else df, linhas_por_bloco, semente)
+        return PerfilDataFrame(nome, linhas, len(df), engine, colunas)
+
     def diagnosticar_merge(
         self,
         df_esq: pd.DataFrame,
@@ -156,18 +1578,25 @@ class DataFrameDiagnostics:
         chave_esq: list,
         chave_dir: list | None = None,
         nome_esq: str = "Esq",
-        nome_dir: str = "Dir"
-    ):
+        nome_dir: str = "Dir",
+        engine: str = "pandas",
+        limite: int | None = None,
+        amostrar: bool = False,
+        exibir: bool = True
+    ) -> dict:
         """
         Analisa possíveis razões de falha em um merge entre dois DataFrames.
-        Verifica: Tipos, espaços em branco, case e interseção de chaves.
-        Mostra: Todos os dados que não batem nas colunas
+        Verifica: Tipos, espaços em branco, case, chave composta e interseção de chaves.
+        Mostra: Os dados que não batem nas colunas e normalizações que resolveriam
+
+        Todas as contagens saem de value_counts / group_by (uma passada por coluna),
+        as comparações são feitas só sobre os valores únicos.
 
         Args:
             df_esq (pd.DataFrame):
-                DataFrame a "esquerda" no merge
+                DataFrame a "esquerda" no merge (Pandas ou Polars)
             df_dir (pd.DataFrame):
-                DataFrame a "direita" no merge
+                DataFrame a "direita" no merge (Pandas ou Polars)
             chave_esq (list):
                 Lista com colunas que serão a chave no merge, caso
                 as colunas tenha nomes diferentes essa lista se refere
@@ -180,105 +1609,390 @@ class DataFrameDiagnostics:
                 Nome para identificação nos prints
             nome_dir (str):
                 Nome para identificação nos prints
+            engine (str):
+                "pandas" ou "polars" para as contagens (Polars é mais
+                rápido em tabelas grandes)
+            limite (int | None):
+                Máximo de valores sem match listados por coluna/lado
+                (None lista todos). Os totais continuam completos.
+            amostrar (bool):
+                Com limite, lista uma amostra aleatória em vez dos
+                valores mais frequentes.
+            exibir (bool):
+                Se False não imprime nada, só retorna os resultados.
+
+        Returns:
+            dict: DataFrames "tipos", "resumo", "viloes", "composta" e "sugestoes".
         """
         if chave_dir is None:
             chave_dir = chave_esq
+        if engine not in ("pandas", "polars"):
+            raise ValueError(f"Engine '{engine}' não suportada.")
+        saida = print if exibir else (lambda *args, **kwargs: None)
 
-        print(f"\n{'=' * 60}")
-        print(f"DIAGNÓSTICO DE MERGE: {nome_esq} vs {nome_dir}")
-        print(f"Chaves: '{chave_esq}' (Esq) vs '{chave_dir}' (Dir)")
-        print(f"{'=' * 60}")
+        saida(f"\n{'=' * 60}")
+        saida(f"DIAGNÓSTICO DE MERGE: {nome_esq} vs {nome_dir}")
+        saida(f"Chaves: '{chave_esq}' (Esq) vs '{chave_dir}' (Dir)")
+        saida(f"{'=' * 60}")
 
         # Checagem de Tipagem
         # Converter para lista se for string
-        chaves_esq = [chave_esq] if isinstance(chave_esq, str) else chave_esq
-        chaves_dir = [chave_dir] if isinstance(chave_dir, str) else chave_dir
+        chaves_esq = [chave_esq] if isinstance(chave_esq, str) else list(chave_esq)
+        chaves_dir = [chave_dir] if isinstance(chave_dir, str) else list(chave_dir)
+        pares = list(zip(chaves_esq, chaves_dir))
 
-        print("\n1. Comparação de Tipos:")
-        tipos_match = True
-        for col_esq, col_dir in zip(chaves_esq, chaves_dir):
+        saida("\n1. Comparação de Tipos:")
+        linhas_tipos = []
+        for col_esq, col_dir in pares:
             type_esq = df_esq[col_esq].dtype
             type_dir = df_dir[col_dir].dtype
-            match_str = "✅" if type_esq == type_dir else "⚠️"
-            print(f"   {match_str} {col_esq:20} ({type_esq}) vs {col_dir:20} ({type_dir})")
-            if type_esq != type_dir:
-                tipos_match = False
-                if 'int' in str(type_esq) and 'obj' in str(type_dir):
-                    print(f"      -> Dica: '{col_dir}' é texto e '{col_esq}' é inteiro.")
-
-        if tipos_match:
-            print("   ✅ Todos os tipos coincidem.")
+            iguais = type_esq == type_dir
+            linhas_tipos.append((col_esq, col_dir, str(type_esq), str(type_dir), iguais))
+            saida(f"   {'✅' if iguais else '⚠️'} {col_esq:20} ({type_esq}) vs {col_dir:20} ({type_dir})")
+            if not iguais and 'int' in str(type_esq).lower() and str(type_dir) in ('object', 'String', 'str'):
+                saida(f"      -> Dica: '{col_dir}' é texto e '{col_esq}' é inteiro.")
+        tipos = pd.DataFrame(linhas_tipos, columns=["coluna_esq", "coluna_dir", "tipo_esq", "tipo_dir", "iguais"])
+        if tipos["iguais"].all():
+            saida("   ✅ Todos os tipos coincidem.")
         else:
-            print("   ⚠️ ALERTA: Há diferenças de tipo. O merge pode falhar.")
-
-        # Análise de Conteúdo (Amostra)
-        # Para múltiplas colunas, vamos fazer análise por coluna
-        print("\n2. Análise de Valores Únicos:")
-        total_match = 0
-        
-        for col_esq, col_dir in zip(chaves_esq, chaves_dir):
-            set_esq = set(df_esq[col_esq].dropna().unique())
-            set_dir = set(df_dir[col_dir].dropna().unique())
-            interseccao = set_esq.intersection(set_dir)
-            
-            qtd_esq = len(set_esq)
-            qtd_dir = len(set_dir)
-            qtd_match = len(interseccao)
-            total_match += qtd_match
-            
-            print(f"\n   Coluna '{col_esq}' vs '{col_dir}':")
-            print(f"    - Únicos em {nome_esq}: {qtd_esq}")
-            print(f"    - Únicos em {nome_dir}: {qtd_dir}")
-            print(f"    - 🔗 Chaves em Comum: {qtd_match}")
-            
+            saida("   ⚠️ ALERTA: Há diferenças de tipo. O merge pode falhar.")
+
+        # Uma contagem por coluna: daqui para frente tudo é feito sobre os únicos
+        with INSTRUMENTACAO.etapa("contar_valores"):
+            contagens = [
+                (_contar_valores(df_esq, col_esq, engine), _contar_valores(df_dir, col_dir, engine))
+                for col_esq, col_dir in pares
+            ]
+
+        saida("\n2. Análise de Valores Únicos:")
+        linhas_resumo, viloes = [], []
+        for (col_esq, col_dir), (vc_esq, vc_dir) in zip(pares, contagens):
+            em_dir = vc_esq.index.isin(vc_dir.index)
+            em_esq = vc_dir.index.isin(vc_esq.index)
+            qtd_esq, qtd_dir, qtd_match = len(vc_esq), len(vc_dir), int(em_dir.sum())
+            linhas_resumo.append({
+                "coluna_esq": col_esq, "coluna_dir": col_dir,
+                "unicos_esq": qtd_esq, "unicos_dir": qtd_dir, "em_comum": qtd_match,
+                "sem_match_esq": qtd_esq - qtd_match, "sem_match_dir": int((~em_esq).sum()),
+                "linhas_sem_match_esq": int(vc_esq[~em_dir].sum()),
+                "linhas_sem_match_dir": int(vc_dir[~em_esq].sum()),
+                "com_espacos_esq": _contar_espacos(vc_esq.index),
+                "com_espacos_dir": _contar_espacos(vc_dir.index),
+            })
+            viloes.append(_listar_viloes(vc_esq[~em_dir], nome_esq, col_esq, limite, amostrar))
+            viloes.append(_listar_viloes(vc_dir[~em_esq], nome_dir, col_dir, limite, amostrar))
+
+            saida(f"\n   Coluna '{col_esq}' vs '{col_dir}':")
+            saida(f"    - Únicos em {nome_esq}: {qtd_esq}")
+            saida(f"    - Únicos em {nome_dir}: {qtd_dir}")
+            saida(f"    - 🔗 Chaves em Comum: {qtd_match}")
             if qtd_match == 0:
-                print(f"    ❌ CRÍTICO: Nenhuma chave corresponde em '{col_esq}'!")
+                saida(f"    ❌ CRÍTICO: Nenhuma chave corresponde em '{col_esq}'!")
             elif qtd_match < min(qtd_esq, qtd_dir) * 0.1:
-                print(f"    ⚠️ ALERTA: Menos de 10% das chaves correspondem em '{col_esq}'.")
-
-        # Detetive de Espaços (Whitespace)
-        print("\n3. Investigação de Strings (Possível erro de espaço):")
-        for col_esq, col_dir in zip(chaves_esq, chaves_dir):
-            if df_esq[col_esq].dtype == 'O' or df_dir[col_dir].dtype == 'O':
-                sample_esq = str(df_esq[col_esq].dropna().iloc[0]) if len(df_esq[col_esq].dropna()) > 0 else ""
-                sample_dir = str(df_dir[col_dir].dropna().iloc[0]) if len(df_dir[col_dir].dropna()) > 0 else ""
-                
-                has_space = (len(sample_esq.strip()) != len(sample_esq) or 
-                            len(sample_dir.strip()) != len(sample_dir))
-                
-                if has_space:
-                    print(f"   ⚠️ '{col_esq}': '{sample_esq}' (len={len(sample_esq)}) - Detectado espaço!")
-                    print(f"   ⚠️ '{col_dir}': '{sample_dir}' (len={len(sample_dir)}) - Detectado espaço!")
-                else:
-                    print(f"   ✅ '{col_esq}' e '{col_dir}': Sem espaços detectados.")
+                saida(f"    ⚠️ ALERTA: Menos de 10% das chaves correspondem em '{col_esq}'.")
+        resumo = pd.DataFrame(linhas_resumo)
+        viloes = pd.concat(viloes, ignore_index=True)
 
-        # Identificar os Vilões (valores que não fazem match)
-        print("\n4. 🔍 Valores que NÃO vão fazer match (Os Vilões):")
-        for col_esq, col_dir in zip(chaves_esq, chaves_dir):
-            set_esq = set(df_esq[col_esq].dropna().unique())
-            set_dir = set(df_dir[col_dir].dropna().unique())
-            
-            viloes_esq = set_esq - set_dir  # Estão em esq mas não em dir
-            viloes_dir = set_dir - set_esq  # Estão em dir mas não em esq
-            
-            print(f"\n   📍 Coluna '{col_esq}':")
-            
-            if viloes_esq:
-                print(f"      ❌ Em {nome_esq} mas NÃO em {nome_dir} ({len(viloes_esq)} valores):")
-                # Mostra todos os casos
-                for valor in list(viloes_esq)[:]: # <- Caso queira que apareça menos inserir valor a direita 
-                    qtd_ocorr = len(df_esq[df_esq[col_esq] == valor])
-                    print(f"         - {valor} ({qtd_ocorr}x)")
+        # Detetive de Espaços (Whitespace), sobre todos os valores únicos
+        saida("\n3. Investigação de Strings (Possível erro de espaço):")
+        for linha in linhas_resumo:
+            if linha["com_espacos_esq"] or linha["com_espacos_dir"]:
+                for lado in ("esq", "dir"):
+                    if linha[f"com_espacos_{lado}"]:
+                        saida(f"   ⚠️ '{linha[f'coluna_{lado}']}': {linha[f'com_espacos_{lado}']} valores com espaço nas pontas - Detectado espaço!")
             else:
-                print(f"      ✅ Todos os valores de {nome_esq} existem em {nome_dir}")
-            
-            if viloes_dir:
-                print(f"      ❌ Em {nome_dir} mas NÃO em {nome_esq} ({len(viloes_dir)} valores):")
-                # Mostra todos os casos
-                for valor in list(viloes_dir)[:]: # <- Caso queira que apareça menos inserir valor a direita
-                    qtd_ocorr = len(df_dir[df_dir[col_dir] == valor])
-                    print(f"         - {valor} ({qtd_ocorr}x)")
+                saida(f"   ✅ '{linha['coluna_esq']}' e '{linha['coluna_dir']}': Sem espaços detectados.")
+
+        # Identificar os Vilões (valores que não fazem match)
+        saida("\n4. 🔍 Valores que NÃO vão fazer match (Os Vilões):")
+        for linha in linhas_resumo:
+            saida(f"\n   📍 Coluna '{linha['coluna_esq']}':")
+            for lado, outro, coluna, chave_total in (
+                (nome_esq, nome_dir, linha["coluna_esq"], "sem_match_esq"),
+                (nome_dir, nome_esq, linha["coluna_dir"], "sem_match_dir"),
+            ):
+                if linha[chave_total]:
+                    lista = viloes[(viloes["lado"] == lado) & (viloes["coluna"] == coluna)]
+                    extra = f", listando {len(lista)}" if len(lista) < linha[chave_total] else ""
+                    saida(f"      ❌ Em {lado} mas NÃO em {outro} ({linha[chave_total]} valores{extra}):")
+                    for valor, qtd in zip(lista["valor"], lista["qtd"]):
+                        saida(f"         - {valor} ({qtd}x)")
+                else:
+                    saida(f"      ✅ Todos os valores de {lado} existem em {outro}")
+
+        # Chave composta: anti-join sobre as combinações únicas de cada lado
+        composta = pd.DataFrame(columns=["lado", *chaves_esq, "qtd", "so_combinacao"])
+        if len(pares) > 1:
+            saida("\n5. 🧩 Chave composta:")
+            with INSTRUMENTACAO.etapa("contar_combinacoes"):
+                comb_esq = _contar_combinacoes(df_esq, chaves_esq, engine)
+                comb_dir = _contar_combinacoes(df_dir, chaves_dir, engine).set_axis([*chaves_esq, "qtd"], axis=1)
+            try:
+                cruzado = comb_esq.merge(comb_dir, on=chaves_esq, how="outer", suffixes=("_esq", "_dir"), indicator=True)
+            except ValueError as e:
+                saida(f"   ⚠️ Não foi possível cruzar as combinações (tipos diferentes): {e}")
             else:
-                print(f"      ✅ Todos os valores de {nome_dir} existem em {nome_esq}")
+                partes = []
+                for lado, origem, indice in ((nome_esq, "left_only", 0), (nome_dir, "right_only", 1)):
+                    sem_par = cruzado.loc[cruzado["_merge"] == origem, chaves_esq].reset_index(drop=True)
+                    sem_par["qtd"] = cruzado.loc[cruzado["_merge"] == origem, f"qtd_{('esq', 'dir')[indice]}"].astype("int64").to_numpy()
+                    # Todas as colunas existem do outro lado, só a combinação não
+                    so_comb = np.ones(len(sem_par), dtype=bool)
+                    for col, contagem in zip(chaves_esq, contagens):
+                        so_comb &= sem_par[col].isin(contagem[1 - indice].index).to_numpy()
+                    sem_par["so_combinacao"] = so_comb
+                    sem_par.insert(0, "lado", lado)
+                    outro = nome_dir if indice == 0 else nome_esq
+                    saida(f"   ❌ Combinações em {lado} mas NÃO em {outro}: {len(sem_par)} "
+                          f"({int(sem_par['qtd'].sum())} linhas, {int(so_comb.sum())} com todos os valores existentes em {outro})")
+                    partes.append(_limitar(sem_par, limite, amostrar))
+                composta = pd.concat(partes, ignore_index=True)
+                if exibir and not composta.empty:
+                    saida(composta.to_string(index=False))
+
+        # Normalizações que resolveriam os vilões, calculadas em lote sobre os únicos
+        saida("\n6. 💡 Sugestões de normalização (acumuladas):")
+        linhas_sugestoes = []
+        for (col_esq, col_dir), (vc_esq, vc_dir) in zip(pares, contagens):
+            sem_esq = vc_esq[~vc_esq.index.isin(vc_dir.index)]
+            sem_dir = vc_dir[~vc_dir.index.isin(vc_esq.index)]
+            if sem_esq.empty and sem_dir.empty:
+                continue
+            for (nivel, norm_esq), (_, norm_dir) in zip(_normalizacoes_chave(vc_esq.index), _normalizacoes_chave(vc_dir.index)):
+                resolve_esq = ~vc_esq.index.isin(vc_dir.index) & norm_esq.isin(norm_dir)
+                resolve_dir = ~vc_dir.index.isin(vc_esq.index) & norm_dir.isin(norm_esq)
+                linhas_sugestoes.append({
+                    "coluna_esq": col_esq, "coluna_dir": col_dir, "normalizacao": nivel,
+                    "valores_resolvidos_esq": int(resolve_esq.sum()),
+                    "linhas_resolvidas_esq": int(vc_esq[resolve_esq].sum()),
+                    "valores_resolvidos_dir": int(resolve_dir.sum()),
+                    "linhas_resolvidas_dir": int(vc_dir[resolve_dir].sum()),
+                    "exemplo": _exemplo_normalizacao(vc_esq, norm_esq, resolve_esq, vc_dir, norm_dir),
+                })
+        sugestoes = pd.DataFrame(linhas_sugestoes, columns=[
+            "coluna_esq", "coluna_dir", "normalizacao", "valores_resolvidos_esq", "linhas_resolvidas_esq",
+            "valores_resolvidos_dir", "linhas_resolvidas_dir", "exemplo",
+        ])
+        sugestoes = sugestoes[(sugestoes["valores_resolvidos_esq"] > 0) | (sugestoes["valores_resolvidos_dir"] > 0)]
+        if sugestoes.empty:
+            saida("   Nenhuma normalização simples (tipo/espaço/caixa/zeros) resolve os vilões.")
+        else:
+            saida(sugestoes.to_string(index=False))
+
+        saida(f"{'=' * 60}\n")
+        return {"tipos": tipos, "resumo": resumo, "viloes": viloes, "composta": composta, "sugestoes": sugestoes.reset_index(drop=True)}
+
+
+# Normalizações testadas nas sugestões do diagnosticar_merge, cada uma inclui as anteriores
+NORMALIZACOES_CHAVE = ("tipo", "strip", "caixa", "zeros")
+
+def _contar_valores(df, coluna, engine):
+    """value_counts sem nulos de uma coluna (Series índice=valor), em Pandas ou Polars."""
+    if engine == "polars":
+        try:
+            serie = df[coluna] if isinstance(df, pl.DataFrame) else pl.from_pandas(df[coluna])
+        except (TypeError, pl.exceptions.PolarsError, pa.ArrowException):
+            # Coluna object com tipos misturados: o Polars não converte
+            serie = None
+        if serie is not None:
+            contagem = serie.drop_nulls().value_counts(name="qtd")
+            return pd.Series(contagem["qtd"].to_numpy(), index=pd.Index(contagem[serie.name].to_list()), name="qtd")
+    serie = df[coluna].to_pandas() if isinstance(df, pl.DataFrame) else df[coluna]
+    return serie.value_counts(dropna=True).rename("qtd").rename_axis(None)
+
+def _contar_combinacoes(df, colunas, engine):
+    """Combinações únicas (sem nulos) das colunas com a quantidade de linhas de cada uma."""
+    if engine == "polars" or isinstance(df, pl.DataFrame):
+        try:
+            base = df.select(colunas) if isinstance(df, pl.DataFrame) else pl.from_pandas(df[colunas])
+            return base.drop_nulls().group_by(colunas).len(name="qtd").to_pandas()
+        except (TypeError, pl.exceptions.PolarsError, pa.ArrowException):
+            if isinstance(df, pl.DataFrame):
+                raise
+    return df.groupby(colunas, dropna=True, sort=False, observed=True).size().rename("qtd").reset_index()
+
+def _limitar(df, limite, amostrar):
+    if limite is None or len(df) <= limite:
+        return df
+    return df.sample(limite, random_state=0) if amostrar else df.head(limite)
+
+def _listar_viloes(contagem, lado, coluna, limite, amostrar):
+    viloes = pd.DataFrame({"lado": lado, "coluna": coluna, "valor": contagem.index, "qtd": contagem.to_numpy()})
+    return _limitar(viloes.sort_values("qtd", ascending=False, kind="stable"), limite, amostrar)
+
+def _contar_espacos(valores):
+    textos = pd.Series(valores[[isinstance(v, str) for v in valores]], dtype=object)
+    return int((textos.str.len() != textos.str.strip().str.len()).sum())
+
+def _exemplo_normalizacao(vc_esq, norm_esq, resolve_esq, vc_dir, norm_dir):
+    """Valor sem match mais frequente que a normalização resolve e o valor do outro lado que ele encontra."""
+    if not resolve_esq.any():
+        return None
+    qtd = vc_esq.to_numpy()[resolve_esq]
+    candidatos = np.flatnonzero(qtd == qtd.max())
+    textos = norm_esq[resolve_esq]
+    escolhido = candidatos[np.argmin(textos[candidatos])] if len(candidatos) > 1 else candidatos[0]
+    origem = vc_esq.index[resolve_esq][[escolhido]].tolist()[0]
+    destino = vc_dir.index[[norm_dir.get_indexer_for([textos[escolhido]])[0]]].tolist()[0]
+    return f"{origem!r} ~ {destino!r}"
+
+def _normalizacoes_chave(valores):
+    """Gera (nível, valores normalizados) de forma acumulada: tipo -> strip -> caixa -> zeros."""
+    # tipo: tudo vira texto, 10.0 e "10" passam a ser iguais
+    norm = pc.replace_substring_regex(pa.array(pd.Index(valores).astype(str), type=pa.string()), r"\.0$", "")
+    for nivel in NORMALIZACOES_CHAVE:
+        match nivel:
+            case "strip":
+                norm = pc.utf8_trim_whitespace(norm)
+            case "caixa":
+                norm = pc.utf8_upper(norm)
+            case "zeros":
+                norm = pc.replace_substring_regex(norm, r"^0+(.)", r"\1")
+        yield nivel, pd.Index(norm.to_numpy(zero_copy_only=False), dtype=object)
+
+
+# Colunas do perfil (PerfilDataFrame.colunas), as numéricas são float
+COLUNAS_PERFIL = ["Dtype", "Nulos", "% Nulos", "Exemplo Unico", "Distintos (aprox)", "Min", "Max",
+                  "Media", "Desvio", "25%", "50%", "75%"]
+COLUNAS_PERFIL_NUMERICAS = ["% Nulos", "Media", "Desvio", "25%", "50%", "75%"]
+QUANTIS_PERFIL = (0.25, 0.5, 0.75)
+AMOSTRA_QUANTIS = 10_000
+BITS_HLL = 14
+
+def _perfil_pandas(df, linhas_por_bloco, semente):
+    """Perfil em uma passada: cada bloco de linhas é lido uma vez e atualiza o estado de todas as colunas."""
+    rng = np.random.default_rng(semente)
+    estados = {c: _EstadoColuna(df[c].dtype) for c in df.columns}
+    for inicio in range(0, len(df), linhas_por_bloco):
+        bloco = df.iloc[inicio:inicio + linhas_por_bloco]
+        for c, estado in estados.items():
+            estado.atualizar(bloco[c], rng)
+    return pd.DataFrame([estado.resultado(len(df)) for estado in estados.values()],
+                        index=df.columns, columns=COLUNAS_PERFIL)
+
+class _EstadoColuna:
+    """Estado acumulado de uma coluna no perfil por blocos (mesclável entre blocos)."""
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.numerica = pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+        self.data = pd.api.types.is_datetime64_any_dtype(dtype)
+        self.nulos = 0
+        self.exemplo = None
+        self.registros = np.zeros(1 << BITS_HLL, dtype=np.uint8)
+        self.minimo = self.maximo = None
+        # n, média e soma dos quadrados dos desvios (fórmula de Chan para juntar blocos)
+        self.n, self.media, self.m2 = 0, 0.0, 0.0
+        self.chaves = np.empty(0)
+        self.amostra = np.empty(0)
+
+    def atualizar(self, serie, rng):
+        nulo = serie.isna().to_numpy()
+        self.nulos += int(nulo.sum())
+        validos = serie[~nulo] if nulo.any() else serie
+        if validos.empty:
+            return
+        if self.exemplo is None:
+            self.exemplo = validos.iloc[0]
+        _hll_atualizar(self.registros, pd.util.hash_pandas_object(validos, index=False).to_numpy())
+        if self.data:
+            self.minimo = validos.min() if self.minimo is None else min(self.minimo, validos.min())
+            self.maximo = validos.max() if self.maximo is None else max(self.maximo, validos.max())
+        if not self.numerica:
+            return
+        valores = validos.to_numpy(dtype="float64")
+        minimo, maximo = valores.min(), valores.max()
+        self.minimo = minimo if self.minimo is None else min(self.minimo, minimo)
+        self.maximo = maximo if self.maximo is None else max(self.maximo, maximo)
+        n, media = len(valores), valores.mean()
+        m2 = ((valores - media) ** 2).sum()
+        total = self.n + n
+        delta = media - self.media
+        self.m2 += m2 + delta ** 2 * self.n * n / total
+        self.media += delta * n / total
+        self.n = total
+        # Amostra uniforme: fica com os AMOSTRA_QUANTIS valores de menor chave aleatória
+        chaves = np.concatenate([self.chaves, rng.random(n)])
+        amostra = np.concatenate([self.amostra, valores])
+        if len(chaves) > AMOSTRA_QUANTIS:
+            manter = np.argpartition(chaves, AMOSTRA_QUANTIS)[:AMOSTRA_QUANTIS]
+            chaves, amostra = chaves[manter], amostra[manter]
+        self.chaves, self.amostra = chaves, amostra
+
+    def resultado(self, linhas):
+        quantis = (np.quantile(self.amostra, QUANTIS_PERFIL) if len(self.amostra)
+                   else [np.nan] * len(QUANTIS_PERFIL))
+        return [
+            str(self.dtype), self.nulos, self.nulos / linhas * 100 if linhas else np.nan,
+            None if self.exemplo is None else str(self.exemplo), _hll_estimar(self.registros),
+            None if self.minimo is None else (float(self.minimo) if self.numerica else str(self.minimo)),
+            None if self.maximo is None else (float(self.maximo) if self.numerica else str(self.maximo)),
+            self.media if self.n else np.nan,
+            np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.nan,
+            *(float(q) for q in quantis),
+        ]
+
+def _perfil_polars(df):
+    """Perfil em uma única consulta do Polars (distintos com approx_n_unique, quantis exatos)."""
+    # Tipos como o Pandas os veria, para os perfis das duas engines serem comparáveis
+    tipos_pandas = df.head(0).to_pandas().dtypes
+    expressoes = []
+    for c, tipo in df.schema.items():
+        col = pl.col(c)
+        # approx_n_unique não aceita categóricas: os distintos saem do texto
+        distintos = col.cast(pl.String) if isinstance(tipo, (pl.Categorical, pl.Enum)) else col
+        expressoes += [col.null_count().alias(f"{c}\0nulos"), col.drop_nulls().first().alias(f"{c}\0exemplo"),
+                       distintos.approx_n_unique().alias(f"{c}\0distintos")]
+        # Mesmas colunas com min/max do perfil no Pandas: numéricas e datas
+        if tipo.is_numeric() or isinstance(tipo, (pl.Datetime, pl.Date)):
+            expressoes += [col.min().alias(f"{c}\0min"), col.max().alias(f"{c}\0max")]
+        if tipo.is_numeric():
+            expressoes += [col.mean().alias(f"{c}\0media"), col.std().alias(f"{c}\0desvio")]
+            expressoes += [col.quantile(q, "linear").alias(f"{c}\0{q}") for q in QUANTIS_PERFIL]
+    resultado = df.select(expressoes).row(0, named=True) if expressoes else {}
+    linhas = []
+    for c, tipo in df.schema.items():
+        r = lambda campo: resultado.get(f"{c}\0{campo}")
+        converter = float if tipo.is_numeric() else _texto_perfil
+        linhas.append([
+            str(tipos_pandas[c]), r("nulos"), r("nulos") / len(df) * 100 if len(df) else np.nan,
+            _texto_perfil(r("exemplo")), r("distintos"),
+            None if r("min") is None else converter(r("min")), None if r("max") is None else converter(r("max")),
+            *(np.nan if r(campo) is None else r(campo) for campo in ("media", "desvio", *QUANTIS_PERFIL)),
+        ])
+    return pd.DataFrame(linhas, index=pd.Index(df.columns), columns=COLUNAS_PERFIL)
+
+def _texto_perfil(valor):
+    """Valor do Polars como texto igual ao do perfil no Pandas (datas como Timestamp/Timedelta)."""
+    if valor is None:
+        return None
+    if isinstance(valor, datetime.date):
+        return str(pd.Timestamp(valor))
+    if isinstance(valor, datetime.timedelta):
+        return str(pd.Timedelta(valor))
+    return str(valor)
+
+def _hll_atualizar(registros, hashes):
+    """Atualiza os registros do HyperLogLog com hashes uint64."""
+    indice = (hashes >> np.uint64(64 - BITS_HLL)).astype(np.intp)
+    # Bits restantes alinhados à esquerda, com um bit sentinela para limitar o rho
+    resto = (hashes << np.uint64(BITS_HLL)) | np.uint64(1 << (BITS_HLL - 1))
+    alto = (resto >> np.uint64(32)).astype(np.float64)
+    baixo = (resto & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp dá o número de bits exato (valores de 32 bits cabem no float64)
+    bits = np.where(alto > 0, 32 + np.frexp(alto)[1], np.frexp(baixo)[1])
+    np.maximum.at(registros, indice, (65 - bits).astype(np.uint8))
+
+def _hll_estimar(registros):
+    m = len(registros)
+    estimativa = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -registros.astype(np.int64)))
+    zeros = int((registros == 0).sum())
+    if estimativa <= 2.5 * m and zeros:
+        # Correção para poucas chaves (linear counting)
+        estimativa = m * np.log(m / zeros)
+    return int(round(estimativa))
 
-        print(f"{'=' * 60}\n")
\ No newline at end of file
+def _primeiro_valido(serie):
+    """Primeiro valor não nulo (o mesmo que dropna().unique()[0]) sem copiar a coluna."""
+    validos = serie.notna().to_numpy()
+    return serie.iloc[validos.argmax()] if validos.any() else np.nan
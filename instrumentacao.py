@@ -0,0 +1,267 @@
+import io
+import os
+import json
+import time
+import logging
+import cProfile
+import pstats
+import functools
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+import psutil
+
+# Etapa em execução no contexto atual (para montar o caminho "processo/etapa/subetapa")
+_ETAPA_ATUAL = contextvars.ContextVar("etapa_atual", default=None)
+
+
+class Instrumentacao:
+    """
+    Registra etapas (tempo com perf_counter, linhas, RSS) do MegaDesdobrador, carregar_arquivo e
+    salvar_arquivo e envia cada evento (dict) para os destinos configurados: DestinoLogging,
+    DestinoJsonl ou qualquer função que receba o evento. Sem destinos nada é medido.
+
+    silencioso=True desliga os prints de progresso/auditoria (os eventos continuam saindo).
+    memoria: "delta" (RSS no início/fim da etapa) ou "pico" (amostra o RSS numa thread durante
+    a etapa, mais caro). perfil: "cprofile" ou "tracemalloc" nas etapas de etapas_perfil (None =
+    todas), o resultado vai no próprio evento. Etapas que rodam em outros processos (n_jobs,
+    salvamento "process") só aparecem pelo tempo total da etapa que as disparou.
+    """
+
+    def __init__(self, destinos=None, silencioso=False, memoria="delta", perfil=None, etapas_perfil=None, linhas_perfil=20):
+        self.destinos = []
+        self.configurar(destinos, silencioso, memoria, perfil, etapas_perfil, linhas_perfil)
+
+    def configurar(self, destinos=None, silencioso=False, memoria="delta", perfil=None, etapas_perfil=None, linhas_perfil=20):
+        if memoria not in ("delta", "pico"):
+            raise ValueError(f"Modo de memória '{memoria}' não suportado.")
+        if perfil not in (None, "cprofile", "tracemalloc"):
+            raise ValueError(f"Perfil '{perfil}' não suportado.")
+        self.destinos = list(destinos or [])
+        self.silencioso = silencioso
+        self.memoria = memoria
+        self.perfil = perfil
+        self.etapas_perfil = None if etapas_perfil is None else set(etapas_perfil)
+        self.linhas_perfil = linhas_perfil
+        self._perfilando = threading.Lock()
+        self._processo = psutil.Process()
+        return self
+
+    @property
+    def ativa(self):
+        return bool(self.destinos)
+
+    def exibir(self, *args, **kwargs):
+        """print que respeita o modo silencioso."""
+        if not self.silencioso:
+            print(*args, **kwargs)
+
+    def registrar(self, nome, **dados):
+        """Evento pontual (sem tempo), ex.: os totais da auditoria."""
+        if self.ativa:
+            pai = _ETAPA_ATUAL.get()
+            self._emitir({"etapa": f"{pai}/{nome}" if pai else nome, "momento": datetime.now().isoformat(), **dados})
+
+    @contextmanager
+    def etapa(self, nome, **dados):
+        """
+        Mede o bloco como uma etapa. Retorna o dict do evento, que pode receber mais campos
+        dentro do bloco (ex.: evento["linhas_saida"] = len(df)).
+        """
+        evento = dict(dados)
+        if not self.ativa:
+            yield evento
+            return
+        pai = _ETAPA_ATUAL.get()
+        caminho = f"{pai}/{nome}" if pai else nome
+        token = _ETAPA_ATUAL.set(caminho)
+        evento = {"etapa": caminho, "momento": datetime.now().isoformat(), "thread": threading.current_thread().name, **evento}
+        perfil = self._iniciar_perfil(nome)
+        pico = _PicoMemoria(self._processo).__enter__() if self.memoria == "pico" else None
+        rss_inicio = self._processo.memory_info().rss
+        inicio = time.perf_counter()
+        try:
+            yield evento
+        except BaseException as e:
+            evento["erro"] = repr(e)
+            raise
+        finally:
+            evento["tempo_s"] = time.perf_counter() - inicio
+            rss_fim = self._processo.memory_info().rss
+            evento["rss_mb"] = rss_fim / 2**20
+            evento["delta_rss_mb"] = (rss_fim - rss_inicio) / 2**20
+            if pico is not None:
+                pico.__exit__(None, None, None)
+                evento["pico_rss_mb"] = pico.maximo / 2**20
+            if perfil is not None:
+                evento.update(self._finalizar_perfil(perfil))
+            _ETAPA_ATUAL.reset(token)
+            self._emitir(evento)
+
+    def _emitir(self, evento):
+        for destino in self.destinos:
+            try:
+                destino(evento)
+            except Exception as e:
+                # Um destino com problema não pode derrubar o processamento
+                print(f"Erro no destino de instrumentação {destino!r}: {e}")
+
+    def _iniciar_perfil(self, nome):
+        if self.perfil is None or (self.etapas_perfil is not None and nome not in self.etapas_perfil):
+            return None
+        # Um perfil por vez: etapas internas de uma etapa já perfilada entram no perfil dela
+        if not self._perfilando.acquire(blocking=False):
+            return None
+        if self.perfil == "cprofile":
+            perfil = cProfile.Profile()
+            perfil.enable()
+            return perfil
+        iniciou = not tracemalloc.is_tracing()
+        if iniciou:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        return iniciou
+
+    def _finalizar_perfil(self, perfil):
+        try:
+            if isinstance(perfil, cProfile.Profile):
+                perfil.disable()
+                texto = io.StringIO()
+                pstats.Stats(perfil, stream=texto).sort_stats("cumulative").print_stats(self.linhas_perfil)
+                return {"perfil": texto.getvalue()}
+            pico = tracemalloc.get_traced_memory()[1]
+            maiores = tracemalloc.take_snapshot().statistics("lineno")[:self.linhas_perfil]
+            if perfil:
+                tracemalloc.stop()
+            return {"pico_alocado_mb": pico / 2**20, "maiores_alocacoes": [str(m) for m in maiores]}
+        finally:
+            self._perfilando.release()
+
+
+class DestinoLogging:
+    """Envia cada evento para um logger (o evento completo vai em record.evento)."""
+
+    def __init__(self, logger="Utils_codes", nivel=logging.INFO):
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.nivel = nivel
+
+    def __call__(self, evento):
+        tempo = f" {evento['tempo_s']:.3f}s" if "tempo_s" in evento else ""
+        extras = " ".join(f"{k}={v}" for k, v in evento.items() if k not in ("etapa", "momento", "tempo_s", "thread", "perfil", "maiores_alocacoes"))
+        self.logger.log(self.nivel, f"{evento['etapa']}:{tempo} {extras}".rstrip(), extra={"evento": evento})
+
+
+class DestinoJsonl:
+    """Acrescenta cada evento como uma linha json no arquivo."""
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self._trava = threading.Lock()
+        pasta = os.path.dirname(os.path.abspath(arquivo))
+        os.makedirs(pasta, exist_ok=True)
+
+    def __call__(self, evento):
+        linha = json.dumps(evento, ensure_ascii=False, default=str)
+        with self._trava, open(self.arquivo, "a", encoding="utf-8") as f:
+            f.write(linha + "\n")
+
+
+class _PicoMemoria:
+    """Pico de RSS do processo amostrado numa thread enquanto o bloco executa."""
+
+    def __init__(self, processo=None, intervalo=0.005):
+        self.intervalo = intervalo
+        self.processo = processo or psutil.Process()
+        self.maximo = 0
+        self._parar = threading.Event()
+
+    def __enter__(self):
+        self.maximo = self.processo.memory_info().rss
+        self._thread = threading.Thread(target=self._amostrar, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._parar.set()
+        self._thread.join()
+        self.maximo = max(self.maximo, self.processo.memory_info().rss)
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            self.maximo = max(self.maximo, self.processo.memory_info().rss)
+
+
+# Instância usada por padrão pelo MegaDesdobrador, carregar_arquivo e salvar_arquivo
+INSTRUMENTACAO = Instrumentacao()
+
+
+def configurar_instrumentacao(
+    destinos: list | None = None,
+    silencioso: bool = False,
+    memoria: str = "delta",
+    perfil: str | None = None,
+    etapas_perfil: list | None = None,
+    linhas_perfil: int = 20
+) -> Instrumentacao:
+    """
+
+    Configura a instrumentação padrão (usada por MegaDesdobrador, carregar_arquivo e salvar_arquivo)
+
+    :param destinos: Para onde vão os eventos: DestinoLogging(), DestinoJsonl("etapas.jsonl") ou
+    qualquer função que receba o dict do evento. Sem destinos nada é medido
+    :type destinos: list | None
+    :param silencioso: Se True não exibe os prints de progresso e auditoria
+    :type silencioso: bool
+    :param memoria: "delta" (RSS no início e fim de cada etapa) ou "pico" (RSS amostrado durante
+    a etapa)
+    :type memoria: str
+    :param perfil: "cprofile" ou "tracemalloc" para perfilar as etapas (resultado vai no evento)
+    :type perfil: str | None
+    :param etapas_perfil: Nomes das etapas perfiladas (ex.: ["share", "pivot"]); None = todas
+    :type etapas_perfil: list | None
+    :param linhas_perfil: Linhas do relatório do cProfile / maiores alocações do tracemalloc
+    :type linhas_perfil: int
+    :return: A instrumentação padrão já configurada
+    :rtype: Instrumentacao
+
+    """
+
+    return INSTRUMENTACAO.configurar(destinos, silencioso, memoria, perfil, etapas_perfil, linhas_perfil)
+
+
+def instrumentar(nome=None):
+    """
+    Decorador que mede a função inteira como uma etapa, com as linhas dos DataFrames de entrada
+    e de saída. Em métodos usa a instrumentação da instância (self.instrumentacao), se houver.
+    """
+    def decorador(funcao):
+        etapa = nome or funcao.__name__
+
+        @functools.wraps(funcao)
+        def instrumentada(*args, **kwargs):
+            inst = getattr(args[0], "instrumentacao", None) if args else None
+            inst = inst if isinstance(inst, Instrumentacao) else INSTRUMENTACAO
+            if not inst.ativa:
+                return funcao(*args, **kwargs)
+            entradas = [len(a) for a in (*args, *kwargs.values()) if _eh_tabela(a)]
+            with inst.etapa(etapa, linhas_entrada=entradas) as evento:
+                resultado = funcao(*args, **kwargs)
+                evento["linhas_saida"] = [len(s) for s in _saidas(resultado) if _eh_tabela(s)]
+                return resultado
+        return instrumentada
+    return decorador
+
+
+def _saidas(resultado):
+    # Tuplas de DataFrames ou resultados com df_ok/df_erro (ResultadoDesdobramento)
+    if isinstance(resultado, tuple):
+        return resultado
+    if hasattr(resultado, "df_ok") and hasattr(resultado, "df_erro"):
+        return (resultado.df_ok, resultado.df_erro)
+    return (resultado,)
+
+
+def _eh_tabela(valor):
+    return hasattr(valor, "columns") and hasattr(valor, "__len__") and not isinstance(valor, type)
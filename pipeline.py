@@ -0,0 +1,369 @@
+import os
+import sys
+import json
+import glob
+import time
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+
+from .data_classes import MegaDesdobrador
+from .utils import carregar_arquivo, ajustar_data, salvar_arquivo, _listar_arquivos, _para_pandas, _resumo
+from .instrumentacao import INSTRUMENTACAO, configurar_instrumentacao
+
+# Pasta padrão do estado do pipeline (entradas preparadas e manifestos dos jobs)
+PASTA_ESTADO = ".pipeline"
+# Modos do MegaDesdobrador que o pipeline executa (os DataFrames vêm das entradas de cada job)
+MODOS_PIPELINE = ("classico", "complexo", "cenarios", "hierarquico")
+# Muda quando o formato das entradas preparadas/manifestos muda (invalida o estado anterior)
+VERSAO_ESTADO = 1
+# Eventos de instrumentação da tarefa em execução no worker (processo), devolvidos junto com o resultado
+_EVENTOS_WORKER = []
+
+
+def carregar_configuracao(arquivo: str) -> dict:
+    """
+
+    Lê a configuração do pipeline de um arquivo .json ou .yaml/.yml (YAML precisa do pyyaml)
+
+    :param arquivo: Caminho do arquivo de configuração
+    :type arquivo: str
+    :return: Configuração (dict com "jobs" e, opcionalmente, "padrao", "pasta_estado", "workers"
+    e "pool")
+    :rtype: dict
+
+    """
+
+    with open(arquivo, encoding="utf-8") as f:
+        if arquivo.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ImportError("Configuração em YAML precisa do pacote pyyaml (pip install pyyaml).") from e
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def executar_pipeline(
+    config: str | dict,
+    workers: int | None = None,
+    pool: str | None = None,
+    forcar: bool = False,
+    jobs: list | None = None
+) -> pd.DataFrame:
+    """
+
+    Executa os jobs da configuração (carregar_arquivo -> ajustar_data -> desdobramento ->
+    salvar_arquivo) ao mesmo tempo num pool de workers, pulando o que já está atualizado, como
+    no make: cada entrada preparada (carregar + ajustar_data) é guardada pela impressão dos
+    arquivos (caminho, data de modificação e tamanho) e dos parâmetros, e é reaproveitada por
+    todos os jobs que a usam; cada job guarda um manifesto com a impressão das entradas, dos
+    parâmetros e dos arquivos de saída e só roda de novo se algum deles mudar.
+
+    Exemplo de configuração (json ou yaml; caminhos relativos ao arquivo de configuração)::
+
+        {"pasta_estado": ".pipeline", "workers": 4,
+         "padrao": {"desdobrar": {"engine": "polars"}, "salvar": {"extensao": "parquet"}},
+         "jobs": [{"nome": "forecast_sp",
+                   "entradas": {"df_demanda": {"caminho": "demanda_sp.csv", "limpar": true,
+                                               "ajustar_data": {"coluna": "Data"}},
+                                "df_historico": {"caminho": "historico_*.parquet", "engine": "polars"},
+                                "df_lote": {"caminho": "lote.xlsx"}},
+                   "desdobrar": {"modo": "complexo", "chaves_ligacao": ["UF", "Item"],
+                                 "chaves_detalhamento": ["Cidade"], "coluna_valor": "Qtd"},
+                   "salvar": {"caminho": "saidas/sp"}}]}
+
+    As entradas têm os nomes dos parâmetros do método do modo (df_origem/df_destino no
+    clássico e hierárquico, df_demanda/df_historico/df_lote no complexo e cenários) e aceitam
+    os parâmetros do carregar_arquivo; "ajustar_data" (dict ou lista de dicts) recebe os do
+    ajustar_data. "salvar" aceita caminho, extensao e os parâmetros do salvar_arquivo e grava
+    <nome>_ok e <nome>_erros. "padrao" é mesclado em cada job (uma entrada null no job remove a
+    do padrão).
+
+    :param config: Caminho do arquivo de configuração ou o dict já carregado
+    :type config: str | dict
+    :param workers: Jobs ao mesmo tempo (padrão config["workers"] ou os núcleos da máquina)
+    :type workers: int | None
+    :param pool: "process" (padrão) ou "thread" (jobs pequenos, sem custo de iniciar processos).
+    Nos dois a instrumentação configurada vale nos workers (silencioso e eventos nos destinos)
+    :type pool: str | None
+    :param forcar: Se True executa tudo de novo, ignorando o estado guardado
+    :type forcar: bool
+    :param jobs: Nomes dos jobs a executar (padrão todos)
+    :type jobs: list | None
+    :return: DataFrame com uma linha por job: status ("executado", "atualizado" ou "erro"),
+    tempo, totais da auditoria, arquivos de saída e o erro, se houver
+    :rtype: pd.DataFrame
+
+    """
+
+    if isinstance(config, str):
+        base = os.path.dirname(os.path.abspath(config))
+        config = carregar_configuracao(config)
+    else:
+        base = os.getcwd()
+    pasta_estado = os.path.join(base, config.get("pasta_estado", PASTA_ESTADO))
+    workers = workers or config.get("workers") or os.cpu_count()
+    pool = (pool or config.get("pool", "process")).lower().strip()
+    if pool not in ("process", "thread"):
+        raise ValueError(f"Pool '{pool}' não suportado.")
+
+    definicoes = _montar_jobs(config, base, jobs)
+    inicio = time.perf_counter()
+    resultados = {}
+    # Entradas que ainda precisam ser preparadas (arquivo de destino -> especificação) e o que cada job aguarda
+    preparar, aguardando = {}, {}
+    for nome, job in definicoes.items():
+        try:
+            entradas = {arg: _impressao_entrada(spec, pasta_estado) for arg, spec in job["entradas"].items()}
+            job["arquivos_entrada"] = {arg: destino for arg, (destino, _) in entradas.items()}
+            job["impressao"] = _resumo(json.dumps({
+                "entradas": {arg: impressao for arg, (_, impressao) in entradas.items()},
+                "desdobrar": job["desdobrar"], "salvar": job["salvar"], "versao": VERSAO_ESTADO,
+            }, sort_keys=True, default=repr))
+        except Exception as e:
+            resultados[nome] = _linha(nome, "erro", erro=repr(e))
+            continue
+        manifesto = _ler_manifesto(pasta_estado, nome)
+        if not forcar and _atualizado(manifesto, job["impressao"]):
+            resultados[nome] = _linha(nome, "atualizado", auditoria=manifesto["auditoria"], saidas=manifesto["saidas"])
+            continue
+        faltantes = set()
+        for arg, destino in job["arquivos_entrada"].items():
+            if forcar or not os.path.exists(destino):
+                preparar.setdefault(destino, job["entradas"][arg])
+                faltantes.add(destino)
+        aguardando[nome] = faltantes
+
+    INSTRUMENTACAO.exibir(f"Pipeline: {len(aguardando)} job(s) a executar, {sum(r['status'] == 'atualizado' for r in resultados.values())} "
+                          f"atualizado(s), {len(preparar)} entrada(s) a preparar, {workers} worker(s) ({pool}).")
+    if aguardando:
+        os.makedirs(os.path.join(pasta_estado, "entradas"), exist_ok=True)
+        os.makedirs(os.path.join(pasta_estado, "jobs"), exist_ok=True)
+        if pool == "process":
+            # spawn: fork de um processo com o pool de threads do polars ativo pode travar. O worker começa
+            # com a instrumentação padrão: recebe a configuração do processo principal e devolve os eventos
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=_iniciar_worker, initargs=_configuracao_instrumentacao())
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+
+        def enviar(funcao, *args):
+            return executor.submit(_no_worker, funcao, *args) if pool == "process" else executor.submit(funcao, *args)
+
+        def resultado(futuro):
+            if pool == "thread":
+                return futuro.result()
+            retorno, eventos = futuro.result()
+            for evento in eventos:
+                INSTRUMENTACAO._emitir(evento)
+            return retorno
+
+        with executor:
+            futuros = {enviar(_preparar_entrada, spec, destino): ("entrada", destino) for destino, spec in preparar.items()}
+
+            def enviar_prontos():
+                for nome in [n for n, faltantes in aguardando.items() if not faltantes]:
+                    job = definicoes[nome]
+                    del aguardando[nome]
+                    futuros[enviar(_executar_job, nome, job["desdobrar"], job["salvar"], job["arquivos_entrada"])] = ("job", nome)
+
+            enviar_prontos()
+            while futuros:
+                feitos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+                for futuro in feitos:
+                    tipo, chave = futuros.pop(futuro)
+                    erro = futuro.exception()
+                    if tipo == "entrada":
+                        if erro is None:
+                            resultado(futuro)
+                        for nome in [n for n, faltantes in aguardando.items() if chave in faltantes]:
+                            if erro is None:
+                                aguardando[nome].discard(chave)
+                            else:
+                                del aguardando[nome]
+                                resultados[nome] = _linha(nome, "erro", erro=f"Entrada {preparar[chave]['caminho']}: {erro!r}")
+                        continue
+                    if erro is not None:
+                        resultados[chave] = _linha(chave, "erro", erro=repr(erro))
+                        INSTRUMENTACAO.exibir(f"❌ Job {chave} falhou: {erro!r}")
+                        continue
+                    saida = resultado(futuro)
+                    _gravar_manifesto(pasta_estado, chave, definicoes[chave]["impressao"], saida)
+                    resultados[chave] = _linha(chave, "executado", saida["tempo_s"], saida["auditoria"], saida["saidas"])
+                    INSTRUMENTACAO.exibir(f"✅ Job {chave} concluído em {saida['tempo_s']:.2f}s.")
+                enviar_prontos()
+
+    tabela = pd.DataFrame([resultados[nome] for nome in definicoes], columns=[
+        "job", "status", "tempo_s", "origem", "desdobrado", "erros", "saidas", "erro",
+    ])
+    INSTRUMENTACAO.exibir(f"Pipeline concluído em {time.perf_counter() - inicio:.2f}s: "
+                          + ", ".join(f"{n} {s}" for s, n in tabela["status"].value_counts().items()))
+    return tabela
+
+
+def _montar_jobs(config, base, selecionados):
+    """Aplica "padrao" em cada job, valida nomes/modos e resolve os caminhos relativos à pasta base."""
+    padrao = config.get("padrao", {})
+    definicoes = {}
+    for job in config.get("jobs", []):
+        job = {chave: {**padrao[chave], **valor} if isinstance(valor, dict) and isinstance(padrao.get(chave), dict) else valor
+               for chave, valor in {**padrao, **job}.items()}
+        nome = job.get("nome")
+        if not nome:
+            raise ValueError("Todo job precisa de um 'nome'.")
+        if nome in definicoes:
+            raise ValueError(f"Job '{nome}' duplicado.")
+        desdobrar = dict(job.get("desdobrar", {}))
+        if desdobrar.get("modo") not in MODOS_PIPELINE:
+            raise ValueError(f"Modo '{desdobrar.get('modo')}' não suportado no pipeline (job '{nome}').")
+        entradas = {}
+        for arg, spec in job.get("entradas", {}).items():
+            if spec is None:
+                # Permite remover num job uma entrada que veio do "padrao"
+                continue
+            spec = {"caminho": spec} if isinstance(spec, (str, list)) else dict(spec)
+            caminho = spec["caminho"]
+            spec["caminho"] = [os.path.join(base, c) for c in caminho] if isinstance(caminho, list) else os.path.join(base, caminho)
+            entradas[arg] = spec
+        salvar = dict(job.get("salvar", {}))
+        salvar["caminho"] = os.path.join(base, salvar.get("caminho", "outputs"))
+        definicoes[nome] = {"entradas": entradas, "desdobrar": desdobrar, "salvar": salvar}
+    if selecionados is not None:
+        faltantes = set(selecionados) - set(definicoes)
+        if faltantes:
+            raise ValueError(f"Jobs não encontrados na configuração: {sorted(faltantes)}.")
+        definicoes = {nome: job for nome, job in definicoes.items() if nome in selecionados}
+    return definicoes
+
+
+def _impressao_entrada(spec, pasta_estado):
+    """
+    Arquivo da entrada preparada e sua impressão: a identidade (caminhos + parâmetros) vai no
+    nome para que versões antigas da mesma entrada possam ser descartadas.
+    """
+    arquivos = _listar_arquivos(spec["caminho"])
+    versoes = [f"{os.path.abspath(a)}-{info.st_mtime_ns}-{info.st_size}" for a, info in zip(arquivos, map(os.stat, arquivos))]
+    identidade = _resumo(json.dumps({**spec, "versao": VERSAO_ESTADO}, sort_keys=True, default=repr))
+    impressao = f"{identidade}_{_resumo('|'.join(versoes))}"
+    return os.path.join(pasta_estado, "entradas", f"{impressao}.pkl"), impressao
+
+
+def _preparar_entrada(spec, destino):
+    """carregar_arquivo + ajustar_data de uma entrada, gravada em pickle (roda no worker)."""
+    parametros = dict(spec)
+    caminho = parametros.pop("caminho")
+    ajustes = parametros.pop("ajustar_data", None) or []
+    df = _para_pandas(carregar_arquivo(caminho, **parametros))
+    for ajuste in [ajustes] if isinstance(ajustes, dict) else ajustes:
+        df = ajustar_data(df, **ajuste)
+
+    # Pickle mantém dtypes e nulos exatamente como no DataFrame em memória
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    df.to_pickle(temporario, protocol=5)
+    os.replace(temporario, destino)
+    identidade = os.path.basename(destino).split("_")[0]
+    for antigo in glob.glob(os.path.join(os.path.dirname(destino), f"{identidade}_*.pkl")):
+        if antigo != destino:
+            try:
+                os.remove(antigo)
+            except OSError:
+                continue
+    return len(df)
+
+
+def _executar_job(nome, desdobrar, salvar, arquivos_entrada):
+    """Desdobramento e salvamento de um job a partir das entradas preparadas (roda no worker)."""
+    inicio = time.perf_counter()
+    frames = {arg: pd.read_pickle(arquivo) for arg, arquivo in arquivos_entrada.items()}
+    parametros = dict(desdobrar)
+    modo = parametros.pop("modo")
+    # API sem estado: a mesma instância poderia atender vários jobs em threads
+    resultado = MegaDesdobrador().desdobrar(modo, **frames, **parametros)
+
+    parametros_salvar = dict(salvar)
+    caminho = parametros_salvar.pop("caminho")
+    extensao = parametros_salvar.pop("extensao", "parquet")
+    os.makedirs(caminho, exist_ok=True)
+    saidas = {}
+    for sufixo, df in (("ok", resultado.df_ok), ("erros", resultado.df_erro)):
+        saidas[sufixo] = salvar_arquivo(df, f"{nome}_{sufixo}", caminho, extensao, levantar_erros=True, **parametros_salvar)
+    auditoria = {chave: float(valor) for chave, valor in (resultado.auditoria or {}).items()}
+    return {"saidas": saidas, "auditoria": auditoria, "tempo_s": time.perf_counter() - inicio}
+
+
+def _configuracao_instrumentacao():
+    inst = INSTRUMENTACAO
+    etapas_perfil = None if inst.etapas_perfil is None else sorted(inst.etapas_perfil)
+    return inst.ativa, inst.silencioso, inst.memoria, inst.perfil, etapas_perfil, inst.linhas_perfil
+
+
+def _iniciar_worker(ativa, silencioso, memoria, perfil, etapas_perfil, linhas_perfil):
+    """Configura a instrumentação do worker como a do processo principal, guardando os eventos para devolver."""
+    configurar_instrumentacao([_EVENTOS_WORKER.append] if ativa else None, silencioso, memoria, perfil,
+                              etapas_perfil, linhas_perfil)
+
+
+def _no_worker(funcao, *args):
+    """Executa a tarefa no worker e devolve o resultado com os eventos que ela gerou."""
+    _EVENTOS_WORKER.clear()
+    retorno = funcao(*args)
+    eventos = list(_EVENTOS_WORKER)
+    _EVENTOS_WORKER.clear()
+    return retorno, eventos
+
+
+def _versao_saida(arquivo):
+    info = os.stat(arquivo)
+    return [info.st_mtime_ns, info.st_size]
+
+
+def _ler_manifesto(pasta_estado, nome):
+    try:
+        with open(os.path.join(pasta_estado, "jobs", f"{nome}.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _atualizado(manifesto, impressao):
+    """Mesma impressão e saídas intactas (nenhuma removida ou alterada depois da execução)."""
+    if not manifesto or manifesto.get("impressao") != impressao:
+        return False
+    try:
+        return all(_versao_saida(arquivo) == versao for arquivo, versao in manifesto["versoes_saidas"].items())
+    except OSError:
+        return False
+
+
+def _gravar_manifesto(pasta_estado, nome, impressao, saida):
+    manifesto = {
+        "impressao": impressao, "data": datetime.now().isoformat(timespec="seconds"), **saida,
+        "versoes_saidas": {arquivo: _versao_saida(arquivo) for arquivo in saida["saidas"].values()},
+    }
+    arquivo = os.path.join(pasta_estado, "jobs", f"{nome}.json")
+    with open(f"{arquivo}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=1)
+    os.replace(f"{arquivo}.tmp", arquivo)
+
+
+def _linha(nome, status, tempo_s=None, auditoria=None, saidas=None, erro=None):
+    auditoria = auditoria or {}
+    return {"job": nome, "status": status, "tempo_s": tempo_s, "origem": auditoria.get("origem"),
+            "desdobrado": auditoria.get("desdobrado"), "erros": auditoria.get("erros"), "saidas": saidas, "erro": erro}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Executa os jobs de desdobramento de uma configuração json/yaml.")
+    parser.add_argument("config")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--pool", choices=["process", "thread"], default=None)
+    parser.add_argument("--forcar", action="store_true", help="Executa tudo de novo, ignorando o estado guardado")
+    parser.add_argument("--jobs", nargs="+", default=None)
+    args = parser.parse_args()
+    resultado = executar_pipeline(args.config, args.workers, args.pool, args.forcar, args.jobs)
+    print(resultado.drop(columns=["saidas"]).to_string(index=False))
+    sys.exit(1 if (resultado["status"] == "erro").any() else 0)
@@ -1,234 +1,905 @@
 import os
 import time
+import json
+import glob
+import hashlib
+import functools
+import gzip
 import warnings
+import datetime
+import threading
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import polars as pl
+import pyarrow as pa
+import xlsxwriter
+from pandas.tseries.api import guess_datetime_format
+
+from .instrumentacao import INSTRUMENTACAO, instrumentar
 warnings.filterwarnings("ignore")
 
+# Pasta padrão do cache de leitura do carregar_arquivo
+PASTA_CACHE = ".cache_arquivos"
+EXTENSOES_EXCEL = (".xlsx", ".xlsm", ".xls", ".xlsb")
+# Linhas por aba no Excel (incluindo o cabeçalho)
+LIMITE_LINHAS_EXCEL = 1_048_576
+# Textos tratados como nulos pelo to_datetime ao inferir o formato
+TEXTOS_NULOS_DATA = ["", "NaT", "nat", "NAT", "nan", "NaN", "NAN"]
+# Sufixo do arquivo para cada compressão de csv
+SUFIXOS_COMPRESSAO = {"gzip": ".gz", "zip": ".zip", "bz2": ".bz2", "xz": ".xz", "zstd": ".zst"}
+
+# Salvamentos em segundo plano ainda não aguardados (os concluídos com sucesso saem sozinhos) e pools usados por eles
+_SALVAMENTOS_PENDENTES = []
+_TRAVA_SALVAMENTOS = threading.Lock()
+_EXECUTORES_SALVAMENTO = {}
+
 def salvar_arquivo(
-    df: pd.DataFrame, 
+    df: pd.DataFrame | pl.DataFrame, 
     nome_arquivo: str, 
     caminho: str | None = None,
     extensao: str = "csv",
+    engine: str = "pandas",
+    compressao: str | None = None,
+    em_segundo_plano: bool | str = False,
+    levantar_erros: bool = False,
     **kwargs
-) -> None:
+) -> str | Future | None:
     """
 
     Função desenvolvida para salvar arquivos de forma mais rápida e padrão, evitando problemas de
     padronização nas saidas de arquivos e repetição em codigos.
     
-    :param df: Dataframe que será salvo
+    :param df: Dataframe que será salvo (Pandas ou Polars)
     :param nome_arquivo: Nome para saida de arquivo
     :param caminho: Local de saída do arquivo 
-    :param extensao: Qual extensão será salva (csv, xlsx, etc)
-    :param kwargs: Pode ser passado qualquer tipo de **kwargs padrão Pandas
+    :param extensao: Qual extensão será salva (csv, excel, parquet ou feather)
+    :param engine: Escritor usado: "pandas" (padrão); "polars" no csv usa o write_csv multithread
+    mantendo ";" e "," como padrão (floats muito pequenos ou grandes saem em outra notação: 1e-7
+    e 1e16 no Polars, 1e-07 e 1e+16 no pandas; o valor lido de volta é o mesmo); "xlsxwriter" no excel grava em modo constant_memory, linha a
+    linha, criando novas abas a cada 1.048.575 linhas (memória constante para qualquer tamanho)
+    :param compressao: Compressão opcional: no csv "gzip", "zip", "bz2", "xz" ou "zstd" (Polars só
+    gzip; "zstd" precisa do pacote zstandard), no parquet o codec ("zstd", "snappy", "gzip"...) e no feather "zstd" ou "lz4"
+    :param em_segundo_plano: Se True (ou "thread") salva num pool de threads e retorna um Future
+    na hora; "process" usa um pool de processos. Use aguardar_salvamentos() para esperar todos e
+    receber os erros
+    :param levantar_erros: Se True o erro de gravação é levantado em vez de só exibido
+    :param kwargs: Pode ser passado qualquer tipo de **kwargs padrão da engine escolhida
+    :return: Caminho do arquivo salvo (None se deu erro) ou Future com o caminho, em segundo plano
 
     """
 
     #Parametros padrões
     DEFAULTS = {
         "csv":{"sep": ";", "decimal": ",", "encoding": "utf-8", "index": False},
-        "excel":{"sheet_name": "BD_Python", "index": False}
+        "csv_polars":{"separator": ";", "decimal_comma": True, "datetime_format": "%Y-%m-%d %H:%M:%S"},
+        "excel":{"sheet_name": "BD_Python", "index": False},
+        "parquet":{"index": False},
+        "feather":{},
     }
     
     #Evita quebra por esse de digitação
     extensao = extensao.lower().strip()
+    engine = engine.lower().strip()
+    if engine not in ("pandas", "polars", "xlsxwriter"):
+        raise ValueError(f"Engine '{engine}' não suportada.")
     #Define o caminho
     try:
         pasta = caminho if caminho else os.getcwd()
     except Exception as e:
-        print(f"Erro ao definir o caminho do arquivo {nome_arquivo}: {e}")
+        INSTRUMENTACAO.exibir(f"Erro ao definir o caminho do arquivo {nome_arquivo}: {e}")
         return
-    #Salva o arquivo na extensão escolhida pelo usuário
+    #Define o arquivo e os parâmetros da extensão escolhida pelo usuário
     match extensao:
         case "csv":
             arquivo = os.path.join(pasta, f"{nome_arquivo}.csv")
-            params = {**DEFAULTS["csv"], **kwargs}
-            try:
-                print(f"Salvando arquivo: {nome_arquivo}")
-                inicio = time.perf_counter()
-                df.to_csv(arquivo, **params)
-                fim = time.perf_counter() 
-                arquivo = os.path.abspath(arquivo)
-                print(f"Arquivo salvo em {arquivo}\nArquivo {nome_arquivo} salvo em {fim - inicio:.2f} segundos.")
-            except Exception as e:
-                print(f"Erro ao salvar o arquivo {nome_arquivo}: {e}")
+            if engine == "polars":
+                if compressao not in (None, "gzip"):
+                    raise ValueError(f"Compressão '{compressao}' não suportada no csv com Polars (use gzip).")
+                params = {**DEFAULTS["csv_polars"], **kwargs}
+            else:
+                params = {**DEFAULTS["csv"], **kwargs}
+                if compressao:
+                    params["compression"] = compressao
+            if compressao:
+                if compressao not in SUFIXOS_COMPRESSAO:
+                    raise ValueError(f"Compressão '{compressao}' não suportada no csv.")
+                if compressao == "zstd":
+                    try:
+                        import zstandard
+                    except ImportError as e:
+                        raise ImportError("Compressão zstd no csv precisa do pacote zstandard (pip install zstandard).") from e
+                arquivo += SUFIXOS_COMPRESSAO[compressao]
         case "excel":
+            if compressao:
+                raise ValueError("O Excel (.xlsx) já é compactado, não use compressao.")
             arquivo = os.path.join(pasta, f"{nome_arquivo}.xlsx")
             params = {**DEFAULTS["excel"], **kwargs}
-            try:
-                print(f"Salvando arquivo: {nome_arquivo}")
-                inicio = time.perf_counter()
-                df.to_excel(arquivo, **params)
-                fim = time.perf_counter() 
-                arquivo = os.path.abspath(arquivo)
-                print(f"Arquivo salvo em {arquivo}\nArquivo {nome_arquivo} salvo em {fim - inicio:.2f} segundos.")
-            except Exception as e:
-                print(f"Erro ao salvar o arquivo {nome_arquivo}: {e}")
+        case "parquet":
+            arquivo = os.path.join(pasta, f"{nome_arquivo}.parquet")
+            params = {**({} if isinstance(df, pl.DataFrame) else DEFAULTS["parquet"]), **kwargs}
+            if compressao:
+                params["compression"] = compressao
+        case "feather":
+            arquivo = os.path.join(pasta, f"{nome_arquivo}.feather")
+            params = {**DEFAULTS["feather"], **kwargs}
+            if compressao:
+                params["compression"] = compressao
         case _:
             raise ValueError(f"Extensão de arquivo '{extensao}' não suportada.")
 
+    if not em_segundo_plano:
+        return _salvar(df, nome_arquivo, arquivo, extensao, engine, compressao, params, levantar_erros)
+    # Em segundo plano: o df não deve ser alterado até o salvamento terminar
+    tipo = "process" if em_segundo_plano == "process" else "thread"
+    futuro = _executor_salvamento(tipo).submit(_salvar, df, nome_arquivo, arquivo, extensao, engine, compressao, params, True)
+    with _TRAVA_SALVAMENTOS:
+        _SALVAMENTOS_PENDENTES.append(futuro)
+    futuro.add_done_callback(_concluir_salvamento)
+    INSTRUMENTACAO.exibir(f"Salvando arquivo {nome_arquivo} em segundo plano.")
+    return futuro
+
+def aguardar_salvamentos(futuros: list | None = None, levantar_erros: bool = True) -> list:
+    """
+
+    Aguarda todos os salvamentos feitos em segundo plano pelo salvar_arquivo.
+
+    :param futuros: Futures retornados pelo salvar_arquivo a aguardar (None = todos os pendentes:
+    os que ainda não terminaram e os que terminaram com erro)
+    :type futuros: list | None
+    :param levantar_erros: Se True, ao final levanta um erro se algum salvamento falhou (a
+    exceção original fica encadeada)
+    :type levantar_erros: bool
+    :return: Caminhos dos arquivos salvos (None nos que falharam), na ordem em que foram pedidos.
+    Para receber os caminhos de todos passe os Futures: sem eles só vêm os ainda pendentes
+    :rtype: list
+
+    """
+
+    with _TRAVA_SALVAMENTOS:
+        pendentes = list(_SALVAMENTOS_PENDENTES) if futuros is None else list(futuros)
+        for futuro in pendentes:
+            if futuro in _SALVAMENTOS_PENDENTES:
+                _SALVAMENTOS_PENDENTES.remove(futuro)
+    caminhos, erros = [], []
+    for futuro in pendentes:
+        try:
+            caminhos.append(futuro.result())
+        except Exception as e:
+            caminhos.append(None)
+            erros.append(e)
+    if erros and levantar_erros:
+        raise RuntimeError(f"{len(erros)} de {len(pendentes)} salvamento(s) falharam: {erros[0]}") from erros[0]
+    return caminhos
+
+def _concluir_salvamento(futuro):
+    # Os que deram certo saem da lista; os com erro ficam até o aguardar_salvamentos levantar o erro
+    if futuro.cancelled() or futuro.exception() is None:
+        with _TRAVA_SALVAMENTOS:
+            if futuro in _SALVAMENTOS_PENDENTES:
+                _SALVAMENTOS_PENDENTES.remove(futuro)
+
+def _executor_salvamento(tipo):
+    if tipo not in _EXECUTORES_SALVAMENTO:
+        if tipo == "process":
+            # spawn: fork de um processo com o pool de threads do polars ativo pode travar
+            _EXECUTORES_SALVAMENTO[tipo] = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+        else:
+            _EXECUTORES_SALVAMENTO[tipo] = ThreadPoolExecutor(thread_name_prefix="salvar_arquivo")
+    return _EXECUTORES_SALVAMENTO[tipo]
+
+def _salvar(df, nome_arquivo, arquivo, extensao, engine, compressao, params, levantar_erros):
+    try:
+        INSTRUMENTACAO.exibir(f"Salvando arquivo: {nome_arquivo}")
+        inicio = time.perf_counter()
+        with INSTRUMENTACAO.etapa("salvar_arquivo", arquivo=arquivo, extensao=extensao, engine=engine, linhas=len(df)):
+            _escrever(df, arquivo, extensao, engine, compressao, params)
+        fim = time.perf_counter() 
+        arquivo = os.path.abspath(arquivo)
+        INSTRUMENTACAO.exibir(f"Arquivo salvo em {arquivo}\nArquivo {nome_arquivo} salvo em {fim - inicio:.2f} segundos.")
+        return arquivo
+    except Exception as e:
+        INSTRUMENTACAO.exibir(f"Erro ao salvar o arquivo {nome_arquivo}: {e}")
+        if levantar_erros:
+            raise
+
+def _escrever(df, arquivo, extensao, engine, compressao, params):
+    match extensao, engine:
+        case "csv", "polars":
+            if compressao:
+                with gzip.open(arquivo, "wb") as destino:
+                    _csv_polars(df).write_csv(destino, **params)
+            else:
+                _csv_polars(df).write_csv(arquivo, **params)
+        case "csv", _:
+            _para_pandas(df).to_csv(arquivo, **params)
+        case "excel", "xlsxwriter":
+            _excel_streaming(_para_pandas(df), arquivo, **params)
+        case "excel", _:
+            _para_pandas(df).to_excel(arquivo, **params)
+        case "parquet", _:
+            df.write_parquet(arquivo, **params) if isinstance(df, pl.DataFrame) else df.to_parquet(arquivo, **params)
+        case "feather", _:
+            df.write_ipc(arquivo, **params) if isinstance(df, pl.DataFrame) else df.reset_index(drop=True).to_feather(arquivo, **params)
+
+def _para_pandas(df):
+    return df.to_pandas() if isinstance(df, pl.DataFrame) else df
+
+def _para_polars(df):
+    return df if isinstance(df, pl.DataFrame) else pl.from_pandas(df)
+
+def _csv_polars(df):
+    """DataFrame Polars para o write_csv, com os booleanos em True/False como no csv do pandas (Polars grava true/false)."""
+    df = _para_polars(df)
+    booleanos = [col for col, tipo in df.schema.items() if tipo == pl.Boolean]
+    if not booleanos:
+        return df
+    return df.with_columns(
+        pl.when(pl.col(col)).then(pl.lit("True")).when(~pl.col(col)).then(pl.lit("False")).alias(col) for col in booleanos
+    )
+
+def _excel_streaming(df, arquivo, sheet_name="BD_Python", index=False, linhas_por_bloco=50_000):
+    """Grava o Excel linha a linha (constant_memory), abrindo novas abas quando passa do limite de linhas."""
+    if index:
+        df = df.reset_index()
+    linhas_por_aba = LIMITE_LINHAS_EXCEL - 1
+    opcoes = {"constant_memory": True, "default_date_format": "yyyy-mm-dd", "strings_to_numbers": False}
+    with xlsxwriter.Workbook(arquivo, opcoes) as workbook:
+        cabecalho = [str(col) for col in df.columns]
+        for n_aba, inicio_aba in enumerate(range(0, max(len(df), 1), linhas_por_aba)):
+            nome_aba = sheet_name if n_aba == 0 else f"{sheet_name[:27]}_{n_aba + 1}"
+            worksheet = workbook.add_worksheet(nome_aba)
+            worksheet.write_row(0, 0, cabecalho)
+            linha = 1
+            fim_aba = min(inicio_aba + linhas_por_aba, len(df))
+            # Converte um bloco por vez para tipos Python (nulos viram células vazias)
+            for inicio in range(inicio_aba, fim_aba, linhas_por_bloco):
+                bloco = df.iloc[inicio:min(inicio + linhas_por_bloco, fim_aba)]
+                bloco = bloco.astype(object).where(bloco.notna(), None)
+                for valores in bloco.itertuples(index=False, name=None):
+                    worksheet.write_row(linha, 0, valores)
+                    linha += 1
+
+@instrumentar()
 def carregar_arquivo(
-    caminho: str, 
+    caminho: str | list[str], 
     engine: str = "pandas", 
     limpar = False, 
     uppercase = False, 
+    lowercase = False,
+    retorno: str = "pandas",
+    colunas: list[str] | None = None,
+    filtros: list[tuple] | None = None,
+    cache: bool | str = False,
+    cache_max_mb: int = 4096,
     **kwargs
-) -> pd.DataFrame:
+) -> pd.DataFrame | pl.DataFrame:
     """
 
     Função carrega arquivos .csv, .xlsx(e suas variaveis), tratando ele dependendo da sua necessidade
     e retorna um DataFrame pronto para fazer qualquer processo de analise sem precisar se preocupar
     com espaços em brancos, valores sem padronização.
     
-    :param caminho: Local do arquivo a ser carregado
-    :type caminho: str
+    :param caminho: Local do arquivo a ser carregado, um glob (ex.: "base_*.csv") ou uma lista de
+    arquivos; vários arquivos são lidos em paralelo e concatenados (colunas faltantes ficam nulas e
+    tipos diferentes são promovidos para um tipo comum)
+    :type caminho: str | list[str]
     :param engine: Qual biblioteca será utilizada para carregar o arquivo, polars será mais rápido 
     e melhor para ler arquivos pesados e com muitas informações.
     :type engine: str
     :param limpar: Se True remove espaços em brancos de todos o dados do DataFrame. 
     obs: somente em colunas Object
     :param uppercase: Se True transforma dados Object em caixa alta (uppercase)
+    :param lowercase: Se True transforma dados Object em caixa baixa (lowercase)
+    :param retorno: Formato de saída: "pandas", "polars" (DataFrame Polars, sem conversão) ou
+    "arrow" (pandas com colunas pyarrow, sem cópia a partir do Polars)
+    :type retorno: str
+    :param colunas: Lê somente essas colunas
+    :type colunas: list[str] | None
+    :param filtros: Filtros de linhas como (coluna, operador, valor), operadores ==, !=, >, >=, <,
+    <=, in e not in. No Polars projeção e filtros são aplicados no scan lazy, sem converter o
+    restante do arquivo; no Pandas o csv filtrado é lido em blocos.
+    :type filtros: list[tuple] | None
+    :param cache: Se True (ou o caminho de uma pasta) guarda o resultado já tratado em Arrow IPC
+    na pasta de cache (padrão ``.cache_arquivos``) e nas próximas leituras carrega direto dele via
+    memory-map. A chave considera caminho, data de modificação, tamanho, engine e parâmetros, então
+    qualquer alteração no arquivo invalida o cache.
+    :type cache: bool | str
+    :param cache_max_mb: Tamanho máximo da pasta de cache; os arquivos menos usados são removidos.
+    :type cache_max_mb: int
     :param kwargs: Aceita qualquer **kwargs de leitura, deve ser respeitado a syntax da biblioteca
     utilizada no engine.
 
-    :return: Tratado em formato Pandas independente de qual engine foi processada
+    :return: Tratado no formato de ``retorno`` independente de qual engine foi processada
     :rtype: DataFrame
 
     """
 
-    print("Iniciando o carregamento do arquivo")
+    if uppercase and lowercase:
+        raise ValueError("Use somente uppercase ou lowercase.")
+    caixa = "maiusculas" if uppercase else "minusculas" if lowercase else None
+    retorno = retorno.lower().strip()
+    caminhos = _listar_arquivos(caminho)
+    if not cache:
+        return _ler_arquivo(caminhos, engine, limpar, caixa, retorno, colunas, filtros, **kwargs)
+
+    pasta = PASTA_CACHE if cache is True else cache
+    prefixo, versao, parametros = _chave_cache(caminhos, engine, limpar, caixa, {"colunas": colunas, "filtros": filtros, **kwargs})
+    arquivo_cache = os.path.join(pasta, f"{prefixo}_{versao}_{parametros}.arrow")
+    if os.path.exists(arquivo_cache):
+        inicio = time.perf_counter()
+        descricao = os.path.basename(caminhos[0]) if len(caminhos) == 1 else f"{len(caminhos)} arquivos"
+        try:
+            with INSTRUMENTACAO.etapa("ler_cache") as evento:
+                df = _ler_cache(arquivo_cache, retorno)
+                evento["linhas"] = len(df)
+            # Marca o uso para a remoção dos menos usados
+            os.utime(arquivo_cache)
+            INSTRUMENTACAO.exibir(f"Arquivo {descricao} carregado do cache em {time.perf_counter() - inicio:.2f} segundos.")
+            return df
+        except (OSError, pa.ArrowInvalid) as e:
+            INSTRUMENTACAO.exibir(f"Cache de {descricao} inválido, lendo o arquivo novamente: {e}")
+
+    df = _ler_arquivo(caminhos, engine, limpar, caixa, retorno, colunas, filtros, **kwargs)
+    with INSTRUMENTACAO.etapa("gravar_cache"):
+        _gravar_cache(df, pasta, prefixo, arquivo_cache, cache_max_mb)
+    return df
+
+def limpar_cache(pasta: str = PASTA_CACHE, caminho: str | None = None) -> int:
+    """
+
+    Remove arquivos do cache de leitura do carregar_arquivo.
+
+    :param pasta: Pasta do cache
+    :type pasta: str
+    :param caminho: Se informado, remove só as entradas desse arquivo de origem
+    :type caminho: str | None
+    :return: Quantidade de arquivos removidos
+    :rtype: int
+
+    """
+
+    padrao = f"{_prefixo_cache(caminho)}_*.arrow" if caminho else "*.arrow"
+    removidos = 0
+    for arquivo in glob.glob(os.path.join(pasta, padrao)):
+        try:
+            os.remove(arquivo)
+            removidos += 1
+        except OSError as e:
+            INSTRUMENTACAO.exibir(f"Não foi possível remover {arquivo} do cache: {e}")
+    INSTRUMENTACAO.exibir(f"{removidos} arquivo(s) removido(s) do cache.")
+    return removidos
+
+def _resumo(valor):
+    return hashlib.sha256(valor.encode("utf-8")).hexdigest()[:16]
+
+def _prefixo_cache(caminhos):
+    if isinstance(caminhos, str):
+        caminhos = [caminhos]
+    return _resumo("|".join(os.path.normcase(os.path.abspath(caminho)) for caminho in caminhos))
+
+def _chave_cache(caminhos, engine, limpar, caixa, kwargs):
+    """Hashes dos caminhos, da versão dos arquivos (mtime + tamanho) e dos parâmetros de leitura."""
+    versoes = [f"{info.st_mtime_ns}-{info.st_size}" for info in map(os.stat, caminhos)]
+    parametros = json.dumps({"engine": engine.lower(), "limpar": limpar, "caixa": caixa, "kwargs": kwargs},
+                            sort_keys=True, default=repr)
+    return _prefixo_cache(caminhos), _resumo("|".join(versoes)), _resumo(parametros)
+
+def _ler_cache(arquivo_cache, retorno):
+    with pa.memory_map(arquivo_cache, "r") as fonte:
+        tabela = pa.ipc.open_file(fonte).read_all()
+        if retorno == "polars":
+            return pl.from_arrow(tabela, rechunk=False)
+        if retorno == "arrow":
+            return tabela.to_pandas(types_mapper=pd.ArrowDtype)
+        return tabela.to_pandas()
+
+def _gravar_cache(df, pasta, prefixo, arquivo_cache, cache_max_mb):
+    """Grava o DataFrame no cache, descarta versões antigas do mesmo arquivo e respeita o limite da pasta."""
+    try:
+        tabela = df.to_arrow() if isinstance(df, pl.DataFrame) else pa.Table.from_pandas(df)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        INSTRUMENTACAO.exibir(f"Não foi possível guardar o arquivo no cache (tipos não suportados pelo Arrow): {e}")
+        return
+
+    os.makedirs(pasta, exist_ok=True)
+    temporario = f"{arquivo_cache}.tmp"
+    try:
+        with pa.OSFile(temporario, "wb") as destino, pa.ipc.new_file(destino, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+        os.replace(temporario, arquivo_cache)
+    except OSError as e:
+        INSTRUMENTACAO.exibir(f"Não foi possível gravar o cache em {pasta}: {e}")
+        return
+
+    # Versões antigas do mesmo arquivo de origem não serão mais usadas
+    versao_atual = os.path.basename(arquivo_cache).split("_")[1]
+    entradas = []
+    for arquivo in glob.glob(os.path.join(pasta, "*.arrow")):
+        try:
+            if os.path.basename(arquivo).startswith(f"{prefixo}_") and os.path.basename(arquivo).split("_")[1] != versao_atual:
+                os.remove(arquivo)
+            else:
+                info = os.stat(arquivo)
+                entradas.append((info.st_mtime, info.st_size, arquivo))
+        except OSError:
+            continue
+
+    # Remove os menos usados até caber no limite (nunca o que acabou de ser gravado)
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, arquivo in sorted(entradas):
+        if total <= cache_max_mb * 1024 * 1024:
+            break
+        if arquivo == arquivo_cache:
+            continue
+        try:
+            os.remove(arquivo)
+            total -= tamanho
+        except OSError:
+            continue
+
+def _ler_arquivo(caminhos, engine, limpar, caixa, retorno, colunas=None, filtros=None, **kwargs):
+    """Leitura e tratamento dos arquivos de fato (sem cache); vários arquivos são lidos em paralelo."""
+    INSTRUMENTACAO.exibir("Iniciando o carregamento do arquivo")
+    inicio = time.perf_counter()
+    usar_polars = engine.lower() != "pandas"
+    INSTRUMENTACAO.exibir(f"Usando {'Polars' if usar_polars else 'Pandas'} como engine de leitura.")
+    ler = _ler_polars if usar_polars else _ler_pandas
+
+    with INSTRUMENTACAO.etapa("ler", arquivos=len(caminhos), engine="polars" if usar_polars else "pandas") as evento:
+        if len(caminhos) == 1:
+            df = ler(caminhos[0], colunas, filtros, **kwargs)
+        else:
+            INSTRUMENTACAO.exibir(f"Lendo {len(caminhos)} arquivos em paralelo.")
+            with ThreadPoolExecutor(max_workers=min(len(caminhos), os.cpu_count() or 1)) as executor:
+                partes = list(executor.map(lambda arquivo: ler(arquivo, colunas, filtros, **kwargs), caminhos))
+            # Colunas faltantes viram nulas e tipos diferentes são promovidos para um tipo comum
+            df = pl.concat(partes, how="diagonal_relaxed") if usar_polars else pd.concat(partes, ignore_index=True)
+            if colunas:
+                df = df[colunas] if not usar_polars else df.select(colunas)
+        evento["linhas"] = len(df)
+    fim = time.perf_counter()
+
+    # Remove espaços e ajusta caixa das linhas (no Polars, antes de qualquer conversão)
+    with INSTRUMENTACAO.etapa("tratar_texto"):
+        if usar_polars:
+            df = _tratar_texto_polars(df, limpar, caixa)
+        else:
+            df = _tratar_texto_pandas(df, limpar, caixa)
+    with INSTRUMENTACAO.etapa("converter_retorno", retorno=retorno):
+        df = _converter_retorno(df, retorno)
+
+    nome = os.path.basename(caminhos[0]) if len(caminhos) == 1 else f"{len(caminhos)} arquivos"
+    INSTRUMENTACAO.exibir(f"Arquivo {nome} carregado em {fim - inicio:.2f} segundos.")
+    return df
+
+def _ler_pandas(caminho, colunas, filtros, **kwargs):
+    DEFAULTS_PANDAS = {
+        "csv": {"sep": ";", "decimal": ",", "encoding": "utf-8"},
+        "excel": {"engine": None, "decimal": ",", "thousands": "."},
+        "xlsb": {"engine": "pyxlsb", "decimal": ",", "thousands": "."}
+    }
+    # Projeção feita na leitura (nomes comparados já sem espaços)
+    leitura = _colunas_leitura(colunas, filtros)
+    if leitura is not None:
+        kwargs = {"usecols": lambda col: str(col).strip() in leitura, **kwargs}
+
     extensao = os.path.splitext(caminho)[1].lower()
-    # parâmetros padrão
-    if engine.lower() == "pandas":
-        DEFAULTS_PANDAS = {
-            "csv": {"sep": ";", "decimal": ",", "encoding": "utf-8"},
-            "excel": {"engine": None, "decimal": ",", "thousands": "."},
-            "xlsb": {"engine": "pyxlsb", "decimal": ",", "thousands": "."}
-        }
-        print("Usando Pandas como engine de leitura.")
-        inicio = time.time()
-
-        match extensao:
-            case ".csv":
-                print("Extensão .csv detectada.")
-                params = {**DEFAULTS_PANDAS["csv"], **kwargs}
-                try:
-                    print("Lendo o arquivo csv em UTF-8")
-                    df = pd.read_csv(caminho, **params)
-                except UnicodeDecodeError:
-                    print("Não foi possível ler em UTF-8, tentando latin1")
-                    params["encoding"] = "latin1"
-                    df = pd.read_csv(caminho, **params) 
-            case ".xlsx" | ".xls" | ".xlsm":
-                print("Extensão excel detectada.")
-                params = {**DEFAULTS_PANDAS["excel"], **kwargs}
-                df = pd.read_excel(caminho, **params)
-            case ".xlsb":
-                print("Extensâo .xlsb detectada.")
-                params = {**DEFAULTS_PANDAS["xlsb"], **kwargs}
-                df = pd.read_excel(caminho, **params)
+    match extensao:
+        case ".csv":
+            INSTRUMENTACAO.exibir("Extensão .csv detectada.")
+            params = {**DEFAULTS_PANDAS["csv"], **kwargs}
+            # Com filtros lê em blocos e filtra cada bloco, sem manter o arquivo inteiro em memória
+            if filtros and "chunksize" not in params:
+                params["chunksize"] = 1_000_000
+            try:
+                INSTRUMENTACAO.exibir("Lendo o arquivo csv em UTF-8")
+                df = _ler_csv_pandas(caminho, filtros, params)
+            except UnicodeDecodeError:
+                INSTRUMENTACAO.exibir("Não foi possível ler em UTF-8, tentando latin1")
+                params["encoding"] = "latin1"
+                df = _ler_csv_pandas(caminho, filtros, params)
+        case ".xlsx" | ".xls" | ".xlsm":
+            INSTRUMENTACAO.exibir("Extensão excel detectada.")
+            params = {**DEFAULTS_PANDAS["excel"], **kwargs}
+            df = _aplicar_filtros_pandas(pd.read_excel(caminho, **params), filtros)
+        case ".xlsb":
+            INSTRUMENTACAO.exibir("Extensâo .xlsb detectada.")
+            params = {**DEFAULTS_PANDAS["xlsb"], **kwargs}
+            df = _aplicar_filtros_pandas(pd.read_excel(caminho, **params), filtros)
+        case _:
+            raise ValueError(f"Extensão de arquivo '{extensao}' não suportada.")
+
+    # Remove espaços em branco nos nomes da colunas
+    df.columns = df.columns.str.strip()
+    # Em vários arquivos uma coluna pode faltar em algum deles (vira nula na concatenação)
+    return df[[col for col in colunas if col in df.columns]] if colunas else df
+
+def _ler_csv_pandas(caminho, filtros, params):
+    if "chunksize" not in params:
+        return pd.read_csv(caminho, **params)
+    with pd.read_csv(caminho, **params) as blocos:
+        return pd.concat([_aplicar_filtros_pandas(bloco, filtros) for bloco in blocos], ignore_index=True)
+
+def _ler_polars(caminho, colunas, filtros, **kwargs):
+    DEFAULTS_POLARS = {
+        "csv": {"separator": ";", "decimal_comma": True, "encoding": "utf-8"},
+        "excel": {"read_options": {"header_row": 0}},
+    }
+    extensao = os.path.splitext(caminho)[1].lower()
+    match extensao:
+        case ".csv":
+            INSTRUMENTACAO.exibir("Extensão .csv detectada.")
+            params = {**DEFAULTS_POLARS["csv"], **kwargs}
+            try:
+                INSTRUMENTACAO.exibir("Lendo o arquivo csv em UTF-8")
+                # Leitura lazy: projeção e filtros descem para o scan e o resto do arquivo não é convertido
+                if params.get("encoding", "utf8").lower().replace("-", "") in ("utf8", "utf8lossy"):
+                    params["encoding"] = "utf8-lossy" if "lossy" in params["encoding"].lower() else "utf8"
+                    return _coletar_polars(pl.scan_csv(caminho, **params), colunas, filtros)
+                return _coletar_polars(pl.read_csv(caminho, **params).lazy(), colunas, filtros)
+            except (UnicodeDecodeError, pl.exceptions.ComputeError) as e:
+                if "utf" not in str(e).lower():
+                    raise
+                INSTRUMENTACAO.exibir("Não foi possível ler em UTF-8, tentando latin1")
+                params["encoding"] = "latin1"
+                return _coletar_polars(pl.read_csv(caminho, **params).lazy(), colunas, filtros)
+        case ".xlsx" | ".xls" | ".xlsm" | ".xlsb":
+            INSTRUMENTACAO.exibir("Extensão excel detectada.")
+            params = {**DEFAULTS_POLARS["excel"], **kwargs}
+            return _coletar_polars(pl.read_excel(caminho, **params).lazy(), colunas, filtros)
+        case _:
+            raise ValueError(f"Extensão de arquivo '{extensao}' não suportada.")
+
+def _coletar_polars(lf, colunas, filtros):
+    lf = lf.rename(lambda col: col.strip())
+    if filtros:
+        lf = lf.filter(_expressao_filtros(filtros))
+    if colunas:
+        presentes = lf.collect_schema().names()
+        lf = lf.select([col for col in colunas if col in presentes])
+    return lf.collect()
+
+def _colunas_leitura(colunas, filtros):
+    """Colunas que precisam ser lidas: as pedidas mais as usadas nos filtros."""
+    if not colunas:
+        return None
+    return set(colunas) | {coluna for coluna, _, _ in filtros or []}
+
+def _expressao_filtros(filtros):
+    expressao = pl.lit(True)
+    for coluna, operador, valor in filtros:
+        col = pl.col(coluna)
+        match operador:
+            case "==": condicao = col == valor
+            case "!=": condicao = col != valor
+            case ">": condicao = col > valor
+            case ">=": condicao = col >= valor
+            case "<": condicao = col < valor
+            case "<=": condicao = col <= valor
+            case "in": condicao = col.is_in(list(valor))
+            case "not in": condicao = ~col.is_in(list(valor))
             case _:
-                raise ValueError(f"Extensão de arquivo '{extensao}' não suportada.")
-        
-        fim = time.time()
-        # Remove espaços em branco nos nomes da colunas
-        df.columns = df.columns.str.strip()
-        # Se True remove espaços em branco nas linhas
-        if limpar:
-            for col in df.columns:
-                if df[col].dtype == 'object' or pd.api.types.is_string_dtype(df[col]):
-                    df[col] = df[col].apply(lambda x: x.strip() if isinstance(x, str) else x)
-        # Se True torna tudo uppercase
-        if uppercase:
-            for col in df.columns:
-                if df[col].dtype == 'object' or pd.api.types.is_string_dtype(df[col]):
-                    df[col] = df[col].apply(lambda x: x.upper() if isinstance(x, str) else x)
-                    
-        print(f"Arquivo {os.path.basename(caminho)} carregado em {fim - inicio:.2f} segundos.")
+                raise ValueError(f"Operador de filtro '{operador}' não suportado.")
+        expressao = expressao & condicao
+    return expressao
+
+def _aplicar_filtros_pandas(df, filtros):
+    if not filtros:
         return df
-    else:
-        DEFAULTS_POLARS = {
-            "csv": {"separator": ";", "decimal_comma": True, "encoding": "utf-8"},
-            "excel": {"read_options": {"header_row": 0}},
-        }
-        print("Usando Polars como engine de leitura.")
-        inicio = time.time()
-
-        match extensao:
-            case ".csv":
-                print("Extensão .csv detectada.")
-                params = {**DEFAULTS_POLARS["csv"], **kwargs}
-                try:
-                    print("Lendo o arquivo csv em UTF-8")
-                    df = pl.read_csv(caminho, **params)
-                    df = df.to_pandas()
-                except UnicodeDecodeError:
-                    print("Não foi possível ler em UTF-8, tentando latin1")
-                    params["encoding"] = "latin1"
-                    df = pl.read_csv(caminho, **params) 
-                    df = df.to_pandas()
-            case ".xlsx" | ".xls" | ".xlsm" | ".xlsb":
-                print("Extensão excel detectada.")
-                params = {**DEFAULTS_POLARS["excel"], **kwargs}
-                df = pl.read_excel(caminho, **params)
-                df = df.to_pandas()
+    mascara = pd.Series(True, index=df.index)
+    for coluna, operador, valor in filtros:
+        col = df[coluna] if coluna in df.columns else df[[c for c in df.columns if str(c).strip() == coluna][0]]
+        match operador:
+            case "==": condicao = col == valor
+            case "!=": condicao = col != valor
+            case ">": condicao = col > valor
+            case ">=": condicao = col >= valor
+            case "<": condicao = col < valor
+            case "<=": condicao = col <= valor
+            case "in": condicao = col.isin(list(valor))
+            case "not in": condicao = ~col.isin(list(valor))
             case _:
-                raise ValueError(f"Extensão de arquivo '{extensao}' não suportada.")
-        
-        fim = time.time()
+                raise ValueError(f"Operador de filtro '{operador}' não suportado.")
+        mascara &= condicao
+    return df[mascara]
 
-        df.columns = df.columns.str.strip()
-        if limpar:
-            for col in df.columns:
-                if df[col].dtype == 'object' or pd.api.types.is_string_dtype(df[col]):
-                    df[col] = df[col].apply(lambda x: x.strip() if isinstance(x, str) else x)
-            
-        print(f"Arquivo {os.path.basename(caminho)} carregado em {fim - inicio:.2f} segundos.")
+def _listar_arquivos(caminho):
+    """Lista de arquivos a partir de um caminho, um glob ou uma lista de caminhos."""
+    if isinstance(caminho, (list, tuple)):
+        caminhos = list(caminho)
+    elif glob.has_magic(caminho):
+        caminhos = sorted(glob.glob(caminho))
+    else:
+        caminhos = [caminho]
+    if not caminhos:
+        raise FileNotFoundError(f"Nenhum arquivo encontrado para '{caminho}'.")
+    return caminhos
+
+def _tratar_texto_pandas(df, limpar, caixa):
+    """Strip/caixa vetorizados nas colunas de texto; em colunas com tipos misturados só os valores texto mudam."""
+    if not limpar and not caixa:
         return df
+    for col in df.columns:
+        serie = df[col]
+        if not (serie.dtype == 'object' or pd.api.types.is_string_dtype(serie)):
+            continue
+        mascara = None
+        if serie.dtype == 'object' and pd.api.types.infer_dtype(serie, skipna=True) not in ("string", "empty"):
+            mascara = serie.map(lambda x: isinstance(x, str)).to_numpy(dtype=bool)
+        # Métodos .str do pandas (mesma caixa do Python e do Polars: 'ß' vira 'SS'); nulos voltam com o valor original
+        base = serie if mascara is None else serie[mascara]
+        tratada = base.str.strip() if limpar else base
+        if caixa == "maiusculas":
+            tratada = tratada.str.upper()
+        elif caixa == "minusculas":
+            tratada = tratada.str.lower()
+        tratada = tratada.where(base.notna(), base)
+        df[col] = tratada if mascara is None else serie.where(~mascara, tratada)
+    return df
+
+def _tratar_texto_polars(df, limpar, caixa):
+    texto = pl.col(pl.String)
+    if limpar:
+        texto = texto.str.strip_chars()
+    if caixa == "maiusculas":
+        texto = texto.str.to_uppercase()
+    elif caixa == "minusculas":
+        texto = texto.str.to_lowercase()
+    return df.with_columns(texto) if limpar or caixa else df
+
+def _converter_retorno(df, retorno):
+    """Converte o resultado para o formato pedido: pandas, polars ou arrow (pandas com pyarrow)."""
+    match retorno:
+        case "pandas":
+            return df.to_pandas() if isinstance(df, pl.DataFrame) else df
+        case "polars":
+            return df if isinstance(df, pl.DataFrame) else pl.from_pandas(df)
+        case "arrow":
+            if isinstance(df, pl.DataFrame):
+                return df.to_pandas(use_pyarrow_extension_array=True)
+            return pa.Table.from_pandas(df, preserve_index=False).to_pandas(types_mapper=pd.ArrowDtype)
+        case _:
+            raise ValueError(f"Formato de retorno '{retorno}' não suportado.")
+
+@instrumentar()
+def carregar_excel(
+    caminho: str | list[str],
+    abas: list | None = None,
+    engine: str = "polars",
+    concatenar: bool = True,
+    coluna_origem: str = "Origem",
+    n_jobs: int = -1,
+    limpar = False,
+    uppercase = False,
+    lowercase = False,
+    retorno: str = "pandas",
+    **kwargs
+) -> tuple:
+    """
+
+    Carrega várias abas e/ou várias pastas de trabalho Excel (.xlsx, .xlsm, .xls, .xlsb) de uma vez,
+    lendo cada aba num pool de processos. Com engine polars a leitura usa o calamine (fastexcel),
+    bem mais rápido que openpyxl/pyxlsb.
+
+    :param caminho: Arquivo Excel, pasta com arquivos Excel, glob ou lista de arquivos
+    :type caminho: str | list[str]
+    :param abas: Nomes (ou índices) das abas a ler; None lê todas as abas de cada arquivo
+    :type abas: list | None
+    :param engine: "polars" (calamine) ou "pandas"
+    :type engine: str
+    :param concatenar: Se True retorna um único DataFrame com a coluna de origem ("arquivo | aba",
+    ou só a aba quando há um arquivo); se False retorna um dict {aba: df} ou {(arquivo, aba): df}
+    :type concatenar: bool
+    :param coluna_origem: Nome da coluna de origem no resultado concatenado
+    :type coluna_origem: str
+    :param n_jobs: Quantidade de processos (-1 usa todos os núcleos, 1 lê sem pool)
+    :type n_jobs: int
+    :param limpar: Mesmo tratamento do carregar_arquivo
+    :param uppercase: Mesmo tratamento do carregar_arquivo
+    :param lowercase: Mesmo tratamento do carregar_arquivo
+    :param retorno: Formato de saída: "pandas", "polars" ou "arrow"
+    :type retorno: str
+    :param kwargs: **kwargs de leitura da engine escolhida
+    :return: (resultado, tempos) - tempos traz arquivo, aba, linhas, colunas e segundos por aba
+    :rtype: tuple
 
-def ajustar_data(df: pd.DataFrame, coluna: str, reportar_erros: bool = True) -> pd.DataFrame:
+    """
+
+    if uppercase and lowercase:
+        raise ValueError("Use somente uppercase ou lowercase.")
+    caixa = "maiusculas" if uppercase else "minusculas" if lowercase else None
+    retorno = retorno.lower().strip()
+    engine = engine.lower().strip()
+    if engine not in ("pandas", "polars"):
+        raise ValueError(f"Engine '{engine}' não suportada.")
+
+    if isinstance(caminho, str) and os.path.isdir(caminho):
+        caminhos = sorted(arquivo for arquivo in glob.glob(os.path.join(caminho, "*"))
+                          if os.path.splitext(arquivo)[1].lower() in EXTENSOES_EXCEL)
+    else:
+        caminhos = _listar_arquivos(caminho)
+    if not caminhos:
+        raise FileNotFoundError(f"Nenhum arquivo Excel encontrado em '{caminho}'.")
+
+    inicio = time.perf_counter()
+    tarefas = [(arquivo, aba) for arquivo in caminhos for aba in (abas if abas is not None else _listar_abas(arquivo))]
+    n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+    INSTRUMENTACAO.exibir(f"Lendo {len(tarefas)} aba(s) de {len(caminhos)} arquivo(s) com {min(n_jobs, len(tarefas))} processo(s).")
+    if n_jobs == 1 or len(tarefas) == 1:
+        leituras = [_ler_aba(arquivo, aba, engine, kwargs) for arquivo, aba in tarefas]
+    else:
+        # spawn: fork de um processo com o pool de threads do polars ativo pode travar
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(tarefas)), mp_context=multiprocessing.get_context("spawn")) as pool:
+            futuros = [pool.submit(_ler_aba, arquivo, aba, engine, kwargs) for arquivo, aba in tarefas]
+            leituras = [futuro.result() for futuro in futuros]
+
+    tempos = pd.DataFrame({
+        "arquivo": [os.path.basename(arquivo) for arquivo, _ in tarefas],
+        "aba": [aba for _, aba in tarefas],
+        "linhas": [df.shape[0] for df, _ in leituras],
+        "colunas": [df.shape[1] for df, _ in leituras],
+        "segundos": [segundos for _, segundos in leituras],
+    })
+
+    def origem(arquivo, aba):
+        return str(aba) if len(caminhos) == 1 else f"{os.path.basename(arquivo)} | {aba}"
+
+    def tratar(df):
+        if engine == "polars":
+            return _converter_retorno(_tratar_texto_polars(df, limpar, caixa), retorno)
+        return _converter_retorno(_tratar_texto_pandas(df, limpar, caixa), retorno)
+
+    if concatenar:
+        if engine == "polars":
+            partes = [df.with_columns(pl.lit(origem(arquivo, aba)).alias(coluna_origem)) for (df, _), (arquivo, aba) in zip(leituras, tarefas)]
+            resultado = tratar(pl.concat(partes, how="diagonal_relaxed"))
+        else:
+            partes = [df.assign(**{coluna_origem: origem(arquivo, aba)}) for (df, _), (arquivo, aba) in zip(leituras, tarefas)]
+            resultado = tratar(pd.concat(partes, ignore_index=True))
+    else:
+        resultado = {(aba if len(caminhos) == 1 else (os.path.basename(arquivo), aba)): tratar(df)
+                     for (df, _), (arquivo, aba) in zip(leituras, tarefas)}
+
+    INSTRUMENTACAO.exibir(tempos.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    INSTRUMENTACAO.exibir(f"{len(tarefas)} aba(s) carregada(s) em {time.perf_counter() - inicio:.2f} segundos.")
+    return resultado, tempos
+
+def _listar_abas(arquivo):
+    try:
+        import fastexcel
+        return fastexcel.read_excel(arquivo).sheet_names
+    except ImportError:
+        motor = "pyxlsb" if arquivo.lower().endswith(".xlsb") else None
+        with pd.ExcelFile(arquivo, engine=motor) as planilha:
+            return planilha.sheet_names
+
+def _ler_aba(arquivo, aba, engine, kwargs):
+    """Lê uma aba (executado nos processos do carregar_excel); retorna (df, segundos)."""
+    inicio = time.perf_counter()
+    aba_param = {"sheet_id": aba + 1} if isinstance(aba, int) else {"sheet_name": aba}
+    if engine == "polars":
+        df = pl.read_excel(arquivo, **{"read_options": {"header_row": 0}, **aba_param, **kwargs})
+        df = df.rename({col: col.strip() for col in df.columns})
+    else:
+        padrao = {"engine": "pyxlsb" if arquivo.lower().endswith(".xlsb") else None, "decimal": ",", "thousands": "."}
+        df = pd.read_excel(arquivo, sheet_name=aba, **{**padrao, **kwargs})
+        df.columns = df.columns.str.strip()
+    return df, time.perf_counter() - inicio
+
+def ajustar_data(
+    df: pd.DataFrame,
+    coluna: str | list,
+    reportar_erros: bool = True,
+    unicos: bool = True,
+    formato: str | None = None,
+    engine: str = "pandas"
+) -> pd.DataFrame:
     """
 
     Ajusta a coluna de data do DataFrame para sair no padrão yyyy-mm-dd
     
     :param df: DataFrame a ser ajustado
     :type df: pd.DataFrame
-    :param coluna: Coluna de Data a ser ajustada
-    :type coluna: str
+    :param coluna: Coluna de Data a ser ajustada (ou lista de colunas)
+    :type coluna: str | list
     :param reportar_erros: Reporta valores que não se encaixam no filtro de data, ou seja valores
     que não é possivel tranformar em data
     :type reportar_erros: bool
+    :param unicos: Se True converte só os valores únicos da coluna e leva o resultado para as
+    linhas com um take (colunas de data costumam ter poucos valores distintos)
+    :type unicos: bool
+    :param formato: Formato da data (ex: "%d/%m/%Y"). Se None é inferido pelo primeiro valor e
+    guardado em cache para as próximas chamadas
+    :type formato: str | None
+    :param engine: "pandas" (to_datetime) ou "polars" (str.strptime multithread, precisa de um
+    formato informado ou inferido; formatos com %f ou %z são convertidos pelo pandas)
+    :type engine: str
     :return: DataFrame com colunas de Data ajustada
     :rtype: DataFrame
 
     """
     
-    if coluna not in df.columns:
-        raise KeyError(f"A coluna '{coluna}' não existe no DataFrame.")
+    colunas = [coluna] if isinstance(coluna, str) else list(coluna)
+    for col in colunas:
+        if col not in df.columns:
+            raise KeyError(f"A coluna '{col}' não existe no DataFrame.")
+    if engine not in ("pandas", "polars"):
+        raise ValueError(f"Engine '{engine}' não suportada.")
     
     df_ajustado = df
-    serie = df[coluna]
+    for col in colunas:
+        serie = df[col]
+        if unicos:
+            # Fatoração na ordem de aparição: o primeiro único é o primeiro valor da coluna
+            codigos, valores = pd.factorize(serie, use_na_sentinel=True)
+            valores = pd.Series(valores)
+        else:
+            codigos, valores = None, serie
 
-    # Se já for datetime, só formata
-    if pd.api.types.is_datetime64_any_dtype(serie):
-        df_ajustado[coluna] = serie.dt.strftime("%Y-%m-%d")
-        return df_ajustado
-    # Caso for string
-    df_ajustado[coluna] = df[coluna].astype(str).str.strip()
-    mask_ano_mes = df_ajustado[coluna].str.match(r"^\d{4}[-/]\d{2}$", na=False)
-    df_ajustado.loc[mask_ano_mes, coluna] = df.loc[mask_ano_mes, coluna] + "-01"
+        # Se já for datetime, só formata
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            formatada = valores.dt.strftime("%Y-%m-%d")
+            df_ajustado[col] = formatada if codigos is None else _tomar_valores(formatada, codigos).set_axis(df.index)
+            continue
+        convertida = _converter_valores(valores, formato, engine)
+        invalidos = convertida.isna() & valores.notna()
+        if codigos is not None:
+            convertida = _tomar_valores(convertida, codigos)
+            invalidos = _tomar_valores(invalidos, codigos, vazio=False)
+        df_ajustado[col] = convertida.set_axis(df.index)
 
-    convertida = pd.to_datetime(serie, errors="coerce", dayfirst=False)
-    invalidos = serie[convertida.isna() & serie.notna()]
+        if reportar_erros and invalidos.any():
+            invalidos = serie[invalidos.to_numpy()]
+            INSTRUMENTACAO.exibir(f"⚠️ Total de {len(invalidos)} valores inválidos encontrados na coluna '{col}':")
+            INSTRUMENTACAO.exibir(invalidos.to_list())
 
-    df_ajustado[coluna] = convertida
+    return df_ajustado
 
-    if reportar_erros and not invalidos.empty:
-        print(f"⚠️ Total de {len(invalidos)} valores inválidos encontrados na coluna '{coluna}':")
-        print(invalidos.to_list())
+def _converter_valores(valores, formato, engine):
+    """Converte os valores da coluna: o que já é data fica como está, só textos e números são convertidos."""
+    if valores.dtype != object:
+        return _converter_datas(_normalizar_datas(valores), formato, engine)
+    eh_data = np.fromiter((isinstance(v, (datetime.date, np.datetime64)) for v in valores), dtype=bool, count=len(valores))
+    if not eh_data.any():
+        return _converter_datas(_normalizar_datas(valores), formato, engine)
+    convertida = pd.Series(pd.NaT, index=valores.index, dtype="datetime64[ns]")
+    convertida[eh_data] = pd.to_datetime(valores[eh_data], errors="coerce")
+    if not eh_data.all():
+        convertida[~eh_data] = _converter_datas(_normalizar_datas(valores[~eh_data]), formato, engine)
+    return convertida
 
-    return df_ajustado
+def _normalizar_datas(valores):
+    # Caso for string; 'YYYY-MM' e 'YYYY/MM' viram 'YYYY-MM-01'
+    textos = valores.astype(str).str.strip()
+    return textos.str.replace(r"^(\d{4})[-/](\d{2})$", r"\1-\2-01", regex=True)
+
+def _converter_datas(textos, formato, engine):
+    if formato is None:
+        # Mesmo critério do to_datetime: o primeiro valor que não é nulo em texto
+        preenchidos = textos[~textos.isin(TEXTOS_NULOS_DATA)]
+        formato = _inferir_formato_data(preenchidos.iloc[0]) if len(preenchidos) else None
+    if formato is None:
+        # Sem formato inferido o pandas converte valor a valor (dateutil), como antes
+        return pd.to_datetime(textos, errors="coerce", dayfirst=False)
+    # %f e %z têm outro significado no strptime do Polars (nanossegundos, conversão para UTC): ficam no pandas
+    if engine == "polars" and "%f" not in formato and "%z" not in formato:
+        convertida = pl.Series(textos.to_numpy(), dtype=pl.String).str.strptime(pl.Datetime("ns"), formato, strict=False)
+        return convertida.to_pandas().set_axis(textos.index)
+    return pd.to_datetime(textos, errors="coerce", format=formato)
+
+@functools.lru_cache(maxsize=1024)
+def _inferir_formato_data(texto):
+    """Formato inferido pelo pandas (o mesmo que o to_datetime usaria), em cache por valor."""
+    return guess_datetime_format(texto, dayfirst=False)
+
+def _tomar_valores(valores, codigos, vazio=np.nan):
+    """Leva os resultados dos únicos para as linhas (código -1 = nulo recebe o valor vazio)."""
+    if (codigos < 0).any():
+        valores = pd.concat([valores, pd.Series([vazio], dtype=valores.dtype)], ignore_index=True)
+        codigos = np.where(codigos < 0, len(valores) - 1, codigos)
+    return valores.take(codigos).reset_index(drop=True)
 
 def ajustar_colunas(df: pd.DataFrame, ajustar_para: str = "maisculas"):
     """